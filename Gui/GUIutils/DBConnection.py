@@ -60,6 +60,18 @@ def QtStartConnection(TryUsername, TryPassword, TryHostAddress, TryDatabase):
 		return "Offline"
 	return connection
 
+def openConnection(TryUsername, TryPassword, TryHostAddress, TryDatabase):
+	# A further connection with the login of QtStartConnection, for use off the GUI thread
+	if not TryHostAddress:
+		TryHostAddress = '127.0.0.1'
+	if not TryDatabase:
+		TryDatabase = 'SampleDB'
+	try:
+		return mysql.connector.connect(user=str(TryUsername), password=str(TryPassword),host=str(TryHostAddress),database=str(TryDatabase))
+	except (ValueError,RuntimeError, TypeError, NameError,mysql.connector.Error) as err:
+		print("Unable to establish connection to host:{0}, {1}".format(TryHostAddress, err))
+		return None
+
 def checkDBConnection(dbconnection):
 	if dbconnection == "Offline":
 		statusString = "<---- offline Mode ---->"
@@ -0,0 +1,146 @@
+'''
+  FileStager.py
+  brief                 In-process staging of configuration and result files
+  version               0.1
+'''
+import os
+import shutil
+import time
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# ioctl request for copy-on-write clones (btrfs, xfs, ...), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+# Transfer modes: link (hardlink), copy (reflink) and move (rename), each falls back to a plain copy
+StageModes = ["link", "copy", "move"]
+
+def reflinkFile(source, target):
+	if fcntl is None:
+		return False
+	try:
+		with open(source,'rb') as src, open(target,'wb') as dst:
+			fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+		return True
+	except OSError:
+		try:
+			os.remove(target)
+		except OSError:
+			pass
+		return False
+
+def copyFile(source, target):
+	if not reflinkFile(source, target):
+		shutil.copyfile(source, target)
+		return "copy"
+	return "reflink"
+
+def linkFile(source, target):
+	if os.path.lexists(target):
+		os.remove(target)
+	try:
+		os.link(source, target)
+		return "hardlink"
+	except OSError:
+		# Cross-device or unsupported filesystem
+		return copyFile(source, target)
+
+def moveFile(source, target):
+	try:
+		os.replace(source, target)
+		return "rename"
+	except OSError:
+		method = copyFile(source, target)
+		os.remove(source)
+		return method
+
+class StageEntry():
+	def __init__(self, source, target, mode):
+		self.source = source
+		self.target = target
+		self.mode = mode
+		self.method = ""
+		self.error = ""
+		self.size = -1
+
+	def isStaged(self):
+		return self.error == ""
+
+class FileStager():
+	'''
+	Collects a manifest of file transfers and executes them in one batch.
+	Hard links are only used for files nobody writes to afterwards; files
+	that Ph2_ACF updates in place (live chip configs) must use 'copy'.
+	'''
+	def __init__(self, name = ""):
+		self.name = name
+		self.manifest = []
+		self.elapsed = 0.0
+
+	def add(self, source, target, mode = "copy"):
+		if mode not in StageModes:
+			raise ValueError("Unknown staging mode: {}".format(mode))
+		# A directory as target keeps the source file name
+		if os.path.isdir(target):
+			target = os.path.join(target, os.path.basename(source))
+		self.manifest.append(StageEntry(source, target, mode))
+
+	def addFiles(self, sources, targetDir, mode = "copy"):
+		for source in sources:
+			self.add(source, os.path.join(targetDir, os.path.basename(source)), mode)
+
+	def stage(self):
+		startTime = time.time()
+		for entry in self.manifest:
+			if entry.method != "":
+				continue
+			try:
+				if os.path.abspath(entry.source) == os.path.abspath(entry.target):
+					raise OSError("source and target are the same file")
+				entry.size = os.path.getsize(entry.source)
+				if entry.mode == "link":
+					entry.method = linkFile(entry.source, entry.target)
+				elif entry.mode == "move":
+					entry.method = moveFile(entry.source, entry.target)
+				else:
+					entry.method = copyFile(entry.source, entry.target)
+				self.verify(entry)
+			except (OSError, shutil.Error) as err:
+				entry.method = "failed"
+				entry.error = str(err)
+				logger.error("Failed to stage {0} to {1}: {2}".format(entry.source, entry.target, err))
+		self.elapsed = time.time() - startTime
+		logger.info(self.summary())
+		return self.isStaged()
+
+	def verify(self, entry):
+		if not os.path.isfile(entry.target):
+			raise OSError("{} missing after transfer".format(entry.target))
+		if os.path.getsize(entry.target) != entry.size:
+			raise OSError("{0} has {1} bytes, expected {2}".format(entry.target, os.path.getsize(entry.target), entry.size))
+
+	def isStaged(self):
+		return all([entry.isStaged() for entry in self.manifest])
+
+	def getFailed(self):
+		return [entry for entry in self.manifest if not entry.isStaged()]
+
+	def getTargets(self):
+		return [entry.target for entry in self.manifest if entry.isStaged()]
+
+	def getElapsed(self):
+		return self.elapsed
+
+	def summary(self):
+		methods = {}
+		for entry in self.manifest:
+			methods[entry.method] = methods.get(entry.method, 0) + 1
+		methodString = ", ".join(["{0} {1}".format(count, method) for method, count in methods.items()])
+		return "Staging {0}: {1} files in {2:.3f} s ({3})".format(self.name, len(self.manifest), self.elapsed, methodString)
@@ -0,0 +1,98 @@
+'''
+  FirmwareStateCache.py
+  brief                 Persistent record of the firmware stored and loaded on each FC7 board
+  version               0.1
+'''
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# A loaded image is trusted for this long after it was last verified, the
+# board may have been power cycled in the meantime
+FirmwareStateLifetime = timedelta(hours=12)
+
+TimeFormat = "%Y-%m-%dT%H:%M:%S"
+
+def imageChecksum(imagePath):
+	md5 = hashlib.md5()
+	try:
+		with open(imagePath,'rb') as imageFile:
+			for block in iter(lambda: imageFile.read(1 << 20), b''):
+				md5.update(block)
+	except OSError:
+		return ""
+	return md5.hexdigest()
+
+class FirmwareStateCache():
+	'''
+	One state file per FC7 board, kept in the board area next to RunNumber.txt:
+		{ "stored": { image: {"checksum": ..., "verified": ...} },
+		  "loaded": {"image": ..., "checksum": ..., "verified": ...} }
+	The in-memory copy is shared by every TestHandler of the session.
+	'''
+	States = {}
+
+	def __init__(self, firmwareName, boardDir):
+		self.firmwareName = firmwareName
+		self.stateFile = boardDir + "/FirmwareState.json"
+		if firmwareName not in FirmwareStateCache.States.keys():
+			FirmwareStateCache.States[firmwareName] = self.read()
+		self.state = FirmwareStateCache.States[firmwareName]
+
+	def read(self):
+		state = {"stored": {}, "loaded": {}}
+		try:
+			if os.path.isfile(self.stateFile):
+				with open(self.stateFile,'r') as stateFile:
+					state.update(json.load(stateFile))
+		except (OSError, ValueError) as err:
+			logger.warning("Ignoring unreadable firmware state {0}: {1}".format(self.stateFile, err))
+		return state
+
+	def write(self):
+		try:
+			tmpFile = self.stateFile + ".tmp"
+			with open(tmpFile,'w') as stateFile:
+				json.dump(self.state, stateFile, indent=2)
+			os.replace(tmpFile, self.stateFile)
+		except OSError as err:
+			logger.warning("Failed to save firmware state {0}: {1}".format(self.stateFile, err))
+
+	def isRecent(self, record):
+		try:
+			verified = datetime.strptime(record["verified"], TimeFormat)
+		except (KeyError, ValueError):
+			return False
+		return datetime.now() - verified < FirmwareStateLifetime
+
+	def isStored(self, image, checksum):
+		record = self.state["stored"].get(image, {})
+		return record.get("checksum") == checksum and self.isRecent(record)
+
+	def isLoaded(self, image, checksum):
+		record = self.state["loaded"]
+		return record.get("image") == image and record.get("checksum") == checksum and self.isRecent(record)
+
+	def setStored(self, image, checksum):
+		self.state["stored"][image] = {"checksum": checksum, "verified": datetime.now().strftime(TimeFormat)}
+		self.write()
+
+	def setLoaded(self, image, checksum):
+		self.state["loaded"] = {"image": image, "checksum": checksum, "verified": datetime.now().strftime(TimeFormat)}
+		self.write()
+
+	def invalidateLoaded(self):
+		if self.state["loaded"] != {}:
+			logger.info("Forgetting loaded firmware of {}".format(self.firmwareName))
+			self.state["loaded"] = {}
+			self.write()
+
+	def invalidate(self):
+		self.state["stored"] = {}
+		self.state["loaded"] = {}
+		self.write()
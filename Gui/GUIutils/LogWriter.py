@@ -0,0 +1,118 @@
+'''
+  LogWriter.py
+  brief                 Run log (output.txt) written from a background thread
+  version               0.1
+'''
+import os
+import gzip
+import queue
+import shutil
+import threading
+
+from Gui.GUIutils.settings import *
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# Size of the file buffer and of the batches handed to it
+LogBufferSize = 1 << 20
+
+def compressLog(fileName, compression):
+	'''
+	Replaces fileName by fileName.gz or fileName.zst, returns the name of the
+	file kept. zstd needs the zstandard module, gzip is used without it.
+	'''
+	if compression == "zstd" and zstandard is None:
+		logger.warning("zstandard is not installed, compressing {} with gzip".format(fileName))
+		compression = "gzip"
+	if compression == "gzip":
+		target = fileName + ".gz"
+		with open(fileName, 'rb') as source, gzip.open(target, 'wb', compresslevel=6) as compressed:
+			shutil.copyfileobj(source, compressed, LogBufferSize)
+	elif compression == "zstd":
+		target = fileName + ".zst"
+		with open(fileName, 'rb') as source, open(target, 'wb') as compressed:
+			zstandard.ZstdCompressor(level=3).copy_stream(source, compressed, read_size=LogBufferSize)
+	else:
+		return fileName
+	os.remove(fileName)
+	return target
+
+class LogWriter():
+	'''
+	Drop-in for the file object of output.txt. write() only queues the text,
+	a writer thread appends it in large buffered writes, so a slow DATA_dir
+	(NFS) never stalls the caller. close() returns at once, the thread writes
+	what is left and compresses the log if asked to.
+	'''
+	def __init__(self, fileName, compression = LogCompression):
+		self.fileName = fileName
+		self.compression = compression
+		self.queue = queue.Queue()
+		self.closed = False
+		self.error = None
+		self.thread = threading.Thread(target=self.run, name="LogWriter {}".format(os.path.basename(os.path.dirname(fileName))))
+		self.thread.start()
+
+	def write(self, text):
+		if self.closed or text == "":
+			return
+		self.queue.put(text)
+
+	def flush(self):
+		pass
+
+	def close(self, wait = False):
+		if not self.closed:
+			self.closed = True
+			self.queue.put(None)
+		if wait:
+			self.thread.join()
+
+	def run(self):
+		try:
+			logFile = open(self.fileName, 'a', buffering=LogBufferSize)
+		except OSError as err:
+			self.error = err
+			logger.error("Unable to open {0}: {1}".format(self.fileName, err))
+			self.drain()
+			return
+		with logFile:
+			finished = False
+			while not finished:
+				batch = [self.queue.get()]
+				size = 0
+				# Take whatever else is already queued, up to one buffer
+				while batch[-1] is not None and size < LogBufferSize:
+					try:
+						batch.append(self.queue.get_nowait())
+					except queue.Empty:
+						break
+					if batch[-1] is not None:
+						size += len(batch[-1])
+				if batch[-1] is None:
+					finished = True
+					batch.pop()
+				try:
+					logFile.write("".join(batch))
+					if self.queue.empty():
+						logFile.flush()
+				except OSError as err:
+					if self.error is None:
+						logger.error("Writing {0} failed: {1}".format(self.fileName, err))
+					self.error = err
+		if self.compression and self.error is None:
+			try:
+				self.fileName = compressLog(self.fileName, self.compression)
+			except OSError as err:
+				logger.error("Compressing {0} failed: {1}".format(self.fileName, err))
+
+	def drain(self):
+		while self.queue.get() is not None:
+			pass
@@ -17,6 +17,9 @@ import re
 import operator
 import math
 import hashlib
+import shutil
+import glob
+import tempfile
 from queue import Queue, Empty
 from threading import Thread
 #from tkinter import ttk
@@ -30,6 +33,8 @@ from functools import partial
 
 from  Gui.GUIutils.settings import *
 from  Gui.GUIutils.DBConnection import *
+from  Gui.GUIutils.FileStager import FileStager
+from  Gui.GUIutils.FirmwareStateCache import FirmwareStateCache, imageChecksum
 from  Configuration.XMLUtil import *
 
 import logging
@@ -108,24 +113,61 @@ def isActive(dbconnection):
 		print("Unexpected form, {}".format(repr(err)))
 		return False
 
+def GetBoardWorkingDir(firmwareName):
+	# Every FC7 board keeps its own area in Ph2_ACF, holding the RunNumber.txt
+	# that is carried from one run sandbox to the next
+	workingDir = "{0}/test/{1}".format(os.environ.get("Ph2_ACF_AREA"),firmwareName)
+	if not os.path.isdir(workingDir):
+		try:
+			os.makedirs(workingDir)
+		except OSError:
+			print("Can not create directory: {0}".format(workingDir))
+	return workingDir
+
+##########################################################################
+##  Functions for the per-run Ph2_ACF sandbox
+##########################################################################
+
+# The output directory of every run is also the working directory of
+# CMSITminiDAQ: it holds CMSIT.xml, the live chip configs and Results/.
+
+def SetupRunSandbox(Output_Dir, Board_Dir, Stager = None):
+	# Seed the run number, so that runs keep counting up across sandboxes
+	stager = Stager if Stager is not None else FileStager("run sandbox")
+	if os.path.isfile(Board_Dir+"/RunNumber.txt"):
+		stager.add(Board_Dir+"/RunNumber.txt", Output_Dir+"/RunNumber.txt", "copy")
+	if Stager is None:
+		stager.stage()
+
+def ReleaseRunSandbox(Output_Dir, Board_Dir, Stager = None):
+	# Move ROOT files produced in Results/ next to the configs, where grading and DB upload look for them.
+	# Returns their targets, with a Stager those still to be staged by the caller
+	stager = Stager if Stager is not None else FileStager("run results")
+	stager.addFiles(sorted(glob.glob(Output_Dir+"/Results/Run*.root")), Output_Dir, "move")
+	if os.path.isfile(Output_Dir+"/RunNumber.txt"):
+		stager.add(Output_Dir+"/RunNumber.txt", Board_Dir+"/RunNumber.txt", "copy")
+	if Stager is None:
+		stager.stage()
+	return [target for target in stager.getTargets() if target.endswith(".root")]
+
 ##########################################################################
 ##  Functions for setting up XML and RD53 configuration
 ##########################################################################
 
-def SetupXMLConfig(Input_Dir, Output_Dir):
-	try:
-		os.system("cp {0}/CMSIT.xml {1}/CMSIT.xml".format(Input_Dir,Output_Dir))
-	except OSError:
-		print("Can not copy the XML files to {0}".format(Output_Dir))
-	try:
-		os.system("cp {0}/CMSIT.xml  {1}/test/CMSIT.xml".format(Output_Dir,os.environ.get("Ph2_ACF_AREA")))
-	except OSError:
-		print("Can not copy {0}/CMSIT.xml to {1}/test/CMSIT.xml".format(Output_Dir,os.environ.get("Ph2_ACF_AREA")))
+# All Setup* functions accept an optional FileStager. When given, the copies
+# are only added to its manifest and the caller stages the batch; otherwise
+# the files are staged right away.
+
+def SetupXMLConfig(Input_Dir, Output_Dir, Stager = None):
+	stager = Stager if Stager is not None else FileStager("XML config")
+	stager.add("{0}/CMSIT.xml".format(Input_Dir), "{0}/CMSIT.xml".format(Output_Dir), "copy")
+	if Stager is None:
+		stager.stage()
 
 ##########################################################################
 ##########################################################################
 
-def SetupXMLConfigfromFile(InputFile, Output_Dir, firmwareName, RD53Dict):
+def SetupXMLConfigfromFile(InputFile, Output_Dir, firmwareName, RD53Dict, updatedValues = updatedXMLValues, Stager = None):
 	changeMade = False
 	try:
 		root,tree = LoadXML(InputFile)
@@ -165,10 +207,10 @@ def SetupXMLConfigfromFile(InputFile, Output_Dir, firmwareName, RD53Dict):
 		print("Failed to set up the XML file, {}".format(error))
 
 	try:
-		print('lenth of XML dict is {0}'.format(len(updatedXMLValues)))
-		if len(updatedXMLValues) > 0:
+		print('lenth of XML dict is {0}'.format(len(updatedValues)))
+		if len(updatedValues) > 0:
 			changeMade = True
-			print(updatedXMLValues)
+			print(updatedValues)
 
 			for Node in root.findall(".//Settings"):
 				print("Found Settings Node!")
@@ -178,60 +220,59 @@ def SetupXMLConfigfromFile(InputFile, Output_Dir, firmwareName, RD53Dict):
 					## Potential Change: please check if it is [HyBrid ID/RD53 ID] or [HyBrid ID/RD53 Lane]
 					chipKeyName ="{0}/{1}".format(HyBridNode.attrib["Id"],RD53Node.attrib["Id"])
 					print('chipKeyName is {0}'.format(chipKeyName))
-					if len(updatedXMLValues[chipKeyName]) > 0:
-						for key in updatedXMLValues[chipKeyName].keys():
-							Node.set(key,str(updatedXMLValues[chipKeyName][key]))
-							print('Node {0} has been set to {1}'.format(key,updatedXMLValues[chipKeyName][key]))
+					if len(updatedValues[chipKeyName]) > 0:
+						for key in updatedValues[chipKeyName].keys():
+							Node.set(key,str(updatedValues[chipKeyName][key]))
+							print('Node {0} has been set to {1}'.format(key,updatedValues[chipKeyName][key]))
 				
 	except Exception as error:
 		print("Failed to set up the XML file, {}".format(error))
 
 
+	stager = Stager if Stager is not None else FileStager("XML config")
 	try:
 		if changeMade:
-			ModifiedFile = InputFile+".changed"
-			tree.write(ModifiedFile)
-			InputFile = ModifiedFile
+			# Modified configuration is written next to the board's generated XML and staged like the unmodified one
+			tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp/" + firmwareName
+			os.makedirs(tmpDir, exist_ok=True)
+			tmpFile = tempfile.NamedTemporaryFile(dir=tmpDir, prefix="CMSIT_", suffix=".xml", delete=False)
+			tmpFile.close()
+			tree.write(tmpFile.name)
+			stager.add(tmpFile.name, "{0}/CMSIT.xml".format(Output_Dir), "move")
+			if Stager is None:
+				stager.stage()
+			return
 
 	except Exception as error:
 		print("Failed to set up the XML file, {}".format(error))
 
-	try:
-		os.system("cp {0} {1}/CMSIT.xml".format(InputFile,Output_Dir))
-	except OSError:
-		print("Can not copy the XML files {0} to {1}".format(InputFile,Output_Dir))
-	try:
-		os.system("cp {0}/CMSIT.xml  {1}/test/CMSIT.xml".format(Output_Dir,os.environ.get("Ph2_ACF_AREA")))
-	except OSError:
-		print("Can not copy {0}/CMSIT.xml to {1}/test/CMSIT.xml".format(Output_Dir,os.environ.get("Ph2_ACF_AREA")))
+	stager.add(InputFile, "{0}/CMSIT.xml".format(Output_Dir), "copy")
+	if Stager is None:
+		stager.stage()
 
 ##########################################################################
 ##########################################################################
 
-def SetupRD53Config(Input_Dir, Output_Dir, RD53Dict):
+def SetupRD53Config(Input_Dir, Output_Dir, RD53Dict, Stager = None):
+	stager = Stager if Stager is not None else FileStager("RD53 config")
 	for key in RD53Dict.keys():
-		try:
-			os.system("cp {0}/CMSIT_RD53_{1}_OUT.txt {2}/CMSIT_RD53_{1}_IN.txt".format(Input_Dir,key,Output_Dir))
-		except OSError:
-			print("Can not copy the RD53 configuration files to {0} for RD53 ID: {1}".format(Output_Dir, key))
-		try:
-			os.system("cp {0}/CMSIT_RD53_{1}_IN.txt  {2}/test/CMSIT_RD53_{1}.txt".format(Output_Dir,key,os.environ.get("Ph2_ACF_AREA")))
-		except OSError:
-			print("Can not copy {0}/CMSIT_RD53_{1}_IN.txt to {2}/test/CMSIT_RD53_{1}.txt".format(Output_Dir,key,os.environ.get("Ph2_ACF_AREA")))
+		# The _OUT/_IN pair is never written again, so it can share one inode
+		stager.add("{0}/CMSIT_RD53_{1}_OUT.txt".format(Input_Dir,key), "{0}/CMSIT_RD53_{1}_IN.txt".format(Output_Dir,key), "link")
+		# Live copy read and overwritten by Ph2_ACF inside the sandbox, must be a real copy
+		stager.add("{0}/CMSIT_RD53_{1}_OUT.txt".format(Input_Dir,key), "{0}/CMSIT_RD53_{1}.txt".format(Output_Dir,key), "copy")
+	if Stager is None:
+		stager.stage()
 
 ##########################################################################
 ##########################################################################
 
-def SetupRD53ConfigfromFile(InputFileDict, Output_Dir):
+def SetupRD53ConfigfromFile(InputFileDict, Output_Dir, Stager = None):
+	stager = Stager if Stager is not None else FileStager("RD53 config")
 	for key in InputFileDict.keys():
-		try:
-			os.system("cp {0} {1}/CMSIT_RD53_{2}_IN.txt".format(InputFileDict[key],Output_Dir,key))
-		except OSError:
-			print("Can not copy the XML files {0} to {1}".format(InputFileDict[key],Output_Dir))
-		try:
-			os.system("cp {0}/CMSIT_RD53_{1}_IN.txt  {2}/test/CMSIT_RD53_{1}.txt".format(Output_Dir,key,os.environ.get("Ph2_ACF_AREA")))
-		except OSError:
-			print("Can not copy {0}/CMSIT_RD53_{1}_IN.txt to {2}/test/CMSIT_RD53.txt".format(Output_Dir,key,os.environ.get("Ph2_ACF_AREA")))
+		stager.add(InputFileDict[key], "{0}/CMSIT_RD53_{1}_IN.txt".format(Output_Dir,key), "copy")
+		stager.add(InputFileDict[key], "{0}/CMSIT_RD53_{1}.txt".format(Output_Dir,key), "copy")
+	if Stager is None:
+		stager.stage()
 
 
 def GenerateXMLConfig(firmwareList, testName, outputDir, **arg):
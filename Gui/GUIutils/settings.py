@@ -173,6 +173,9 @@ Test = {
 	'Physics'                :  'physics',
 }
 
+# CMSITminiDAQ calibrations the GUI and the batch runner can take data with
+RunnableTests = ["pixelalive","noise","latency","injdelay","clockdelay","threqu","thrmin","scurve","gainopt","thradj","physics","gain"]
+
 TestName2File = {
 	'Latency'                :  'Latency',
 	'PixelAlive'             :  'PixelAlive',
@@ -196,7 +199,7 @@ SingleTest = ['Latency','PixelAlive','NoiseScan','SCurveScan','GainScan',
 	'ThresholdEqualization','GainOptimization','ThresholdMinimization',
 	'ThresholdAdjustment','InjectionDelay','ClockDelay','BitErrorRate','DataRBOptimization','ChipIntVoltageTuning','GenericDAC-DAC','Physics']
 
-CompositeTest = ['AllScan','QuickTest','StandardStep1','StandardStep2','StandardStep3','StandardStep4']
+CompositeTest = ['AllScan','QuickTest','StandardStep1','StandardStep2','StandardStep3','StandardStep4','StandardStep5']
 CompositeList = {
 	'AllScan': ['NoiseScan','PixelAlive','ThresholdAdjustment',
 				'ThresholdEqualization','SCurveScan', 'NoiseScan','ThresholdAdjustment',
@@ -209,6 +212,33 @@ CompositeList = {
 	'StandardStep5': ['SCurveScan'],
 	'QuickTest': ['IVCurve','NoiseScan','PixelAlive']
 }
+
+# Grade and upload each step of a composite test while the next step is running
+PipelinedPostProcessing = True
+# Grade the modules of a ROOT file in separate processes, 0 workers means one per core
+ParallelGrading = True
+GradingWorkers = 0
+# Processes rendering result plots, and the longest wait (s) for a plot to be shown
+RenderWorkers = 2
+RenderWaitTimeout = 30
+# Size (MB) of the rendered plot cache in Gui/.tmp/plots, least recently used plots go first
+PlotCacheSize = 512
+# 2D maps are shown as PNG of at most RasterSize pixels rather than SVG, with
+# RasterZoomLevels more of twice the size each for zooming in on the result tree
+RasterPlots = ["PixelAlive","Threshold2D","Noise2D","ToT2D"]
+RasterSize = (1200, 900)
+RasterZoomLevels = 0
+
+# Run console: batched updates per second and number of lines kept
+ConsoleFrameRate = 20
+ConsoleMaxBlocks = 5000
+# Show the data taking output, the progress block is redrawn in place
+ConsoleShowDataTaking = False
+# Updates per second of the progress bars and run time labels
+WidgetRefreshRate = 4
+# Compression of output.txt once a step has finished: None, "gzip" or "zstd"
+LogCompression = None
+
 firstTimeList = ['AllScan', 'StandardStep1', 'PixelAlive']
 
 # Reserved for updated value for XML configuration
@@ -15,6 +15,7 @@ import time
 from Gui.GUIutils.DBConnection import *
 from Gui.GUIutils.settings import *
 from Gui.GUIutils.FirmwareUtil import *
+from Gui.GUIutils.FirmwareStateCache import FirmwareStateCache
 from Gui.GUIutils.GPIBInterface import PowerSupply
 from Gui.QtGUIutils.PeltierCoolingApp import *
 from Gui.QtGUIutils.QtFwCheckWindow  import *
@@ -29,6 +30,7 @@ from Gui.python.Firmware import *
 from Gui.python.ArduinoWidget import *
 from Gui.QtGUIutils.QtRunWindow import *
 from Gui.python.SimplifiedMainWidget import *
+from Gui.python.TestScheduler import *
 
 class QtApplication(QWidget):
 	globalStop = pyqtSignal()
@@ -38,9 +40,8 @@ class QtApplication(QWidget):
 		self.setLayout(self.mainLayout)
 		self.ProcessingTest = False
 		self.expertMode = False
-		self.FwUnderUsed = ''
-
-		# self.FwUnderUsed = []
+		# Boards selected for testing, each one gets its own test session
+		self.FwUnderUsed = []
 
 		self.FwDict = {}
 		self.FwStatusVerboseDict = {}
@@ -51,6 +52,9 @@ class QtApplication(QWidget):
 		self.HVpowersupply = PowerSupply(powertype = "HV",serverIndex = 1)
 		self.LVpowersupply = PowerSupply(powertype = "LV",serverIndex = 2)
 		self.PowerRemoteControl = {"HV":True, "LV": True}
+		self.TestScheduler = TestScheduler(self)
+		# Connected once, the main page and its button are rebuilt many times
+		self.TestScheduler.sessionsChanged.connect(self.updateRunAllButton)
 
 		self.setLoginUI()
 		self.initLog()
@@ -537,15 +541,10 @@ class QtApplication(QWidget):
 				LogButton.clicked.connect(lambda state, x="{0}".format(index-1) : self.showLogFw(x))
 				StatusLayout.addWidget(LogButton, index, 6, 1, 1)
 
-		if self.FwUnderUsed != '':
-			index = self.getIndex(self.FwUnderUsed,self.StatusList)
+		for fw in list(self.FwUnderUsed):
+			index = self.getIndex(fw,self.StatusList)
 			self.occupyFw("{0}".format(index))
 
-		#if self.FwUnderUsed != []:
-		#	for fw in self.FwUnderUsed:
-		#		index = self.getIndex(fw,self.StatusList)
-		#		self.occupyFw("{0}".format(index))
-
 		self.FirmwareStatus.setLayout(StatusLayout)
 		self.FirmwareStatus.setDisabled(False)
 
@@ -659,15 +658,21 @@ class QtApplication(QWidget):
 		self.NewTestButton.setMaximumHeight(kMaximumHeight)
 		self.NewTestButton.clicked.connect(self.openNewTest)
 		self.NewTestButton.setDisabled(True)
-		if self.FwUnderUsed != '':
+		if self.FwUnderUsed != []:
 			self.NewTestButton.setDisabled(False)
-		# Vectorized fw
-		#if self.FwUnderUsed != '':
-		#	self.NewTestButton.setDisabled(False)
 		if self.ProcessingTest == True:
 			self.NewTestButton.setDisabled(True)
 		NewTestLabel = QLabel("Open new test")
 
+		self.RunAllButton = QPushButton("&Run all boards")
+		self.RunAllButton.setMinimumWidth(kMinimumWidth)
+		self.RunAllButton.setMaximumWidth(kMaximumWidth)
+		self.RunAllButton.setMinimumHeight(kMinimumHeight)
+		self.RunAllButton.setMaximumHeight(kMaximumHeight)
+		self.RunAllButton.clicked.connect(self.TestScheduler.runAll)
+		self.RunAllButton.setDisabled(not self.TestScheduler.hasSessions())
+		RunAllLabel = QLabel("Start tests on every opened board")
+
 		self.NewProductionTestButton = QPushButton("&Production Test")
 		self.NewProductionTestButton.setMinimumWidth(kMinimumWidth)
 		self.NewProductionTestButton.setMaximumWidth(kMaximumWidth)
@@ -711,6 +716,8 @@ class QtApplication(QWidget):
 		layout.addWidget(ReviewLabel,  3, 1, 1, 2)
 		layout.addWidget(self.ReviewModuleButton,4, 0, 1, 1)
 		layout.addWidget(self.ReviewModuleEdit,  4, 1, 1, 2)
+		layout.addWidget(self.RunAllButton,6, 0, 1, 1)
+		layout.addWidget(RunAllLabel,  6, 1, 1, 2)
 
 		####################################################
 		# Functions for expert mode
@@ -869,12 +876,13 @@ class QtApplication(QWidget):
 		self.ExitButton.setDisabled(True)
 
 	def openNewTest(self):
-		FwModule = self.FwDict[self.FwUnderUsed]
-		# Vectorized the firmware
-		#FwModule = []
-		#for fw in self.FwUnderUsed:
-		#	FwModule.append(self.FwDict[fw])
-		self.StartNewTest = QtStartWindow(self,FwModule)
+		# One start window per selected board, boards with a running session are skipped
+		self.StartNewTest = {}
+		for fw in self.FwUnderUsed:
+			if self.TestScheduler.isBusy(fw):
+				continue
+			FwModule = self.FwDict[fw]
+			self.StartNewTest[fw] = QtStartWindow(self,FwModule)
 		self.NewTestButton.setDisabled(True)
 		self.LogoutButton.setDisabled(True)
 		self.ExitButton.setDisabled(True)
@@ -981,39 +989,30 @@ class QtApplication(QWidget):
 	def checkFirmware(self):
 		for index, (firmwareName, fwAddress) in enumerate(FirmwareList.items()):
 			fileName = self.LogList[index]
-			if firmwareName != self.FwUnderUsed:
-			#if firmwareName not in self.FwUnderUsed:
+			if firmwareName not in self.FwUnderUsed:
 				FwStatusComment, FwStatusColor, FwStatusVerbose = self.getFwComment(firmwareName,fileName)
+				if FwStatusVerbose["Ping test"] != "Success":
+					# Unreachable boards may have been power cycled, their firmware has to be reloaded
+					FirmwareStateCache(firmwareName, GetBoardWorkingDir(firmwareName)).invalidateLoaded()
 				self.StatusList[index+1][1].setText(FwStatusComment)
 				self.StatusList[index+1][1].setStyleSheet(FwStatusColor)
 				self.FwStatusVerboseDict[str(firmwareName)] = FwStatusVerbose
 			#This if was added for a test.  
 			if self.expertMode:
 				self.UseButtons[index].setDisabled(False)
-		if self.FwUnderUsed != '':
-			index = self.getIndex(self.FwUnderUsed,self.StatusList)
+		for fw in list(self.FwUnderUsed):
+			index = self.getIndex(fw,self.StatusList)
 			self.StatusList[index+1][1].setText("Connected")
 			self.StatusList[index+1][1].setStyleSheet("color: green")
 			self.occupyFw("{0}".format(index))
-		#if self.FwUnderUsed != []:
-		#	for fw in self.FwUnderUsed:
-		#		index = self.getIndex(fw,self.StatusList)
-		#		self.StatusList[index+1][1].setText("Connected")
-		#		self.StatusList[index+1][1].setStyleSheet("color: green")
-		#		self.occupyFw("{0}".format(index))
 	
 	def refreshFirmware(self):
 		for index, (firmwareName, fwAddress) in enumerate(FirmwareList.items()):
 			self.UseButtons[index].setDisabled(False)
-		if self.FwUnderUsed != '':
-			index = self.getIndex(self.FwUnderUsed,self.StatusList)
+		for fw in list(self.FwUnderUsed):
+			index = self.getIndex(fw,self.StatusList)
 			self.occupyFw("{0}".format(index))
 
-		#if self.FwUnderUsed != []:
-		#	for fw in self.FwUnderUsed:
-		#		index = self.getIndex(self.fw,self.StatusList)
-		#		self.occupyFw("{0}".format(index))
-
 
 	def getFwComment(self,firmwareName,fileName):
 		comment,color, verboseInfo = fwStatusParser(self.FwDict[firmwareName],fileName)
@@ -1041,25 +1040,33 @@ class QtApplication(QWidget):
 				button.setText("&In use")
 				button.setDisabled(False)
 				self.CheckButton.setDisabled(True)
-				self.FwUnderUsed = self.StatusList[i+1][0].text()
-				#self.FwUnderUsed.append(self.StatusList[i+1][0].text())
-			else:
-				button.setDisabled(True)
+				fwName = self.StatusList[i+1][0].text()
+				if fwName not in self.FwUnderUsed:
+					self.FwUnderUsed.append(fwName)
 
 	def releaseFw(self, index):
 		for i ,button in enumerate(self.UseButtons):
 			if i == int(index):
-				self.FwUnderUsed = ''
-				# vectorzied fw
-				#fwIndex = self.FwUnderUsed.index(self.StatusList[i+1][0].text())
-				#self.FwUnderUsed.pop(fwIndex)
+				fwName = self.StatusList[i+1][0].text()
+				if self.TestScheduler.isBusy(fwName):
+					QMessageBox.information(None, "Error", "{} has a test session open".format(fwName), QMessageBox.Ok)
+					button.setChecked(True)
+					return
+				if fwName in self.FwUnderUsed:
+					self.FwUnderUsed.remove(fwName)
 				button.setText("&Use")
 				button.setDown(False)
 				button.setDisabled(False)
-				self.CheckButton.setDisabled(False)
-				self.NewTestButton.setDisabled(True)
-			else:
-				button.setDisabled(False)
+		if self.FwUnderUsed == []:
+			self.CheckButton.setDisabled(False)
+			self.NewTestButton.setDisabled(True)
+
+	def updateRunAllButton(self, sessions):
+		try:
+			self.RunAllButton.setDisabled(len(sessions) == 0)
+		except (AttributeError, RuntimeError):
+			# Main page not created yet or destroyed in the meantime
+			pass
 
 	def showCommentFw(self, index):
 		fwName  = self.StatusList[int(index)+1][0].text()
@@ -1138,7 +1145,8 @@ class QtApplication(QWidget):
 			except AttributeError:
 				pass
 
-			os.system("rm -r {}/Gui/.tmp/*".format(os.environ.get("GUI_dir")))
+			# Rendered plots are kept for the next session, up to PlotCacheSize
+			os.system("find {}/Gui/.tmp -mindepth 1 -maxdepth 1 ! -name plots -exec rm -r {{}} +".format(os.environ.get("GUI_dir")))
 			event.accept()
 		else:
 			event.ignore()
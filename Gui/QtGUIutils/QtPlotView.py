@@ -0,0 +1,73 @@
+'''
+  QtPlotView.py
+  brief                 Shows a result plot, SVG drawn as vectors, PNG scaled to the widget
+  version               0.1
+'''
+import os
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QImageReader, QPixmap
+from PyQt5.QtWidgets import (QLabel, QSizePolicy, QStackedWidget)
+from PyQt5 import QtSvg
+
+from Gui.python.PlotCache import plotCache
+
+class QtPlotView(QStackedWidget):
+	'''
+	Takes the place of a QSvgWidget, load() accepts either format. load()
+	can also be given the PNGs of a zoom pyramid, smallest first: the
+	smallest one at least as large as the widget is shown.
+	'''
+	def __init__(self):
+		super(QtPlotView,self).__init__()
+		self.SVGView = QtSvg.QSvgWidget()
+		self.ImageView = QLabel()
+		self.ImageView.setAlignment(Qt.AlignCenter)
+		self.ImageView.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+		self.addWidget(self.SVGView)
+		self.addWidget(self.ImageView)
+		self.levels = []
+		self.level = None
+		self.pixmap = None
+		# PNG levels are read again on resize, kept in the cache while shown
+		self.plotFiles = []
+		plotCache.pin(self.shownPlots)
+
+	def shownPlots(self):
+		return self.plotFiles
+
+	def load(self, plotFile):
+		levels = plotFile if isinstance(plotFile, list) else [plotFile]
+		self.plotFiles = list(levels)
+		if os.path.splitext(levels[0])[1] == ".svg":
+			self.levels = []
+			self.SVGView.load(levels[0])
+			self.setCurrentWidget(self.SVGView)
+			return
+		self.levels = levels
+		self.level = None
+		self.setCurrentWidget(self.ImageView)
+		self.showImage()
+
+	def showImage(self):
+		if self.levels == []:
+			return
+		width = self.ImageView.width() * self.devicePixelRatioF()
+		level = len(self.levels) - 1
+		for index, fileName in enumerate(self.levels[:-1]):
+			# Only the header is read
+			if QImageReader(fileName).size().width() >= width:
+				level = index
+				break
+		if level != self.level:
+			self.level = level
+			self.pixmap = QPixmap(self.levels[level])
+		if self.pixmap.isNull():
+			self.ImageView.clear()
+			return
+		self.ImageView.setPixmap(self.pixmap.scaled(self.ImageView.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+	def resizeEvent(self, event):
+		super(QtPlotView,self).resizeEvent(event)
+		self.showImage()
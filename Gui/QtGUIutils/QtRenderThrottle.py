@@ -0,0 +1,123 @@
+'''
+  QtRenderThrottle.py
+  brief                 Rate-limited updates of the run console and progress widgets
+  version               0.1
+'''
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+from PyQt5.QtGui import QTextCursor, QTextBlockFormat, QTextCharFormat
+
+from Gui.GUIutils.settings import *
+from Gui.python.ANSIColoringParser import ANSITerminal
+
+class QtRateLimiter(QObject):
+	'''
+	Calls flush() right away if the last call is older than one period,
+	otherwise once the period is over. Whatever arrives in between is
+	handled by that single call.
+	'''
+	def __init__(self, rate):
+		super(QtRateLimiter,self).__init__()
+		self.period = 1.0/rate
+		self.lastFlush = 0.0
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.on_timeout)
+
+	def schedule(self):
+		if self.timer.isActive():
+			return
+		wait = self.lastFlush + self.period - time.time()
+		if wait <= 0:
+			self.on_timeout()
+		else:
+			self.timer.start(int(wait*1000)+1)
+
+	def on_timeout(self):
+		self.lastFlush = time.time()
+		self.flush()
+
+	def flush(self):
+		pass
+
+class QtConsoleBatcher(QtRateLimiter):
+	'''
+	Collects console output and updates a QPlainTextEdit at most
+	ConsoleFrameRate times per second, in one edit block. Output goes through
+	an ANSITerminal, rows rewritten by cursor movements since the last update
+	are replaced at the end of the document instead of appended again. The
+	document keeps the last ConsoleMaxBlocks lines, output.txt keeps everything.
+	'''
+	def __init__(self, view, rate = ConsoleFrameRate, maxBlocks = ConsoleMaxBlocks):
+		super(QtConsoleBatcher,self).__init__(rate)
+		self.view = view
+		self.maxBlocks = maxBlocks
+		self.view.setMaximumBlockCount(maxBlocks)
+		self.terminal = ANSITerminal(maxBlocks)
+		# Terminal rows in the document so far
+		self.shownRows = 0
+
+	def write(self, textStr):
+		# A raw output line, ANSI sequences included
+		self.terminal.write(textStr)
+		self.schedule()
+
+	def append(self, html):
+		self.terminal.appendHtml(html)
+		self.schedule()
+
+	def flush(self):
+		changed, skipped, lines = self.terminal.takeChanges()
+		if changed is None:
+			return
+		if skipped > 0:
+			lines = ['<i>... {} lines not shown, see output.txt</i>'.format(skipped)] + lines
+		document = self.view.document()
+		scrollBar = self.view.verticalScrollBar()
+		following = scrollBar.value() >= scrollBar.maximum() - 1
+
+		cursor = QTextCursor(document)
+		cursor.beginEditBlock()
+		replaced = min(self.shownRows - changed, document.blockCount())
+		if replaced > 0:
+			# Rows redrawn in place: drop them and write them again from their first block
+			cursor.setPosition(document.findBlockByNumber(document.blockCount() - replaced).position())
+			cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+			cursor.removeSelectedText()
+			cursor.setBlockFormat(QTextBlockFormat())
+			cursor.setCharFormat(QTextCharFormat())
+			newBlock = False
+		else:
+			cursor.movePosition(QTextCursor.End)
+			newBlock = not document.isEmpty()
+		for html in lines:
+			if newBlock:
+				# Fresh formats, so that colours never leak into the next line
+				cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+			cursor.insertHtml(html)
+			newBlock = True
+		cursor.endEditBlock()
+		self.shownRows = self.terminal.getRowCount()
+		if following:
+			scrollBar.setValue(scrollBar.maximum())
+
+class QtWidgetThrottle(QtRateLimiter):
+	'''
+	Keeps the latest value per widget and setter, e.g. (ProgressBar, "setValue"),
+	and applies them at most WidgetRefreshRate times per second
+	'''
+	def __init__(self, rate = WidgetRefreshRate):
+		super(QtWidgetThrottle,self).__init__(rate)
+		self.pending = {}
+
+	def set(self, widget, setter, value):
+		self.pending[(widget, setter)] = value
+		self.schedule()
+
+	def flush(self):
+		self.timer.stop()
+		pending, self.pending = self.pending, {}
+		for (widget, setter), value in pending.items():
+			getattr(widget, setter)(value)
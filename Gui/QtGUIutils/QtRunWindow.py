@@ -28,6 +28,7 @@ from Gui.python.ResultTreeWidget import *
 from Gui.python.TestValidator import *
 from Gui.python.ANSIColoringParser import *
 from Gui.python.TestHandler import *
+from Gui.QtGUIutils.QtRenderThrottle import *
 
 class QtRunWindow(QWidget):
 	resized = pyqtSignal()
@@ -209,6 +210,8 @@ class QtRunWindow(QWidget):
 		self.ConsoleView.setStyleSheet("QTextEdit { background-color: rgb(10, 10, 10); color : white; }")
 		#self.ConsoleView.setCenterOnScroll(True)
 		self.ConsoleView.ensureCursorVisible()
+		# Lines are added in batches, the view keeps the last ConsoleMaxBlocks of them
+		self.consoleBatcher = QtConsoleBatcher(self.ConsoleView)
 		
 		ConsoleLayout.addWidget(self.ConsoleView)
 		TerminalBox.setLayout(ConsoleLayout)
@@ -316,11 +319,12 @@ class QtRunWindow(QWidget):
 
 	def release(self):
 		self.abortTest()
-		self.master.ProcessingTest = False
+		self.master.TestScheduler.removeSession(self.firmwareName)
 		if self.master.expertMode == True:
 			self.master.NewTestButton.setDisabled(False)
-			self.master.LogoutButton.setDisabled(False)
-			self.master.ExitButton.setDisabled(False)
+			if not self.master.TestScheduler.hasSessions():
+				self.master.LogoutButton.setDisabled(False)
+				self.master.ExitButton.setDisabled(False)
 		else:
 			self.master.SimpleMain.RunButton.setDisabled(False)
 			self.master.SimpleMain.StopButton.setDisabled(True)
@@ -427,9 +431,11 @@ class QtRunWindow(QWidget):
 	#######################################################################
 
 	def updateConsoleInfo(self,text):
-		textCursor = self.ConsoleView.textCursor()
-		self.ConsoleView.setTextCursor(textCursor)
-		self.ConsoleView.appendHtml(text)
+		self.consoleBatcher.append(text)
+
+	def updateConsoleLine(self,textStr):
+		# Raw CMSITminiDAQ output, ANSI colours and cursor movements included
+		self.consoleBatcher.write(textStr)
 		
 	def finish(self,EnableReRun):
 		self.RunButton.setDisabled(True)
@@ -512,8 +518,10 @@ class QtRunWindow(QWidget):
 
 			if reply == QMessageBox.Yes:
 				self.release()
-				self.master.HVpowersupply.TurnOff()
-				self.master.LVpowersupply.TurnOff()
+				# Power supplies are shared by all boards, keep them on while other sessions run
+				if not self.master.TestScheduler.hasSessions():
+					self.master.HVpowersupply.TurnOff()
+					self.master.LVpowersupply.TurnOff()
 				event.accept()
 			else:
 				self.backSignal = False
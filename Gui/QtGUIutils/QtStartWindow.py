@@ -230,10 +230,12 @@ class QtStartWindow(QWidget):
 		self.master.ProcessingTest = True
 
 	def release(self):
-		self.master.ProcessingTest = False
+		# Sessions of other boards may still be running
+		self.master.ProcessingTest = self.master.TestScheduler.hasSessions()
 		self.master.NewTestButton.setDisabled(False)
-		self.master.LogoutButton.setDisabled(False)
-		self.master.ExitButton.setDisabled(False)
+		if not self.master.ProcessingTest:
+			self.master.LogoutButton.setDisabled(False)
+			self.master.ExitButton.setDisabled(False)
 
 	def setTestList(self):
 		self.TestCombo.setDisabled(True)
@@ -278,8 +280,9 @@ class QtStartWindow(QWidget):
 		#self.info = [self.firmware.getModuleByIndex(0).getModuleID(), str(self.TestCombo.currentText())]
 		self.info = [self.firmware.getModuleByIndex(0).getOpticalGroupID(), str(self.TestCombo.currentText())]
 		self.runFlag = True
-		self.master.BeBoardWidget = self.BeBoardWidget
-		self.master.RunNewTest = QtRunWindow(self.master, self.info, self.firmwareDescription)
+		# Kept by the scheduler, one run window per board
+		runWindow = QtRunWindow(self.master, self.info, self.firmwareDescription)
+		self.master.TestScheduler.addSession(self.firmwareName, runWindow)
 		self.close()
 
 	def closeEvent(self, event):
@@ -8,6 +8,8 @@ from PyQt5.QtWidgets import (QAbstractItemView, QApplication, QCheckBox, QComboB
 		QVBoxLayout, QWidget, QMainWindow, QMessageBox, QSplitter)
 from PyQt5 import QtSvg
 
+from Gui.QtGUIutils.QtPlotView import QtPlotView
+
 class QtTCanvasWidget(QWidget):
 	resized = pyqtSignal()
 	def __init__(self,master,canvas):
@@ -41,7 +43,7 @@ class QtTCanvasWidget(QWidget):
 		#self.DisplayLabel.setScaledContents(True)
 		#self.DisplayView = QPixmap(self.canvas).scaled(QSize(self.DisplayW,self.DisplayH), Qt.KeepAspectRatio, Qt.SmoothTransformation)
 		#self.DisplayLabel.setPixmap(self.DisplayView)
-		self.DisplayView = QtSvg.QSvgWidget()
+		self.DisplayView = QtPlotView()
 		self.DisplayView.load(self.canvas)
 		
 		self.mainLayout.addWidget(self.DisplayTitle,0,0,1,1)
@@ -0,0 +1,140 @@
+'''
+  ReplayDAQ.py
+  brief                 Stand-in for CMSITminiDAQ and fpgaconfig replaying recorded runs
+  version               0.1
+
+  Used through the bin/CMSITminiDAQ and bin/fpgaconfig wrappers, put bin/ first
+  in PATH. Behaviour is set through the environment:
+    PH2_REPLAY_DIR       recordings, <dir>/<calibration>/output.txt and Run*.root
+                         (a synthetic stream is generated when missing)
+    PH2_REPLAY_RATE      lines per second, 0 for as fast as possible (default)
+    PH2_REPLAY_LINES     progress blocks of the synthetic stream (default 200)
+    PH2_REPLAY_STAMP     emit a time stamp line every N lines (default 0, off),
+                         also records progress write times in ReplayTiming.txt
+    PH2_REPLAY_FW_DELAY  seconds taken by fpgaconfig -i/-f and CMSITminiDAQ -r
+'''
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+
+# Lines starting with this are time stamps for console latency measurements
+StampPrefix = "||I| replay-stamp "
+# Written next to the replayed output when time stamps are on
+TimingFileName = "ReplayTiming.txt"
+
+def getRate():
+	return float(os.environ.get("PH2_REPLAY_RATE", "0"))
+
+def syntheticStream(calibration, blocks):
+	# Mimics CMSITminiDAQ: colour codes, progress blocks redrawn with cursor-up
+	yield "||I| \x1b[32mCreating directory: \x1b[1m\x1b[33mResults\x1b[0m"
+	yield "||I| \x1b[1m\x1b[34m@@@ Initializing the Hardware @@@\x1b[0m"
+	for chip in range(4):
+		yield "||I| \x1b[32mConfiguring RD53: \x1b[33mRD53 [board/opticalGroup/hybrid/chip = 0/0/0/{}]\x1b[0m".format(chip)
+	yield "||I| \x1b[1m\x1b[34m@@@ Performing {} @@@\x1b[0m".format(calibration)
+	for block in range(1, blocks+1):
+		anchor = "\x1b[A"*5 if block > 1 else ""
+		yield anchor + "||I| \x1b[36m---------------------------\x1b[0m"
+		yield "||I| \x1b[32m****** Reading  data ******\x1b[0m"
+		yield "||I| \x1b[32mn. 32 bit words :     21600\x1b[0m"
+		yield "||I| \x1b[1m\x1b[35m>>>> Progress : {0:5.1f}% <<<<\x1b[0m".format(100.0*block/blocks)
+		yield "||I| \x1b[36m---------------------------\x1b[0m"
+	for chip in range(4):
+		yield "||I| \x1b[32mGlobal threshold for [board/opticalGroup/hybrid/chip = 0/0/0/{0}] is \x1b[1m\x1b[33m{1}\x1b[0m".format(chip, 350+chip)
+	yield "||I| \x1b[32mSaving to file: Results\x1b[0m"
+
+def recordedStream(fileName):
+	with open(fileName, 'r', errors='replace') as recording:
+		for line in recording:
+			yield line.rstrip('\n')
+
+def emit(lines, stamped = True):
+	rate = getRate()
+	stampEvery = int(os.environ.get("PH2_REPLAY_STAMP", "0")) if stamped else 0
+	# Progress lines are not echoed to the console, their write times go to a
+	# side file so that the benchmark can time the progress bar instead
+	timingFile = open(TimingFileName, "a") if stampEvery > 0 else None
+	startTime = time.time()
+	nLines, nStamps = 0, 0
+	for index, line in enumerate(lines):
+		if rate > 0:
+			delay = startTime + index/rate - time.time()
+			if delay > 0:
+				time.sleep(delay)
+		sys.stdout.write(line + "\n")
+		nLines += 1
+		if timingFile is not None:
+			if ">>>> Progress :" in line:
+				sys.stdout.flush()
+				timingFile.write("progress {0} {1:.6f}\n".format(line.split("Progress :")[1].split("%")[0].strip(), time.time()))
+			if index % stampEvery == 0:
+				sys.stdout.write("{0}{1} {2:.6f}\n".format(StampPrefix, nStamps, time.time()))
+				sys.stdout.flush()
+				nStamps += 1
+	sys.stdout.flush()
+	if timingFile is not None:
+		timingFile.write("written {0} {1} {2:.6f}\n".format(nLines, nStamps, time.time() - startTime))
+		timingFile.close()
+
+def nextRunNumber():
+	# Ph2_ACF names the files after RunNumber.txt and counts it up
+	runNumber = "0"
+	if os.path.isfile("RunNumber.txt"):
+		with open("RunNumber.txt") as runNumberFile:
+			runNumber = runNumberFile.readline().strip() or "0"
+	with open("RunNumber.txt", "w") as runNumberFile:
+		runNumberFile.write(str(int(runNumber)+1).zfill(len(runNumber)) + "\n")
+	return runNumber
+
+def dropResults(recordingDir, runNumber):
+	os.makedirs("Results", exist_ok=True)
+	for fileName in glob.glob(os.path.join(recordingDir, "Run*.root")):
+		suffix = os.path.basename(fileName).split("_", 1)[-1]
+		shutil.copyfile(fileName, os.path.join("Results", "Run{0}_{1}".format(runNumber, suffix)))
+
+def miniDAQ(argv):
+	parser = argparse.ArgumentParser(prog="CMSITminiDAQ")
+	parser.add_argument("-f", "--file", default="CMSIT.xml")
+	parser.add_argument("-c", "--calib", default="pixelalive")
+	parser.add_argument("-r", "--reset", action="store_true")
+	args, unknown = parser.parse_known_args(argv)
+
+	if args.reset:
+		time.sleep(float(os.environ.get("PH2_REPLAY_FW_DELAY", "0")))
+		emit(["||I| \x1b[32mResetting the board\x1b[0m"], stamped = False)
+		return 0
+
+	recordingDir = os.path.join(os.environ.get("PH2_REPLAY_DIR", ""), args.calib)
+	runNumber = nextRunNumber()
+	if os.path.isfile(os.path.join(recordingDir, "output.txt")):
+		emit(recordedStream(os.path.join(recordingDir, "output.txt")))
+	else:
+		emit(syntheticStream(args.calib, int(os.environ.get("PH2_REPLAY_LINES", "200"))))
+	dropResults(recordingDir, runNumber)
+	return 0
+
+def fpgaconfig(argv):
+	parser = argparse.ArgumentParser(prog="fpgaconfig")
+	parser.add_argument("-c", "--config", default="CMSIT.xml")
+	parser.add_argument("-l", "--list", action="store_true")
+	parser.add_argument("-f", "--file", default="")
+	parser.add_argument("-i", "--image", default="")
+	args, unknown = parser.parse_known_args(argv)
+
+	if args.list:
+		# Every image shipped with the GUI counts as stored on the SD card
+		images = [os.path.basename(image) for image in glob.glob(os.path.join(os.environ.get("GUI_dir",""), "FirmwareImages", "*"))]
+		emit(["||I| \x1b[32mList of images on SD card:\x1b[0m"] + ["||I| - {}".format(image) for image in images], stamped = False)
+		return 0
+	time.sleep(float(os.environ.get("PH2_REPLAY_FW_DELAY", "0")))
+	emit(["||I| \x1b[32mLoaded image {}\x1b[0m".format(args.image)], stamped = False)
+	return 0
+
+if __name__ == "__main__":
+	tools = {"CMSITminiDAQ": miniDAQ, "fpgaconfig": fpgaconfig}
+	if len(sys.argv) < 2 or sys.argv[1] not in tools.keys():
+		sys.exit("usage: ReplayDAQ.py {CMSITminiDAQ,fpgaconfig} [options]")
+	sys.exit(tools[sys.argv[1]](sys.argv[2:]))
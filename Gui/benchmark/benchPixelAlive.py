@@ -0,0 +1,122 @@
+'''
+  benchPixelAlive.py
+  brief                 Time per chip of the PixelAlive grading, per bin loops against NumPy
+  version               0.1
+
+  Example:
+    python -m Gui.benchmark.benchPixelAlive --chips 12
+    python -m Gui.benchmark.benchPixelAlive Results/*/Run000012_PixelAlive.root
+
+  Without files, RD53A sized maps with dead columns, clusters and noisy
+  pixels are generated. Both versions have to give the same count on every
+  chip.
+'''
+import os
+import sys
+import time
+import random
+import argparse
+
+os.environ.setdefault("GUI_dir", os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import ROOT
+ROOT.gROOT.SetBatch(ROOT.kTRUE)
+
+from Gui.python.ROOTInterface import ROOTFile
+from Gui.python.TestValidator import CountLowEffNonIsolated
+
+def loopCountLowEffNonIsolated(CanvasHist2D):
+	# GradePixelAlive before the NumPy version, unchanged
+	RowRange = [0,191]
+	nRowRange = RowRange[1]-RowRange[0]+1
+	ColRange = [128,263]
+	nColRange = ColRange[1]-ColRange[0]+1
+	Hist2D_Scanned = ROOT.TH2F("Hist2D_Scanned","Hist2D_Scanned", \
+		nColRange, -0.5, nColRange-0.5,	\
+		nRowRange, -0.5, nRowRange-0.5)
+	Hist2D_Ref = ROOT.TH2F("Hist2D_Ref","Hist2D_Ref", \
+		nColRange, -0.5, nColRange-0.5,	\
+		nRowRange, -0.5, nRowRange-0.5)
+
+	Eff_threshold = 0.90
+	for row in range(RowRange[0]+1,RowRange[1]+1):
+		for col in range(ColRange[0]+1,ColRange[1]+1):
+			Hist2D_Scanned.SetBinContent(col-ColRange[0],row-RowRange[0],  0.0 if CanvasHist2D.GetBinContent(col,row) > Eff_threshold else 1.0)
+
+	for row in range(RowRange[0]+1,RowRange[1]+1):
+		for col in range(ColRange[0]+1,ColRange[1]+1):
+			Hist2D_Ref.SetBinContent(col-ColRange[0],row-RowRange[0],	\
+			1.0 if max( \
+				Hist2D_Scanned.GetBinContent((col+1)%nColRange,row), \
+				Hist2D_Scanned.GetBinContent((col-1)%nColRange,row), \
+				Hist2D_Scanned.GetBinContent(col,(row+1)%nRowRange), \
+				Hist2D_Scanned.GetBinContent(col,(row-1)%nRowRange)) \
+				> Eff_threshold else 0.0)
+	return Hist2D_Ref.Integral()
+
+def syntheticMap(index, seed):
+	# PixelAlive efficiency map of one RD53A chip, 400 columns x 192 rows
+	generator = random.Random(seed + index)
+	hist = ROOT.TH2F("PixelAlive_{}".format(index), "PixelAlive", 400, -0.5, 399.5, 192, -0.5, 191.5)
+	hist.SetDirectory(0)
+	for col in range(1, 401):
+		for row in range(1, 193):
+			hist.SetBinContent(col, row, 1.0)
+	for i in range(generator.randint(0, 3)):
+		col = generator.randint(1, 400)
+		for row in range(1, 193):
+			hist.SetBinContent(col, row, 0.0)
+	for i in range(generator.randint(0, 20)):
+		col, row = generator.randint(1, 400), generator.randint(1, 192)
+		for dCol in range(generator.randint(1, 6)):
+			for dRow in range(generator.randint(1, 6)):
+				hist.SetBinContent(min(col+dCol, 400), min(row+dRow, 192), generator.uniform(0.0, 0.95))
+	for i in range(generator.randint(0, 300)):
+		hist.SetBinContent(generator.randint(1, 400), generator.randint(1, 192), generator.choice([0.0, 0.9, 0.5]))
+	return hist
+
+def recordedMaps(fileNames):
+	maps = []
+	for fileName in fileNames:
+		with ROOTFile(fileName, classNames = ["TCanvas"], namePattern = "PixelAlive") as pending:
+			while pending != []:
+				node = pending.pop()
+				pending += node.getDaugthers()
+				if node.getClassName() == "TCanvas":
+					hist = node.getObject().GetPrimitive(node.getKeyName())
+					if hist:
+						# Detached copy, the canvas goes with the file
+						hist = hist.Clone()
+						hist.SetDirectory(ROOT.nullptr)
+						maps.append(hist)
+	return maps
+
+def timeCount(count, maps, repeat):
+	best = float("inf")
+	for i in range(repeat):
+		startTime = time.perf_counter()
+		result = [count(hist) for hist in maps]
+		best = min(best, time.perf_counter() - startTime)
+	return best, result
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Compare the PixelAlive grading loops against the NumPy version")
+	parser.add_argument("files", nargs="*", help="PixelAlive ROOT files, synthetic maps without")
+	parser.add_argument("--chips", type=int, default=12, help="Synthetic chips, e.g. 3 quad modules. Default: 12")
+	parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic maps. Default: 1")
+	parser.add_argument("--repeat", type=int, default=3, help="Best of this many passes. Default: 3")
+	args = parser.parse_args()
+
+	maps = recordedMaps(args.files) if args.files else [syntheticMap(index, args.seed) for index in range(args.chips)]
+	if maps == []:
+		print("No PixelAlive map found")
+		sys.exit(1)
+	before, expected = timeCount(loopCountLowEffNonIsolated, maps, args.repeat)
+	after, result = timeCount(CountLowEffNonIsolated, maps, args.repeat)
+	print("{0} chips".format(len(maps)))
+	print("  bin loops : {0:>9.2f} ms/chip".format(1000*before/len(maps)))
+	print("  NumPy     : {0:>9.2f} ms/chip  ({1:.0f}x)".format(1000*after/len(maps), before/after))
+	if result != expected:
+		print("  MISMATCH: {0} against {1}".format(result, expected))
+		sys.exit(1)
+	print("  counts identical: {}".format(", ".join(["{:.0f}".format(count) for count in result])))
@@ -0,0 +1,365 @@
+'''
+  benchTestHandler.py
+  brief                 End-to-end timing of TestHandler against the replay stand-in
+  version               0.1
+
+  Example:
+    python -m Gui.benchmark.benchTestHandler -t StandardStep1
+    python -m Gui.benchmark.benchTestHandler -t PixelAlive --rates 2000 10000 50000 0
+
+  CMSITminiDAQ and fpgaconfig are replaced by Gui/benchmark/bin, runs happen in
+  a temporary Ph2_ACF area and data directory. Reported are
+    - per step: DAQ time, GUI work booked in StepTiming.json and the dead time
+      between the end of one DAQ run and the start of the next
+    - console latency: time from a line being written by CMSITminiDAQ to it
+      reaching the console (updateConsoleInfo), and for progress lines to the
+      progress bar, which is redrawn WidgetRefreshRate times per second
+    - the highest output rate (lines/s) handled without lost or broken lines
+      and with the 95% latency below --max-latency
+'''
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+BenchmarkDir = os.path.dirname(os.path.abspath(__file__))
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+StampPattern = re.compile(r"replay-stamp (\d+) (\d+\.\d+)")
+
+def setupEnvironment(workDir, replayDir):
+	# Has to run before any Gui module is imported, settings.py reads the environment on import
+	os.environ.setdefault("GUI_dir", os.path.dirname(os.path.dirname(BenchmarkDir)))
+	os.environ.setdefault("Ph2_ACF_VERSION", "v4-06")
+	os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+	realArea = os.environ.get("Ph2_ACF_AREA", "")
+	os.environ["Ph2_ACF_AREA"] = os.path.join(workDir, "Ph2_ACF")
+	os.environ["DATA_dir"] = os.path.join(workDir, "data")
+	os.environ["PATH"] = os.path.join(BenchmarkDir, "bin") + os.pathsep + os.environ.get("PATH", "")
+	os.environ["PH2_REPLAY_DIR"] = replayDir
+	os.environ["PH2_REPLAY_FW_DELAY"] = "0"
+
+	# Chip configs come from the real Ph2_ACF area when there is one
+	rd53Dir = os.path.join(os.environ["Ph2_ACF_AREA"], "settings", "RD53Files")
+	os.makedirs(rd53Dir, exist_ok=True)
+	os.makedirs(os.environ["DATA_dir"], exist_ok=True)
+	for boardType in ["RD53A", "RD53"]:
+		chipConfig = os.path.join(realArea, "settings", "RD53Files", "CMSIT_{}.txt".format(boardType))
+		if realArea != "" and os.path.isfile(chipConfig):
+			shutil.copyfile(chipConfig, os.path.join(rd53Dir, os.path.basename(chipConfig)))
+		else:
+			with open(os.path.join(rd53Dir, "CMSIT_{}.txt".format(boardType)), "w") as configFile:
+				configFile.write("# Replay benchmark chip configuration\n")
+
+def percentile(values, fraction):
+	if values == []:
+		return float("nan")
+	values = sorted(values)
+	return values[min(len(values)-1, int(fraction*len(values)))]
+
+class ProgressRecorder():
+	def __init__(self, runwindow):
+		self.runwindow = runwindow
+
+	def setValue(self, value):
+		self.runwindow.progress.append((float(value), time.time()))
+
+class RuntimeRecorder():
+	def setText(self, text):
+		pass
+
+class BenchResultWidget():
+	def __init__(self, runwindow, nSteps):
+		self.ProgressBar = [ProgressRecorder(runwindow) for i in range(nSteps)]
+		self.runtime = [RuntimeRecorder() for i in range(nSteps)]
+
+class BenchRunWindow():
+	'''
+	The parts of QtRunWindow used by TestHandler, recording when the console
+	and the progress bar get updated
+	'''
+	def __init__(self, nSteps):
+		self.ResultWidget = BenchResultWidget(self, nSteps)
+		self.lines = 0
+		self.stamps = []
+		self.broken = 0
+		self.progress = []
+		self.finished = []
+
+	def updateConsoleInfo(self, text):
+		self.lines += 1
+		if "replay-stamp" not in text:
+			return
+		match = StampPattern.search(text)
+		if match is None:
+			self.broken += 1
+			return
+		self.stamps.append(time.time() - float(match.group(2)))
+
+	def updateConsoleLine(self, textStr):
+		self.updateConsoleInfo(textStr)
+
+	def finish(self, EnableReRun):
+		self.finished.append((EnableReRun, time.time()))
+
+	def refreshHistory(self, modulestatus):
+		pass
+
+	def updateResult(self, result):
+		pass
+
+	def updateValidation(self, grade, passmodule):
+		pass
+
+class BenchmarkRun():
+	'''
+	One TestHandler run of a single or composite test, driven through the Qt
+	event loop exactly like the GUI does
+	'''
+	def __init__(self, testName, board, timeout):
+		from PyQt5.QtCore import QObject, QProcess, QTimer, QEventLoop, pyqtSignal
+		from Gui.GUIutils.settings import CompositeList
+		from Gui.GUIutils.guiUtils import isCompositeTest
+		from Gui.python.TestHandler import TestHandler
+
+		class BenchMaster(QObject):
+			globalStop = pyqtSignal()
+			def __init__(self):
+				super(BenchMaster,self).__init__()
+				self.HVpowersupply = None
+				self.LVpowersupply = None
+				self.connection = "Offline"
+				self.TryUsername = ""
+				self.expertMode = True
+
+		self.QProcess = QProcess
+		self.testName = testName
+		self.timeout = timeout
+		self.timedOut = False
+		self.steps = CompositeList[testName] if isCompositeTest(testName) else [testName]
+		self.master = BenchMaster()
+		self.runwindow = BenchRunWindow(len(self.steps))
+		self.handler = TestHandler(self.runwindow, self.master, [board.getBoardName(), testName], board)
+		self.handler.interactive = False
+		# stateChanged is emitted before finished, so before on_finish does its work
+		self.handler.run_process.stateChanged.connect(self.on_stateChanged)
+		self.daqRuns = []
+
+		self.loop = QEventLoop()
+		self.poll = QTimer()
+		self.poll.timeout.connect(self.checkDone)
+		self.deadline = QTimer()
+		self.deadline.setSingleShot(True)
+		self.deadline.timeout.connect(self.on_timeout)
+
+	def on_stateChanged(self, state):
+		if state == self.QProcess.Running:
+			self.daqRuns.append({"test": self.handler.currentTest, "output_dir": self.handler.output_dir, "start": time.time(), "end": None})
+		elif state == self.QProcess.NotRunning and self.daqRuns != [] and self.daqRuns[-1]["end"] is None:
+			self.daqRuns[-1]["end"] = time.time()
+
+	def isDone(self):
+		if self.handler.halt:
+			return True
+		if self.runwindow.finished == [] or self.runwindow.finished[-1][0] != True:
+			return False
+		return self.handler.run_process.state() == self.QProcess.NotRunning and not self.handler.isStarting() and self.handler.postProcessor.pending() == 0
+
+	def checkDone(self):
+		if self.isDone():
+			self.poll.stop()
+			self.deadline.stop()
+			self.loop.quit()
+
+	def on_timeout(self):
+		self.timedOut = True
+		self.handler.urgentStop()
+
+	def run(self):
+		self.startTime = time.time()
+		self.handler.runTest()
+		self.poll.start(20)
+		self.deadline.start(int(self.timeout*1000))
+		self.loop.exec_()
+		self.endTime = time.time()
+		self.handler.postProcessor.wait()
+		return self.report()
+
+	def report(self):
+		steps = []
+		lastEnd = self.startTime
+		for daqRun in self.daqRuns:
+			end = daqRun["end"] if daqRun["end"] is not None else self.endTime
+			profile = {}
+			try:
+				with open(os.path.join(daqRun["output_dir"], "StepTiming.json")) as profileFile:
+					profile = json.load(profileFile)
+			except (OSError, ValueError):
+				pass
+			phases = profile.get("phases", {})
+			steps.append({
+				"test"       :  daqRun["test"],
+				"output_dir" :  daqRun["output_dir"],
+				"daq"        :  round(end - daqRun["start"], 3),
+				# GUI side work of the step, whether or not it ran behind the next step
+				"gui"        :  round(sum([phases.get(phase, 0.0) for phase in ["staging", "copy", "grading", "rendering", "db_upload"]]), 3),
+				# Board idle time from the end of the last DAQ run (or the start) to this one
+				"dead_time"  :  round(daqRun["start"] - lastEnd, 3),
+				"phases"     :  phases,
+			})
+			lastEnd = end
+
+		progressLatency = []
+		unmatched = 0
+		written = {"lines": 0, "stamps": 0, "progress": 0, "seconds": 0.0}
+		for index, daqRun in enumerate(self.daqRuns):
+			progressTimes = {}
+			try:
+				with open(os.path.join(daqRun["output_dir"], "ReplayTiming.txt")) as timingFile:
+					for line in timingFile:
+						fields = line.split()
+						if fields[0] == "progress":
+							progressTimes.setdefault(float(fields[1]), float(fields[2]))
+							written["progress"] += 1
+						elif fields[0] == "written":
+							written["lines"] += int(fields[1])
+							written["stamps"] += int(fields[2])
+							written["seconds"] += float(fields[3])
+			except (OSError, ValueError, IndexError):
+				continue
+			# Progress bar updates belonging to this run
+			nextStart = self.daqRuns[index+1]["start"] if index+1 < len(self.daqRuns) else self.endTime
+			for value, shown in self.runwindow.progress:
+				if not daqRun["start"] <= shown <= nextStart:
+					continue
+				if value in progressTimes.keys():
+					progressLatency.append(shown - progressTimes.pop(value))
+				else:
+					unmatched += 1
+
+		return {
+			"test"              :  self.testName,
+			"wall"              :  round(self.endTime - self.startTime, 3),
+			"halted"            :  self.handler.halt,
+			"timed_out"         :  self.timedOut,
+			"steps"             :  steps,
+			"written"           :  written,
+			"console_lines"     :  self.runwindow.lines,
+			"stamps"            :  self.runwindow.stamps,
+			"broken_stamps"     :  self.runwindow.broken,
+			"progress_latency"  :  progressLatency,
+			# Progress values shown that CMSITminiDAQ never wrote, i.e. broken lines
+			"progress_unmatched":  unmatched,
+			"progress_final"    :  self.runwindow.progress[-1][0] if self.runwindow.progress != [] else None,
+		}
+
+def isSustained(report, maxLatency):
+	# Lines in the data taking phase are not echoed to the console and the
+	# progress bar may skip values, losses show up as broken stamps, progress
+	# values that were never written or a run not ending on 100%
+	if report["halted"] or report["broken_stamps"] > 0 or report["progress_unmatched"] > 0 or report["progress_final"] != 100:
+		return False
+	latency = report["stamps"] + report["progress_latency"]
+	return latency != [] and percentile(latency, 0.95) < maxLatency
+
+def makeBoard(boardName, moduleType):
+	from Gui.GUIutils.settings import FirmwareList
+	from Gui.python.Firmware import QtBeBoard, QtModule
+	board = QtBeBoard()
+	board.setBoardName(boardName)
+	board.setIPAddress(FirmwareList.get(boardName, "127.0.0.1"))
+	module = QtModule()
+	module.setModuleName("Replay0001")
+	module.setModuleID("0")
+	module.setFMCID("0")
+	module.setModuleType(moduleType)
+	board.addModule(0, module)
+	return board
+
+def printStepTable(report):
+	print("\n{0}: {1:.2f} s{2}".format(report["test"], report["wall"], ", HALTED" if report["halted"] else ""))
+	print("  {0:<24} {1:>9} {2:>9} {3:>10}   {4}".format("step", "daq [s]", "gui [s]", "dead [s]", "phases"))
+	for step in report["steps"]:
+		phases = ", ".join(["{0} {1:.3f}".format(phase, seconds) for phase, seconds in step["phases"].items()])
+		print("  {0:<24} {1:>9.3f} {2:>9.3f} {3:>10.3f}   {4}".format(step["test"], step["daq"], step["gui"], step["dead_time"], phases))
+
+def printLatency(report):
+	consoleLatency = report["stamps"]
+	print("  console latency  [ms]: median {0:.1f}, p95 {1:.1f}, max {2:.1f} ({3} stamps, {4} broken)".format(
+		1000*percentile(consoleLatency, 0.5), 1000*percentile(consoleLatency, 0.95), 1000*max(consoleLatency+[float("nan")]), len(consoleLatency), report["broken_stamps"]))
+	print("  progress latency [ms]: median {0:.1f}, p95 {1:.1f} ({2} updates)".format(
+		1000*percentile(report["progress_latency"], 0.5), 1000*percentile(report["progress_latency"], 0.95), len(report["progress_latency"])))
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Time TestHandler against a replayed CMSITminiDAQ")
+	parser.add_argument("-t", "--test", default="StandardStep1", help="Single test or composite sequence for the step timing. Default: StandardStep1")
+	parser.add_argument("--module-type", default="SingleSCC", help="Module type of the emulated module. Default: SingleSCC")
+	parser.add_argument("--replay-dir", default="", help="Recorded runs, <dir>/<calibration>/output.txt and Run*.root. Default: synthetic output")
+	parser.add_argument("--blocks", type=int, default=200, help="Progress blocks of the synthetic output. Default: 200")
+	parser.add_argument("--rate-test", default="PixelAlive", help="Single test used for the output rate sweep. Default: PixelAlive")
+	parser.add_argument("--rates", type=float, nargs="*", default=[1000, 5000, 20000, 50000, 0], help="Output rates in lines/s to sweep, 0 for unthrottled")
+	parser.add_argument("--stamp-every", type=int, default=50, help="Time stamp line every N lines. Default: 50")
+	parser.add_argument("--max-latency", type=float, default=0.5, help="95%% latency (s) a rate must stay under to count as sustained. Default: 0.5")
+	parser.add_argument("--timeout", type=float, default=600, help="Give up on a run after this many seconds. Default: 600")
+	parser.add_argument("--keep", action="store_true", help="Keep the temporary Ph2_ACF area and data directory")
+	parser.add_argument("--json", default="", help="Write all results as JSON to this file")
+	args = parser.parse_args()
+
+	workDir = tempfile.mkdtemp(prefix="ph2acf_bench_")
+	setupEnvironment(workDir, args.replay_dir)
+
+	from PyQt5.QtWidgets import QApplication
+	from Gui.GUIutils.settings import SingleTest, CompositeTest
+	from Gui.siteSettings import defaultFC7
+	if args.test not in SingleTest + CompositeTest:
+		parser.error("unknown test {}".format(args.test))
+	app = QApplication(sys.argv)
+	board = makeBoard(defaultFC7, args.module_type)
+	results = {"workdir": workDir, "steps": None, "rates": []}
+
+	try:
+		os.environ["PH2_REPLAY_RATE"] = "0"
+		os.environ["PH2_REPLAY_LINES"] = str(args.blocks)
+		os.environ["PH2_REPLAY_STAMP"] = str(args.stamp_every)
+		report = BenchmarkRun(args.test, board, args.timeout).run()
+		results["steps"] = report
+		printStepTable(report)
+		printLatency(report)
+
+		print("\nOutput rate sweep with {}".format(args.rate_test))
+		print("  {0:>10} {1:>10} {2:>8} {3:>8} {4:>12} {5:>12}   {6}".format("target/s", "actual/s", "progress", "broken", "p95 con[ms]", "p95 prg[ms]", "sustained"))
+		sustained = []
+		for rate in args.rates:
+			# About ten seconds of output per rate, as much as asked for when unthrottled
+			blocks = args.blocks if rate == 0 else max(10, int(rate*10/5))
+			os.environ["PH2_REPLAY_RATE"] = str(rate)
+			os.environ["PH2_REPLAY_LINES"] = str(blocks)
+			report = BenchmarkRun(args.rate_test, board, args.timeout).run()
+
+			written = report["written"]
+			actual = written["lines"]/written["seconds"] if written["seconds"] > 0 else float("nan")
+			passed = isSustained(report, args.max_latency)
+			if passed:
+				sustained.append(actual if rate == 0 else rate)
+			print("  {0:>10} {1:>10.0f} {2:>8} {3:>8} {4:>12.1f} {5:>12.1f}   {6}".format(
+				"max" if rate == 0 else int(rate), actual, "{0}/{1}".format(len(report["progress_latency"]), written["progress"]), report["broken_stamps"],
+				1000*percentile(report["stamps"], 0.95), 1000*percentile(report["progress_latency"], 0.95), "yes" if passed else "no"))
+			results["rates"].append(report)
+
+		results["max_sustained_rate"] = max(sustained) if sustained != [] else 0
+		print("\nMaximum sustained output rate: {0:.0f} lines/s".format(results["max_sustained_rate"]))
+		if args.json:
+			with open(args.json, 'w') as jsonFile:
+				json.dump(results, jsonFile, indent=2)
+	finally:
+		if not args.keep:
+			shutil.rmtree(workDir, ignore_errors=True)
+		else:
+			print("Runs kept in {}".format(workDir))
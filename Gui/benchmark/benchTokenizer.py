@@ -0,0 +1,178 @@
+'''
+  benchTokenizer.py
+  brief                 Lines per second of the CMSITminiDAQ output parsing, per line chain against OutputTokenizer
+  version               0.1
+
+  Example:
+    python -m Gui.benchmark.benchTokenizer -t ThresholdAdjustment Results/*/output.txt
+
+  Without files a synthetic stream from ReplayDAQ is used. The per line chain is
+  a copy of the parsing in TestHandler.on_readyReadStandardOutput, updateNeeded
+  and parseANSI before OutputTokenizer, GUI calls left out. Both parsers have
+  to agree on every console line and register update. OutputTokenizer reports
+  the latest progress per chunk only.
+'''
+import os
+import re
+import sys
+import time
+import argparse
+
+os.environ.setdefault("GUI_dir", os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Gui.GUIutils.settings import *
+from Gui.python.OutputParser import *
+from Gui.benchmark.ReplayDAQ import syntheticStream
+
+##########################################################################
+##  Per line chain, as it was before OutputTokenizer
+##########################################################################
+
+ConvertForSpan = {
+b'<'          :    b'&#60;',
+b'>'          :    b'&#62;',
+}
+
+ANSI_richtext = {
+b'[0m'        :    b'</span>',
+b'[1m'        :    b'<b>',
+b'[31m'       :    b'</span><span style="color:#ff0000;">',
+b'[32m'       :    b'</span><span style="color:#00ff00;">',
+b'[33m'       :    b'</span><span style="color:#ffff00;">',
+b'[34m'       :    b'</span><span style="color:#0000ff;">',
+b'[35m'       :    b'</span><span style="color:#ff00ff;">',
+b'[36m'       :    b'</span><span style="color:#00ffff;">',
+b'[37m'       :    b'</span><span style="color:#000000;">',
+}
+
+def chainParseANSI(text):
+	text = text.replace(b'\x1b',b'')
+	numBackLine = text.count(b'[A')
+	textNoAnchor = text.replace(b'[A',b'')
+	for character in ConvertForSpan.keys():
+		if character in textNoAnchor:
+			textNoAnchor = textNoAnchor.replace(character,ConvertForSpan[character])
+	for pattern in ANSI_richtext.keys():
+		if pattern in textNoAnchor:
+			textNoAnchor = textNoAnchor.replace(pattern,ANSI_richtext[pattern])
+	textNoAnchor  = textNoAnchor.replace(b'</span>',b'',1)
+	if b'<b>' in  textNoAnchor:
+		textNoAnchor = textNoAnchor+b'</b>'
+	textNoAnchor = textNoAnchor + b'\n'
+	return numBackLine, textNoAnchor
+
+def chainUpdateNeeded(testName, textStr):
+	currentTest = Test[testName]
+	if  currentTest in ["thradj","thrmin"] and "Global threshold for" in textStr:
+		return True,"Vthreshold_LIN",-1
+	elif currentTest in ["gainopt"] and "Krummenacher Current" in textStr:
+		return True,"KRUM_CURR_LIN",-1
+	elif currentTest in ["injdelay"]:
+		if "New latency dac" in textStr:
+			return True,"LATENCY_CONFIG",-2
+		elif "New injection delay" in textStr:
+			return True,"INJECTION_SELECT",-2
+		else:
+			return (False, None, 0)
+	else:
+		return (False, None, 0)
+
+def substringChain(testName, lines):
+	# Body of the old on_readyReadStandardOutput loop
+	mode = "None"
+	html, progress, registers = [], [], []
+	for textStr in lines:
+		if mode == "Perform":
+			if ">>>> Progress :" in textStr:
+				try:
+					index = textStr.split().index("Progress")+2
+					value = float(textStr.split()[index].rstrip("%"))
+					progress.append(value)
+					if value == 100:
+						mode = "Summary"
+				except:
+					pass
+			continue
+		elif mode == "Summary":
+			toUpdate, UpdatedFEKey, valueIndex = chainUpdateNeeded(testName, textStr)
+			if toUpdate:
+				try:
+					UpdatedValuetext = textStr.split()[valueIndex]
+					UpdatedValue = int(re.sub(r'\033\[(\d|;)+?m','',UpdatedValuetext))
+					chipIdentifier = textStr.split('=')[-1].split('is')[0]
+					chipIdentifier = re.sub(r'\033\[(\d|;)+?m','',chipIdentifier).split(']')[0]
+					HybridIDKey = chipIdentifier.split("/")[2]
+					ChipIDKey = chipIdentifier.split("/")[3]
+					registers.append(("{}/{}".format(HybridIDKey,ChipIDKey), UpdatedFEKey, UpdatedValue))
+				except Exception as err:
+					pass
+		elif "@@@ Initializing the Hardware @@@" in textStr:
+			mode = "Configure"
+		elif "@@@ Performing" in textStr:
+			mode = "Perform"
+		# encode('ascii') raised on other characters, replaced here so recorded files can be read
+		numUpAnchor, text = chainParseANSI(textStr.encode('ascii', errors='replace'))
+		html.append(text.decode("utf-8"))
+	return html, progress, registers
+
+def tokenized(testName, lines, chunkSize = 64):
+	# Lines arrive in chunks, as they come out of LineAssembler
+	tokenizer = OutputTokenizer(testName)
+	mode = "None"
+	html, progress, registers = [], [], []
+	for start in range(0, len(lines), chunkSize):
+		for event in tokenizer.tokenizeLines(lines[start:start+chunkSize]):
+			if mode == "Perform":
+				if event.kind == ProgressEvent:
+					progress.append(event.progress)
+					if event.progress == 100:
+						mode = "Summary"
+				continue
+			elif mode == "Summary":
+				if event.kind == RegisterEvent:
+					registers.append((event.chipKey, event.register, event.value))
+			elif event.kind == PhaseEvent:
+				mode = "Configure" if event.phase == "configure" else "Perform"
+			html.append(event.toHtml())
+	return html, progress, registers
+
+def timeParser(parser, testName, lines, repeat):
+	best = float("inf")
+	for i in range(repeat):
+		startTime = time.perf_counter()
+		result = parser(testName, lines)
+		best = min(best, time.perf_counter() - startTime)
+	return len(lines)/best, result
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Compare the output parsers on recorded or synthetic CMSITminiDAQ output")
+	parser.add_argument("files", nargs="*", help="Recorded output.txt files")
+	parser.add_argument("-t", "--test", default="ThresholdAdjustment", help="Test the output belongs to, selects the register rules. Default: ThresholdAdjustment")
+	parser.add_argument("--blocks", type=int, default=20000, help="Progress blocks of the synthetic stream. Default: 20000")
+	parser.add_argument("--repeat", type=int, default=5, help="Best of this many passes. Default: 5")
+	args = parser.parse_args()
+
+	if args.test not in Test.keys():
+		parser.error("unknown test {}".format(args.test))
+	lines = []
+	for fileName in args.files:
+		with open(fileName, 'r', errors='replace') as outputFile:
+			lines += [line.rstrip('\n') for line in outputFile]
+	if lines == []:
+		lines = list(syntheticStream(Test[args.test], args.blocks))
+
+	before, expected = timeParser(substringChain, args.test, lines, args.repeat)
+	after, result = timeParser(tokenized, args.test, lines, args.repeat)
+	print("{0} lines of {1}".format(len(lines), args.test))
+	print("  substring chain : {0:>12,.0f} lines/s".format(before))
+	print("  OutputTokenizer : {0:>12,.0f} lines/s  ({1:.1f}x)".format(after, after/before))
+	html, progress, registers = result
+	if html != expected[0] or registers != list(expected[2]):
+		print("  MISMATCH in console lines or register updates")
+		sys.exit(1)
+	# One progress value per chunk, in order and ending on the same value
+	remaining = iter(expected[1])
+	if not all([value in remaining for value in progress]) or progress[-1:] != expected[1][-1:]:
+		print("  MISMATCH in progress values")
+		sys.exit(1)
+	print("  results identical, {0} of {1} progress updates kept".format(len(progress), len(expected[1])))
@@ -1,5 +1,8 @@
 import re
 
+from Gui.GUIutils.settings import *
+from Gui.python.OutputParser import ansiToHtml
+
 ConvertForSpan = {
 b'<'          :    b'&#60;',
 b'>'          :    b'&#62;',
@@ -33,6 +36,88 @@ def parseANSI(text):
     textNoAnchor = textNoAnchor + b'\n'
     return numBackLine, textNoAnchor
 
+# Cursor movements handled by ANSITerminal, colours are left to ansiToHtml
+CursorControl = re.compile(r'\x1b\[(\d*)([ABK])|\r')
+
+class ANSITerminal():
+    '''
+    Line based terminal for the run console. Unlike parseANSI, cursor-up
+    anchors move the cursor back to an earlier row and the following text
+    overwrites it, so the five line progress block of Ph2_ACF is redrawn in
+    place. Only the last nRowsKept rows can be reached again.
+    '''
+    def __init__(self, nRowsKept = ConsoleMaxBlocks):
+        self.nRowsKept = nRowsKept
+        self.rows = []
+        # Row number of rows[0] and of the cursor, counted since the start
+        self.first = 0
+        self.cursor = 0
+        # Lowest row changed since the last takeChanges()
+        self.changed = None
+
+    def getRowCount(self):
+        return self.first + len(self.rows)
+
+    def setRow(self, row, html):
+        if row >= self.getRowCount():
+            self.rows.append(html)
+            if len(self.rows) > self.nRowsKept:
+                self.rows.pop(0)
+                self.first += 1
+        else:
+            self.rows[row - self.first] = html
+        if self.changed is None or row < self.changed:
+            self.changed = row
+
+    def write(self, textStr):
+        # One line of output, without its newline
+        position = 0
+        text = None
+        for match in CursorControl.finditer(textStr):
+            if match.start() > position:
+                text = textStr[position:match.start()] if text is None else text + textStr[position:match.start()]
+            position = match.end()
+            if match.group(0) == '\r':
+                # Back to the first column, what follows replaces the row
+                text = None
+                continue
+            step = int(match.group(1)) if match.group(1) else 1
+            if match.group(2) == 'K':
+                text = ''
+                continue
+            if text is not None:
+                self.setRow(self.cursor, ansiToHtml(text))
+                text = None
+            if match.group(2) == 'A':
+                self.cursor = max(self.first, self.cursor - step)
+            else:
+                self.cursor = min(self.getRowCount(), self.cursor + step)
+        if position < len(textStr):
+            text = textStr[position:] if text is None else text + textStr[position:]
+        if text is not None or position == 0:
+            self.setRow(self.cursor, ansiToHtml(text or ''))
+            self.cursor += 1
+        else:
+            # Nothing but cursor movements, the newline still moves down a row
+            self.cursor = min(self.getRowCount(), self.cursor + 1)
+
+    def appendHtml(self, html):
+        # Messages of the GUI itself go below everything printed so far
+        self.setRow(self.getRowCount(), html)
+        self.cursor = self.getRowCount()
+
+    def takeChanges(self):
+        '''
+        Returns (changed, skipped, rows): the first row changed since the last
+        call, how many changed rows are no longer kept and the html of all
+        rows from there to the end
+        '''
+        if self.changed is None:
+            return None, 0, []
+        changed, self.changed = self.changed, None
+        start = max(changed, self.first)
+        return changed, start - changed, self.rows[start - self.first:]
+
 if  __name__ == "__main__":
     multilines = '''
 ||I| [32mCreating directory: [1m[33mResults[0m\n
@@ -0,0 +1,272 @@
+'''
+  BatchTestEngine.py
+  brief                 Headless test sequencing: ConfigureTest -> CMSITminiDAQ -> ResultGrader -> DB
+  version               0.1
+'''
+import os
+import time
+import threading
+import subprocess
+from collections import defaultdict
+
+from Gui.GUIutils.settings import *
+from Gui.GUIutils.guiUtils import *
+from Gui.GUIutils.FileStager import FileStager
+from Gui.GUIutils.LogWriter import LogWriter
+from Gui.GUIutils.FirmwareStateCache import FirmwareStateCache, imageChecksum
+from Gui.python.OutputParser import *
+from Gui.python.StepProfile import *
+from Gui.python.RunJournal import *
+from Gui.python.RunEventLog import *
+from Gui.python.ResultUploader import uploadTestToDB, timedUpload
+from Gui.python.TestValidator import timedResultGrader
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Steps that need the power supplies driven from the GUI
+InteractiveSteps = ["IVCurve", "SLDOScan"]
+
+class BatchTestEngine():
+	'''
+	Runs a single or composite test on one FC7 board without any Qt widget.
+	It uses the same building blocks as TestHandler (the per-step sandbox, the
+	firmware state cache, OutputParser, grading, ResultUploader and the run
+	journal) but sequences them on its own, TestHandler keeps its signal
+	driven path. Changes to the step sequence have to be made in both.
+	'''
+	def __init__(self, firmware, testName, connection = None, username = "", rd53Files = {}, resume = True, stepTimeout = None):
+		self.firmware = firmware
+		self.testName = testName
+		self.connection = connection
+		self.username = username
+		self.resume = resume
+		self.stepTimeout = stepTimeout
+		self.firmwareName = firmware.getBoardName()
+		self.boardDir = GetBoardWorkingDir(self.firmwareName)
+		self.updatedXMLValues = defaultdict(dict)
+		self.input_dir = ""
+		self.results = []
+		self.halt = False
+		self.completed = False
+
+		self.ModuleMap = dict()
+		self.rd53_file = {}
+		beboardId = 0
+		for module in self.firmware.getAllModules().values():
+			for i in ModuleLaneMap[module.getModuleType()].keys():
+				key = "{0}_{1}_{2}".format(module.getModuleName(),module.getModuleID(),ModuleLaneMap[module.getModuleType()][i])
+				self.rd53_file[key] = rd53Files.get(key, None)
+			self.ModuleMap["{0}_{1}_{2}".format(beboardId,module.getOpticalGroupID(),module.getModuleID())] = module.getModuleName()
+		for key in self.rd53_file.keys():
+			if self.rd53_file[key] == None:
+				self.rd53_file[key] = os.environ.get('Ph2_ACF_AREA')+"/settings/RD53Files/CMSIT_{0}.txt".format(BoardtypeMap[os.environ.get('Ph2_ACF_VERSION')])
+
+		ModuleType = self.firmware.getModuleByIndex(0).getModuleType()
+		self.firmwareImage = firmware_image[ModuleType][os.environ.get('Ph2_ACF_VERSION')]
+		self.firmwareImagePath = "{0}/FirmwareImages/{1}".format(os.environ.get("GUI_dir"),self.firmwareImage)
+		self.firmwareChecksum = imageChecksum(self.firmwareImagePath)
+		self.FirmwareState = FirmwareStateCache(self.firmwareName, self.boardDir)
+
+	def getSteps(self):
+		if isCompositeTest(self.testName):
+			return CompositeList[self.testName]
+		return [self.testName]
+
+	def run(self):
+		steps = self.getSteps()
+		startIndex = 0
+		journal = None
+		if isCompositeTest(self.testName):
+			modules = [module.getModuleName() for module in self.firmware.getAllModules().values()]
+			journal = RunJournal(self.boardDir, self.testName, modules)
+			resumePoint = journal.getResumePoint(self.rd53_file.keys()) if self.resume else None
+			if resumePoint is not None and resumePoint[0] < len(steps):
+				startIndex, self.input_dir, values = resumePoint
+				self.updatedXMLValues = defaultdict(dict, { key : dict(value) for key, value in values.items() })
+				journal.record = journal.load()
+				logger.info("Resuming {0} at {1}".format(self.testName, steps[startIndex]))
+			else:
+				journal.begin()
+
+		for index in range(startIndex, len(steps)):
+			if self.halt:
+				break
+			stepName = steps[index]
+			if stepName in InteractiveSteps:
+				logger.warning("{} needs the GUI power supply control, skipped in batch mode".format(stepName))
+				output_dir = ""
+			else:
+				output_dir = self.runStep(stepName)
+				if output_dir == "":
+					logger.error("{0} failed on {1}, stopping".format(stepName, self.firmwareName))
+					break
+				self.input_dir = output_dir
+			if journal is not None:
+				journal.recordStep(index, stepName, output_dir, self.updatedXMLValues)
+				if index == len(steps) - 1:
+					journal.finish()
+		else:
+			self.completed = True
+		return self.results
+
+	def runStep(self, stepName):
+		# Checked before anything is configured or loaded on the board
+		if Test[stepName] not in RunnableTests:
+			logger.error("test {} not runnable".format(Test[stepName]))
+			return ""
+		profile = StepProfile(stepName, self.firmwareName)
+		ModuleIDs = [str(module.getModuleName()) for module in self.firmware.getAllModules().values()]
+		output_dir, input_dir = ConfigureTest(stepName, "_Module".join(ModuleIDs), "", self.input_dir, self.connection)
+		if output_dir == "":
+			return ""
+		profile.setOutputDir(output_dir)
+
+		stager = FileStager("configuration of {}".format(stepName))
+		SetupRunSandbox(output_dir, self.boardDir, Stager = stager)
+		if input_dir == "":
+			SetupRD53ConfigfromFile(self.rd53_file, output_dir, Stager = stager)
+		else:
+			SetupRD53Config(input_dir, output_dir, self.rd53_file, Stager = stager)
+		tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp/" + self.firmwareName
+		if not os.path.isdir(tmpDir):
+			os.makedirs(tmpDir)
+		config_file = GenerateXMLConfig(self.firmware, stepName, tmpDir)
+		SetupXMLConfigfromFile(config_file, output_dir, self.firmwareName, self.rd53_file, self.updatedXMLValues, Stager = stager)
+		if not stager.stage():
+			return ""
+		profile.add("staging", stager.getElapsed())
+
+		RunNumber = "-1"
+		if os.path.isfile(output_dir+"/RunNumber.txt"):
+			with open(output_dir+"/RunNumber.txt") as runNumberFile:
+				RunNumber = runNumberFile.readline().strip()
+
+		outputfile = LogWriter(output_dir + "/output.txt")
+		eventLog = RunEventLog(output_dir, stepName, self.firmwareName)
+		startTime = time.time()
+		if not self.prepareFirmware(output_dir, outputfile):
+			outputfile.close()
+			eventLog.close(failed = "firmware")
+			return ""
+		profile.add("firmware", time.time() - startTime)
+
+		returnCode = self.takeData(stepName, output_dir, outputfile, profile, eventLog)
+		outputfile.close()
+		eventLog.close(exitCode = returnCode, halted = self.halt)
+		if returnCode != 0:
+			self.FirmwareState.invalidateLoaded()
+
+		stager = FileStager("results of {}".format(stepName))
+		for key in self.rd53_file.keys():
+			stager.add("{0}/CMSIT_RD53_{1}.txt".format(output_dir,key),"{0}/CMSIT_RD53_{1}_OUT.txt".format(output_dir,key),"move")
+		stager.stage()
+		profile.add("copy", stager.getElapsed())
+		resultFiles = ReleaseRunSandbox(output_dir, self.boardDir)
+		if RunNumber == "-1" and resultFiles != []:
+			RunNumber = os.path.basename(resultFiles[0]).split("_")[0].lstrip("Run")
+		profile.save()
+
+		grade, passmodule = {}, {}
+		try:
+			grade, passmodule, figurelist = timedResultGrader(profile, output_dir, stepName, RunNumber, self.ModuleMap)
+		except Exception as err:
+			logger.error("Grading of {0} failed: {1}".format(stepName, err))
+		if self.connection is not None and isActive(self.connection):
+			try:
+				timedUpload(profile, lambda localDir: uploadTestToDB(self.connection, localDir, self.username), output_dir)
+			except Exception as err:
+				logger.error("DB upload of {0} failed: {1}".format(stepName, err))
+
+		passed = returnCode == 0 and passmodule != {} and all([False not in module.values() for module in passmodule.values()])
+		self.results.append({"test": stepName, "output_dir": output_dir, "grade": grade, "passed": passed, "timing": profile.toDict()})
+		logger.info("{0} on {1}: {2}, {3}".format(stepName, self.firmwareName, "passed" if passed else "failed", profile.summary()))
+		return output_dir
+
+	def runCommand(self, args, workingDir, outputfile, timeout):
+		try:
+			result = subprocess.run(args, cwd=workingDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+		except (OSError, subprocess.TimeoutExpired) as err:
+			logger.error("{0} failed: {1}".format(" ".join(args), err))
+			return None
+		output = result.stdout.decode(errors="replace")
+		outputfile.write(output)
+		if result.returncode != 0:
+			logger.error("{0} exited with {1}".format(" ".join(args), result.returncode))
+			return None
+		return output
+
+	def prepareFirmware(self, workingDir, outputfile):
+		if not self.FirmwareState.isStored(self.firmwareImage, self.firmwareChecksum):
+			fwlist = self.runCommand(["fpgaconfig","-c","CMSIT.xml","-l"], workingDir, outputfile, 30)
+			if fwlist is None:
+				return False
+			if self.firmwareImage not in fwlist:
+				if self.runCommand(["fpgaconfig","-c","CMSIT.xml","-f",self.firmwareImagePath,"-i",self.firmwareImage], workingDir, outputfile, 600) is None:
+					return False
+				self.FirmwareState.invalidateLoaded()
+			self.FirmwareState.setStored(self.firmwareImage, self.firmwareChecksum)
+
+		if self.FirmwareState.isLoaded(self.firmwareImage, self.firmwareChecksum):
+			logger.info("Firmware image {0} already loaded on {1}, skipping reload".format(self.firmwareImage,self.firmwareName))
+			return True
+		if self.runCommand(["fpgaconfig","-c","CMSIT.xml","-i",self.firmwareImage], workingDir, outputfile, 120) is None:
+			return False
+		if self.runCommand(["CMSITminiDAQ","-f","CMSIT.xml","-r"], workingDir, outputfile, 120) is None:
+			return False
+		self.FirmwareState.setLoaded(self.firmwareImage, self.firmwareChecksum)
+		return True
+
+	def killStep(self, process, timedOut):
+		# Runs on the watchdog timer thread
+		if process.poll() is None:
+			timedOut.set()
+			process.kill()
+
+	def takeData(self, stepName, workingDir, outputfile, profile, eventLog):
+		mode = "None"
+		lastReported = -10
+		profile.start("hardware_init")
+		process = subprocess.Popen(["CMSITminiDAQ","-f","CMSIT.xml","-c",Test[stepName]], cwd=workingDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		# A stuck board may stop printing altogether, the deadline does not wait for output
+		timedOut = threading.Event()
+		watchdog = None
+		if self.stepTimeout is not None:
+			watchdog = threading.Timer(self.stepTimeout, self.killStep, [process, timedOut])
+			watchdog.daemon = True
+			watchdog.start()
+		tokenizer = OutputTokenizer(stepName)
+		for rawLine in process.stdout:
+			textStr = rawLine.decode(errors="replace")
+			outputfile.write(textStr)
+			event = tokenizer.tokenize(textStr.rstrip('\n'))
+			eventLog.recordOutputEvent(event)
+			if mode == "Perform":
+				if event.kind == ProgressEvent:
+					progress = event.progress
+					if progress - lastReported >= 10 or progress == 100:
+						logger.info("{0} on {1}: {2:.0f}%".format(stepName, self.firmwareName, progress))
+						lastReported = progress
+					if progress == 100:
+						mode = "Summary"
+						profile.stop("data_taking")
+						profile.start("summary")
+			elif mode == "Summary":
+				if event.kind == RegisterEvent:
+					self.updatedXMLValues[event.chipKey][event.register] = event.value
+					logger.info("New {0} value is {1} for chip {2}".format(event.register, event.value, event.chipKey))
+			elif event.kind == PhaseEvent and event.phase == "perform":
+				mode = "Perform"
+				profile.stop("hardware_init")
+				profile.start("data_taking")
+		returnCode = process.wait()
+		if watchdog is not None:
+			watchdog.cancel()
+		if timedOut.is_set():
+			logger.error("{0} exceeded {1} s, CMSITminiDAQ killed".format(stepName, self.stepTimeout))
+			eventLog.record("interlock", reason = "step timeout")
+			self.halt = True
+		for phase in ["hardware_init", "data_taking", "summary"]:
+			profile.stop(phase)
+		return returnCode
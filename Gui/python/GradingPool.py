@@ -0,0 +1,56 @@
+'''
+  GradingPool.py
+  brief                 Process pool grading the modules of a ROOT file side by side
+  version               0.1
+'''
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from Gui.GUIutils.settings import *
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class GradingPool():
+	'''
+	ROOT holds the GIL while reading and drawing, so modules are graded in
+	worker processes. Workers are spawned, not forked from the Qt process,
+	on first use and kept for the following steps.
+	'''
+	def __init__(self, nWorkers = GradingWorkers):
+		self.nWorkers = nWorkers if nWorkers > 0 else (os.cpu_count() or 1)
+		self.executor = None
+		self.lock = threading.Lock()
+
+	def getExecutor(self):
+		with self.lock:
+			if self.executor is None:
+				self.executor = ProcessPoolExecutor(max_workers=self.nWorkers, mp_context=multiprocessing.get_context("spawn"))
+			return self.executor
+
+	def map(self, function, argsList):
+		'''
+		Returns [function(*args) for args in argsList] computed in the pool, or
+		None if the pool broke down and the caller has to do the work itself.
+		Exceptions raised by function are passed on.
+		'''
+		try:
+			executor = self.getExecutor()
+			futures = [executor.submit(function, *args) for args in argsList]
+			return [future.result() for future in futures]
+		except (BrokenProcessPool, OSError) as err:
+			logger.error("Grading processes failed ({0}), grading in the GUI process".format(err))
+			self.shutdown()
+			return None
+
+	def shutdown(self):
+		with self.lock:
+			executor, self.executor = self.executor, None
+		if executor is not None:
+			executor.shutdown(wait=False)
+
+gradingPool = GradingPool()
@@ -0,0 +1,322 @@
+'''
+  OutputParser.py
+  brief                 Interpretation of CMSITminiDAQ console output
+  version               0.1
+'''
+import re
+import codecs
+
+from Gui.GUIutils.settings import *
+
+ANSIColorCode = re.compile(r'\033\[(\d|;)+?m')
+
+# Value of "... for [board/opticalGroup/hybrid/chip = 0/0/0/1] is 42 ..." lines
+ValueAfterIs = re.compile(r'\]\s*is\s+([-+]?\d+)')
+
+class RegisterRule():
+	'''
+	A Summary line carrying a register value for the next step: the message
+	starts with marker, field picks the value out of the line without colour
+	codes, either as the index of its token or as a regex with one group.
+	'''
+	def __init__(self, marker, register, field = ValueAfterIs, convert = int):
+		self.marker = marker
+		self.register = register
+		self.field = field
+		self.convert = convert
+
+	def extract(self, plain):
+		try:
+			if isinstance(self.field, int):
+				return self.convert(plain.split()[self.field])
+			match = self.field.search(plain)
+			return self.convert(match.group(1)) if match is not None else None
+		except (ValueError, IndexError):
+			return None
+
+# Calibrations tuning registers : rules for the lines announcing the new values
+RegisterRules = {
+	"thradj"         :  [RegisterRule("Global threshold for", "Vthreshold_LIN", -1)],
+	"thrmin"         :  [RegisterRule("Global threshold for", "Vthreshold_LIN", -1)],
+	"gainopt"        :  [RegisterRule("Krummenacher Current", "KRUM_CURR_LIN", -1)],
+	"injdelay"       :  [RegisterRule("New latency dac", "LATENCY_CONFIG", -2), RegisterRule("New injection delay", "INJECTION_SELECT", -2)],
+}
+
+def updateNeeded(testName, textStr):
+	for rule in RegisterRules.get(Test[testName], []):
+		if rule.marker in textStr:
+			return True, rule.register, rule
+	return (False, None, None)
+
+def parseRegisterUpdate(testName, textStr):
+	'''
+	Returns ("hybrid/chip", register, value) for summary lines carrying a
+	register value for the next step, None otherwise
+	'''
+	toUpdate, UpdatedFEKey, rule = updateNeeded(testName, textStr)
+	if not toUpdate:
+		return None
+	UpdatedValue = rule.extract(ANSIColorCode.sub('',textStr))
+	if UpdatedValue is None:
+		return None
+	chipIdentifier = textStr.split('=')[-1].split('is')[0]
+	chipIdentifier = ANSIColorCode.sub('',chipIdentifier).split(']')[0]
+	HybridIDKey = chipIdentifier.split("/")[2]
+	ChipIDKey = chipIdentifier.split("/")[3]
+	return "{}/{}".format(HybridIDKey,ChipIDKey), UpdatedFEKey, UpdatedValue
+
+def parseProgress(textStr):
+	# ">>>> Progress :  42.0%" lines, None for anything else
+	if ">>>> Progress :" not in textStr:
+		return None
+	try:
+		index = textStr.split().index("Progress")+2
+		return float(textStr.split()[index].rstrip("%"))
+	except (ValueError, IndexError):
+		return None
+
+# Longest partial line kept while waiting for its newline
+MaxLineLength = 1 << 16
+
+class LineAssembler():
+	'''
+	Turns the chunks read from a QProcess or pipe into complete lines. A line
+	split over two reads is held back until its newline arrives, multi-byte
+	characters split over two reads are decoded once complete. Only a line
+	longer than maxLength is passed on in pieces, nothing is ever dropped.
+	'''
+	def __init__(self, maxLength = MaxLineLength):
+		self.maxLength = maxLength
+		self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+		self.tail = ""
+		self.nLines = 0
+		self.nOversized = 0
+
+	def decode(self, data):
+		if isinstance(data, str):
+			return data
+		return self.decoder.decode(data)
+
+	def feed(self, text):
+		# text as returned by decode(), returns the lines completed by it
+		if text == "":
+			return []
+		lines = (self.tail + text).split('\n')
+		self.tail = lines.pop()
+		if len(self.tail) > self.maxLength:
+			self.nOversized += 1
+			lines.append(self.tail)
+			self.tail = ""
+		self.nLines += len(lines)
+		return [line[:-1] if line.endswith('\r') else line for line in lines]
+
+	def flush(self):
+		# Unterminated last line once the process has finished
+		self.tail += self.decoder.decode(b"", final=True)
+		self.decoder.reset()
+		if self.tail == "":
+			return []
+		line, self.tail = self.tail, ""
+		self.nLines += 1
+		return [line]
+
+	def pending(self):
+		return len(self.tail)
+
+##########################################################################
+##  Single pass tokenizer
+##########################################################################
+
+# Any escape sequence: colours (m) and cursor movements (A)
+ANSISequence = re.compile(r'\x1b\[([\d;]*)([A-Za-z])')
+# Ph2_ACF log prefix, "||I| " and the like
+SeverityPrefix = re.compile(r'\|{1,2}([DIWEF])\|')
+SeverityLevel = {"D": "debug", "I": "info", "W": "warning", "E": "error", "F": "fatal"}
+ChipPath = re.compile(r'=\s*(\d+)/(\d+)/(\d+)/(\d+)\s*\]')
+# Log prefix and colour codes in front of the message text
+MessageStart = re.compile(r'\s*(?:\|{1,2}[DIWEF]\|)?\s*(?:\x1b\[[\d;]*m\s*)*')
+
+class RegisterMatcher():
+	'''
+	RegisterRules of one calibration indexed by the first word of their
+	marker. A line costs one anchored match and one dict lookup, the rules
+	are only tried on lines whose message starts with one of those words.
+	'''
+	def __init__(self, calibration):
+		self.index = {}
+		for rule in RegisterRules.get(calibration, []):
+			self.index.setdefault(rule.marker.split()[0], []).append(rule)
+
+	def match(self, textStr):
+		# Returns (rule, plain line) or (None, None)
+		if self.index == {}:
+			return None, None
+		start = MessageStart.match(textStr).end()
+		end = textStr.find(' ', start)
+		rules = self.index.get(textStr[start:end] if end >= 0 else textStr[start:])
+		if rules is None:
+			return None, None
+		plain = ANSISequence.sub('', textStr[start:])
+		for rule in rules:
+			if plain.startswith(rule.marker):
+				return rule, plain
+		return None, None
+
+# Same conversion as ANSIColoringParser.parseANSI, in one pass over the line
+ANSIHtml = {
+	'0m'   :  '</span>',
+	'1m'   :  '<b>',
+	'31m'  :  '</span><span style="color:#ff0000;">',
+	'32m'  :  '</span><span style="color:#00ff00;">',
+	'33m'  :  '</span><span style="color:#ffff00;">',
+	'34m'  :  '</span><span style="color:#0000ff;">',
+	'35m'  :  '</span><span style="color:#ff00ff;">',
+	'36m'  :  '</span><span style="color:#00ffff;">',
+	'37m'  :  '</span><span style="color:#000000;">',
+	'A'    :  '',
+}
+HtmlToken = re.compile(r'\x1b\[([\d;]*[A-Za-z])|<|>|\x1b')
+HtmlEscape = {'<': '&#60;', '>': '&#62;', '\x1b': ''}
+
+def htmlReplace(match):
+	code = match.group(1)
+	if code is None:
+		return HtmlEscape[match.group(0)]
+	return ANSIHtml.get(code, '[' + code)
+
+def ansiToHtml(textStr):
+	html = HtmlToken.sub(htmlReplace, textStr).replace('</span>', '', 1)
+	if '<b>' in html:
+		html += '</b>'
+	return html + '\n'
+
+PhaseEvent = "phase"
+ProgressEvent = "progress"
+RegisterEvent = "register"
+LogEvent = "log"
+
+ProgressMarker = '>>>> Progress :'
+ProgressValue = re.compile(r'>>>> Progress :[ \t]*([-+\d.]+)%')
+
+class OutputEvent():
+	__slots__ = ("kind", "line", "severity", "phase", "progress", "chipKey", "register", "value")
+
+	def __init__(self, kind, line):
+		self.kind = kind
+		self.line = line
+		self.severity = None
+		# "configure" or "perform" for phase events
+		self.phase = None
+		self.progress = None
+		# "hybrid/chip", as used by updatedXMLValues
+		self.chipKey = None
+		self.register = None
+		self.value = None
+
+	def getSeverity(self):
+		if self.severity is None:
+			severity = SeverityPrefix.search(self.line)
+			self.severity = SeverityLevel[severity.group(1)] if severity is not None else "info"
+		return self.severity
+
+	def getNumUp(self):
+		# Lines the console cursor moves up before this one is printed
+		return self.line.count('\x1b[A')
+
+	def toHtml(self):
+		return ansiToHtml(self.line)
+
+class OutputTokenizer():
+	'''
+	Turns CMSITminiDAQ output into typed OutputEvents. The tokenizer follows
+	the run phases itself and only looks for what the current phase can hold:
+	phase markers, progress lines while data is taken, register values in the
+	summary. While data is taken whole chunks are scanned at once for progress
+	lines, nothing else of that phase is displayed.
+	'''
+	def __init__(self, testName, quietDataTaking = True):
+		self.testName = testName
+		self.quietDataTaking = quietDataTaking
+		self.phase = "none"
+		self.registers = RegisterMatcher(Test.get(testName, ""))
+
+	def tokenizeLines(self, lines):
+		events = []
+		index = 0
+		while index < len(lines):
+			if self.phase == "perform" and self.quietDataTaking:
+				index = self.scanDataTaking(lines, index, events)
+			else:
+				events.append(self.tokenize(lines[index]))
+				index += 1
+		return events
+
+	def scanDataTaking(self, lines, start, events):
+		# Only progress lines count while data is taken and the progress bar
+		# only shows the latest value: one event per chunk carries it, or the
+		# final 100% that ends the phase. Returns the index of the next line.
+		block = '\n'.join(lines[start:]) if start > 0 else '\n'.join(lines)
+		last = None
+		position = block.find(ProgressMarker)
+		while position >= 0:
+			valueStart = position + len(ProgressMarker)
+			valueEnd = block.find('%', valueStart, valueStart + 32)
+			position = block.find(ProgressMarker, valueStart)
+			try:
+				value = float(block[valueStart:valueEnd])
+			except ValueError:
+				continue
+			last = (valueStart, value)
+			if value == 100:
+				break
+		if last is None:
+			return len(lines)
+
+		lineStart = block.rfind('\n', 0, last[0]) + 1
+		lineEnd = block.find('\n', last[0])
+		event = OutputEvent(ProgressEvent, block[lineStart:] if lineEnd < 0 else block[lineStart:lineEnd])
+		event.progress = last[1]
+		events.append(event)
+		if event.progress != 100:
+			return len(lines)
+		self.phase = "summary"
+		return start + block.count('\n', 0, lineStart) + 1
+
+	def tokenize(self, textStr):
+		if '@@@' in textStr:
+			if "@@@ Initializing the Hardware @@@" in textStr:
+				return self.phaseEvent(textStr, "configure")
+			if "@@@ Performing" in textStr:
+				return self.phaseEvent(textStr, "perform")
+		elif '>>>>' in textStr:
+			match = ProgressValue.search(textStr)
+			if match is not None:
+				try:
+					event = OutputEvent(ProgressEvent, textStr)
+					event.progress = float(match.group(1))
+				except ValueError:
+					return OutputEvent(LogEvent, textStr)
+				if event.progress == 100 and self.phase == "perform":
+					self.phase = "summary"
+				return event
+		elif self.phase == "summary":
+			rule, plain = self.registers.match(textStr)
+			if rule is not None:
+				return self.registerEvent(textStr, plain, rule)
+		return OutputEvent(LogEvent, textStr)
+
+	def phaseEvent(self, textStr, phase):
+		self.phase = phase
+		event = OutputEvent(PhaseEvent, textStr)
+		event.phase = phase
+		return event
+
+	def registerEvent(self, textStr, plain, rule):
+		event = OutputEvent(LogEvent, textStr)
+		chip = ChipPath.search(plain)
+		event.value = rule.extract(plain)
+		if chip is not None and event.value is not None:
+			event.kind = RegisterEvent
+			event.chipKey = "{}/{}".format(chip.group(3), chip.group(4))
+			event.register = rule.register
+		return event
@@ -0,0 +1,216 @@
+'''
+  PlotCache.py
+  brief                 Rendered plots kept on disk, keyed by what they were drawn from
+  version               0.1
+
+  The file name of a plot is the hash of the source ROOT file content, the
+  canvas path, the format and the size, so a canvas is drawn once however
+  often it is graded or opened. The least recently used plots are removed
+  once the cache grows beyond PlotCacheSize MB, except those waiting to be
+  rendered or on screen.
+'''
+import os
+import time
+import hashlib
+import weakref
+import threading
+
+from Gui.GUIutils.settings import *
+from Gui.python.ROOTInterface import TCanvas2SVG, TCanvas2JPG, TCanvas2PNG
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Renders written by TCanvas2SVG/TCanvas2JPG without a name, before the cache
+LegacyDisplayFiles = ("display",)
+
+def plotFormat(canvasPath, zoomLevel = 0):
+	'''
+	Format and size a canvas is rendered with. The 2D maps of RasterPlots
+	hold a box per pixel, as SVG they are slow to write and slower to show.
+	'''
+	fields = canvasPath.split("/")[-1].split("_")
+	if len(fields) > 4 and fields[4] in RasterPlots:
+		return "png", (RasterSize[0] << zoomLevel, RasterSize[1] << zoomLevel)
+	return "svg", None
+
+def fileDigest(fileName, block = 1 << 20):
+	md5 = hashlib.md5()
+	with open(fileName, 'rb') as sourceFile:
+		for data in iter(lambda: sourceFile.read(block), b''):
+			md5.update(data)
+	return md5.hexdigest()
+
+class PlotCache():
+	def __init__(self, cacheDir = None, maxSize = PlotCacheSize):
+		if cacheDir is None:
+			cacheDir = os.environ.get('GUI_dir', '.') + "/Gui/.tmp/plots"
+		self.cacheDir = cacheDir
+		self.maxSize = maxSize * (1 << 20)
+		self.lock = threading.Lock()
+		# (file, size, mtime) : digest, a result file is hashed once per session
+		self.digests = {}
+		# Bytes in the cache, counted on first use
+		self.usage = None
+		# Functions returning the plots in use, these are never evicted. Methods
+		# are held weakly, a closed window does not pin its plots any more.
+		self.pinners = []
+
+	def pin(self, pinner):
+		if hasattr(pinner, "__self__"):
+			self.pinners.append(weakref.WeakMethod(pinner))
+		else:
+			self.pinners.append(lambda: pinner)
+
+	def pinned(self):
+		plots = set()
+		for reference in list(self.pinners):
+			pinner = reference()
+			if pinner is None:
+				self.pinners.remove(reference)
+				continue
+			plots.update([os.path.realpath(plot) for plot in pinner()])
+		return plots
+
+	def sourceDigest(self, sourceFile):
+		try:
+			status = os.stat(sourceFile)
+		except OSError:
+			return None
+		key = (os.path.realpath(sourceFile), status.st_size, status.st_mtime_ns)
+		with self.lock:
+			digest = self.digests.get(key)
+		if digest is None:
+			try:
+				digest = fileDigest(sourceFile)
+			except OSError as err:
+				logger.warning("Unable to read {0}: {1}".format(sourceFile, err))
+				return None
+			with self.lock:
+				self.digests[key] = digest
+		return digest
+
+	def plotFile(self, sourceFile, canvasPath, format = "svg", size = None, digest = None):
+		'''
+		File the canvas at canvasPath of sourceFile is cached in, None if the
+		source cannot be read. size is (width, height) in pixels, None for the
+		size the canvas was saved with.
+		'''
+		if digest is None:
+			digest = self.sourceDigest(sourceFile)
+		if digest is None:
+			return None
+		sizeKey = "native" if size is None else "{0}x{1}".format(*size)
+		key = hashlib.md5("{0}|{1}|{2}|{3}".format(digest, canvasPath, format, sizeKey).encode()).hexdigest()
+		return "{0}/{1}.{2}".format(self.cacheDir, key, format)
+
+	def lookup(self, outputFile):
+		# True if outputFile is cached, it then counts as just used
+		try:
+			os.utime(outputFile)
+			return True
+		except OSError:
+			return False
+
+	def store(self, canvas, outputFile, size = None):
+		'''
+		Renders canvas to outputFile, PNGs within size. Drawn under a name of
+		its own first, a plot in the cache is always complete, also with
+		several renderers.
+		'''
+		outputDir, fileName = os.path.split(outputFile)
+		name, format = os.path.splitext(fileName)
+		os.makedirs(outputDir, exist_ok=True)
+		partName = "{0}.part{1}_{2}".format(name, os.getpid(), threading.get_ident())
+		if format == ".png":
+			partFile = TCanvas2PNG(outputDir, canvas, partName, size)
+		elif format == ".jpg":
+			partFile = TCanvas2JPG(outputDir, canvas, partName)
+		else:
+			partFile = TCanvas2SVG(outputDir, canvas, partName)
+		try:
+			os.replace(partFile, outputFile)
+		except OSError as err:
+			logger.warning("Failed to cache {0}: {1}".format(outputFile, err))
+			return None
+		return outputFile
+
+	def added(self, outputFile):
+		# Books a plot stored by any process, evicts once over the limit
+		try:
+			size = os.path.getsize(outputFile)
+		except OSError:
+			return
+		with self.lock:
+			if self.usage is None:
+				self.usage = self.scan()
+			else:
+				self.usage += size
+			if self.usage > self.maxSize:
+				self.evict()
+
+	def scan(self):
+		# Called with the lock held
+		self.removeLegacyFiles()
+		usage = 0
+		try:
+			with os.scandir(self.cacheDir) as entries:
+				for entry in entries:
+					if entry.is_file():
+						usage += entry.stat().st_size
+		except OSError:
+			pass
+		return usage
+
+	def evict(self):
+		'''
+		Removes the least recently used plots down to 90% of the limit, so
+		that the directory is not scanned again after every render. Pinned
+		plots are kept even if the limit cannot be met without them.
+		Called with the lock held.
+		'''
+		plots = []
+		now = time.time()
+		pinned = self.pinned()
+		try:
+			with os.scandir(self.cacheDir) as entries:
+				for entry in entries:
+					if not entry.is_file():
+						continue
+					status = entry.stat()
+					# Parts of renders still running are left alone for a while
+					if ".part" in entry.name and now - status.st_mtime < 3600:
+						continue
+					plots.append((status.st_mtime, status.st_size, entry.path))
+		except OSError as err:
+			logger.warning("Unable to clean {0}: {1}".format(self.cacheDir, err))
+			return
+		plots.sort()
+		self.usage = sum([plot[1] for plot in plots])
+		target = self.maxSize * 0.9
+		removed = 0
+		for mtime, size, path in plots:
+			if self.usage <= target:
+				break
+			if os.path.realpath(path) in pinned:
+				continue
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			self.usage -= size
+			removed += 1
+		logger.info("Removed {0} plots from {1}, {2:.0f} MB left".format(removed, self.cacheDir, self.usage / (1 << 20)))
+
+	def removeLegacyFiles(self):
+		tmpDir = os.path.dirname(self.cacheDir)
+		try:
+			with os.scandir(tmpDir) as entries:
+				for entry in entries:
+					if entry.is_file() and entry.name.startswith(LegacyDisplayFiles) and entry.name.endswith((".svg", ".jpg", ".png")):
+						os.remove(entry.path)
+		except OSError:
+			pass
+
+plotCache = PlotCache()
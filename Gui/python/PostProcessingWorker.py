@@ -0,0 +1,118 @@
+'''
+  PostProcessingWorker.py
+  brief                 Background grading and DB upload of finished test steps
+  version               0.1
+'''
+import threading
+from collections import deque
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+
+from Gui.GUIutils.guiUtils import isActive
+from Gui.python.TestValidator import timedResultGrader
+from Gui.python.ResultUploader import timedUpload
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class PostProcessingJob():
+	'''
+	Everything needed to grade and upload one step, copied when the step ends
+	since the TestHandler moves on to the next step right away.
+	'''
+	def __init__(self, step, testName, output_dir, RunNumber, ModuleMap, upload = None, profile = None):
+		self.step = step
+		self.testName = testName
+		self.output_dir = output_dir
+		self.RunNumber = RunNumber
+		self.ModuleMap = dict(ModuleMap)
+		# Called as upload(output_dir, connection) after grading with the
+		# worker's own DB connection, may raise
+		self.upload = upload
+		self.profile = profile
+		self.grade = {}
+		self.passmodule = {}
+		self.figurelist = {}
+		self.gradeError = ""
+		self.uploadError = ""
+
+	def isPassed(self):
+		for module in self.passmodule.values():
+			if False in module.values():
+				return False
+		return True
+
+class PostProcessingWorker(QThread):
+	'''
+	Processes jobs one at a time in submission order, so results reach the
+	GUI in step order. The thread stops when idle and restarts on submit.
+	mysql connections must not be shared between threads, uploads go
+	through a connection of this worker, opened by connect() when needed
+	and closed when idle.
+	'''
+	jobGraded = pyqtSignal(object)
+	jobFinished = pyqtSignal(object)
+
+	def __init__(self, connect = None):
+		super(PostProcessingWorker,self).__init__()
+		self.jobs = deque()
+		self.lock = threading.Lock()
+		self.active = False
+		self.connect = connect
+		self.connection = None
+
+	def getConnection(self):
+		if self.connection is None or not isActive(self.connection):
+			self.connection = self.connect() if self.connect is not None else None
+		if self.connection is None:
+			raise IOError("No database connection")
+		return self.connection
+
+	def closeConnection(self):
+		if self.connection is not None:
+			try:
+				self.connection.close()
+			except Exception as err:
+				logger.warning("Closing the DB connection failed: {}".format(err))
+			self.connection = None
+
+	def submit(self, job):
+		with self.lock:
+			self.jobs.append(job)
+			if not self.active:
+				self.active = True
+				# A previous run may still be returning after releasing the lock
+				self.wait()
+				self.start()
+
+	def pending(self):
+		with self.lock:
+			return len(self.jobs) + (1 if self.active else 0)
+
+	def run(self):
+		while True:
+			with self.lock:
+				if len(self.jobs) == 0:
+					self.active = False
+					break
+				job = self.jobs.popleft()
+
+			try:
+				job.grade, job.passmodule, job.figurelist = timedResultGrader(job.profile, job.output_dir, job.testName, job.RunNumber, job.ModuleMap)
+			except Exception as err:
+				job.gradeError = repr(err)
+				logger.error("Grading of {0} failed: {1}".format(job.step, err))
+			self.jobGraded.emit(job)
+
+			if job.upload is not None:
+				try:
+					connection = self.getConnection()
+					timedUpload(job.profile, lambda output_dir: job.upload(output_dir, connection), job.output_dir)
+				except Exception as err:
+					job.uploadError = repr(err)
+					logger.error("DB upload of {0} failed: {1}".format(job.step, err))
+			self.jobFinished.emit(job)
+		# Only this thread uses the connection
+		self.closeConnection()
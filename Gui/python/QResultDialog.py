@@ -8,6 +8,8 @@ from PyQt5.QtWidgets import (QApplication, QButtonGroup, QCheckBox, QComboBox, Q
 		QVBoxLayout, QWidget, QMainWindow, QMessageBox)
 from PyQt5 import QtSvg
 
+from Gui.QtGUIutils.QtPlotView import QtPlotView
+
 import sys
 import os
 import re
@@ -29,7 +31,7 @@ class QResultDialog(QDialog):
 		self.DisplayLabel.setScaledContents(True)
 		#image = QImage(imagefile).scaled(QSize(300,300), Qt.KeepAspectRatio, Qt.SmoothTransformation)
 		#pixmap = QPixmap.fromImage(image)
-		self.DisplayView = QtSvg.QSvgWidget()
+		self.DisplayView = QtPlotView()
 		self.DisplayView.load(imagefile)
 		#self.DisplayView = QPixmap(imagefile).scaled(QSize(self.DisplayW,self.DisplayH), Qt.KeepAspectRatio, Qt.SmoothTransformation)
 		#self.DisplayLabel.setPixmap(self.DisplayView)
@@ -1,21 +1,60 @@
-import ROOT
+import re
 import time
+import numpy
+import threading
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-ROOT.gROOT.SetBatch(ROOT.kTRUE)
+try:
+	import uproot
+except ImportError:
+	uproot = None
+
+# PyROOT takes seconds to load, it is imported by loadROOT() once a canvas
+# has to be drawn. Histograms for grading are read with uproot if installed.
+ROOT = None
+ROOTLock = threading.Lock()
+
+def loadROOT():
+	global ROOT
+	with ROOTLock:
+		if ROOT is None:
+			import ROOT
+			ROOT.gROOT.SetBatch(ROOT.kTRUE)
+			if hasattr(ROOT, "EnableThreadSafety"):
+				ROOT.EnableThreadSafety()
+	return ROOT
+
+# Time spent drawing canvases to files, kept per thread so that grading on
+# several threads can each report its own rendering time
+RenderClock = threading.local()
+
+def resetRenderTime():
+	RenderClock.elapsed = 0.0
+
+def getRenderTime():
+	return getattr(RenderClock, "elapsed", 0.0)
+
+def addRenderTime(seconds):
+	RenderClock.elapsed = getRenderTime() + seconds
 
 class Node():
-	def __init__(self, keyname, obj, className):
+	'''
+	Entry of a ROOT file. The object is only read from its key when asked for
+	and dropped again by release(), sub-directories are listed on first use.
+	'''
+	def __init__(self, keyname, obj, className, key = None, reader = None, path = None):
 		self.KeyName = keyname
 		self.ClassName = className
 		self.Obj = obj
-		self.Daughters = []
-
+		self.Key = key
+		self.Reader = reader
+		self.Path = path if path is not None else keyname
+		self.Daughters = [] if reader is None else None
 
 	def appendDaugther(self,node):
-		self.Daughters.append(node)
+		self.getDaugthers().append(node)
 
 	def getKeyName(self):
 		return self.KeyName
@@ -23,51 +62,208 @@ class Node():
 	def getClassName(self):
 		return self.ClassName
 
+	def getPath(self):
+		return self.Path
+
 	def getObject(self):
+		if self.Obj is None and self.Key is not None:
+			self.Obj = self.Reader.readKey(self.Key, self.ClassName)
 		return self.Obj
-	
+
+	def getCanvas(self):
+		# The canvas as a PyROOT object, to be drawn
+		if self.Reader is None:
+			return self.Obj
+		return self.Reader.readCanvas(self)
+
+	def getHistogram(self, name):
+		# HistogramData of the histogram name drawn in this canvas, None if there is none
+		if self.Reader is None:
+			hist = self.Obj.GetPrimitive(name)
+			return ReadHistogram(hist) if hist else None
+		return self.Reader.readHistogram(self, name)
+
+	def release(self):
+		if self.Key is not None:
+			self.Obj = None
+
 	def getDaugthers(self):
+		if self.Daughters is None:
+			self.Daughters = []
+			if self.ClassName == "TDirectoryFile":
+				self.Daughters = self.Reader.listKeys(self.getObject(), self.Path)
 		return self.Daughters
 
+def takeOwnership(obj):
+	# Owned by Python from now on, freed with its last reference and not with the file
+	loadROOT()
+	if obj.InheritsFrom("TH1"):
+		obj.SetDirectory(ROOT.nullptr)
+	ROOT.SetOwnership(obj, True)
+	return obj
 
-def GetSubDirectory(obj, node):
-	ListOfSubNodes = obj.GetListOfKeys()
+def readKey(key, className):
+	obj = key.ReadObj()
+	if className == "TDirectoryFile":
+		# Belongs to the file
+		return obj
+	return takeOwnership(obj)
 
-	for key in ListOfSubNodes:
-		obj = key.ReadObj()
-		keyName = str(key.GetName())
-		className = key.GetClassName()
-		subNode = Node(keyName,obj,className)
-		node.appendDaugther(subNode)
+class ROOTFile():
+	'''
+	Lazy view of a ROOT file, only keys of the given classes (TCanvas, ...)
+	or with names matching namePattern are listed, directories are always
+	followed. Closing it releases every object read and closes the TFile:
+
+		with ROOTFile(fileName, classNames = ["TCanvas"]) as Nodes:
+			...
+	'''
+	def __init__(self, fileName, classNames = None, namePattern = None):
+		self.fileName = fileName
+		self.classNames = classNames
+		self.namePattern = re.compile(namePattern) if namePattern is not None else None
+		self.file = None
+		self.nodes = []
+
+	def __enter__(self):
+		return self.open()
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def open(self):
+		loadROOT()
+		self.file = ROOT.TFile.Open(self.fileName,"READ")
+		if not self.file or self.file.IsZombie():
+			self.file = None
+			raise IOError("File: {0} not opened".format(self.fileName))
+		return self.listKeys(self.file, "")
+
+	def accepts(self, keyName, className):
 		if className == "TDirectoryFile":
-			GetSubDirectory(obj,subNode)
-
-def GetDirectory(inputFile):
-	ROOT_Nodes = []
-
-	try:   
-		openFile = ROOT.TFile.Open(inputFile,"READ")
-	except IOError:
-		print("File: {0} not opened".format(inputFile))
-
-	ListOfRoots = openFile.GetListOfKeys()
-
-	for key in ListOfRoots:
-		obj = key.ReadObj()
-		keyName = key.GetName()
-		className = key.GetClassName()
-		node = Node(keyName,obj,className)
-		ROOT_Nodes.append(node)
-		if key.GetClassName() == "TDirectoryFile":
-			GetSubDirectory(obj,node)
-	
-	return  ROOT_Nodes
+			return True
+		if self.classNames is not None and className not in self.classNames:
+			return False
+		return self.namePattern is None or self.namePattern.search(keyName) is not None
+
+	def listKeys(self, directory, path):
+		nodes = []
+		for key in directory.GetListOfKeys():
+			keyName = str(key.GetName())
+			className = str(key.GetClassName())
+			if self.accepts(keyName, className):
+				nodes.append(Node(keyName, None, className, key, self, "{0}/{1}".format(path, keyName) if path else keyName))
+		self.nodes += nodes
+		return nodes
+
+	def readKey(self, key, className):
+		return readKey(key, className)
+
+	def readCanvas(self, node):
+		return node.getObject()
+
+	def readHistogram(self, node, name):
+		hist = node.getObject().GetPrimitive(name)
+		data = ReadHistogram(hist) if hist else None
+		node.release()
+		return data
+
+	def close(self):
+		for node in self.nodes:
+			node.release()
+		self.nodes = []
+		if self.file is not None:
+			self.file.Close()
+			self.file = None
+
+class UprootFile(ROOTFile):
+	'''
+	ROOTFile read with uproot, without PyROOT. Keys are listed and
+	histograms read as NumPy arrays, canvases to be drawn are read again
+	with PyROOT.
+	'''
+	def open(self):
+		try:
+			self.file = uproot.open(self.fileName)
+		except Exception as err:
+			self.file = None
+			raise IOError("File: {0} not opened ({1})".format(self.fileName, err))
+		return self.listKeys(self.file, "")
+
+	def listKeys(self, directory, path):
+		nodes = []
+		# One node per name, as for PyROOT the highest cycle is read
+		for keyName in dict.fromkeys(directory.keys(recursive=False, cycle=False)):
+			className = directory.classname_of(keyName)
+			if className == "TDirectory":
+				className = "TDirectoryFile"
+			if self.accepts(keyName, className):
+				nodes.append(Node(keyName, None, className, (directory, keyName), self, "{0}/{1}".format(path, keyName) if path else keyName))
+		self.nodes += nodes
+		return nodes
+
+	def readKey(self, key, className):
+		directory, keyName = key
+		return directory[keyName]
+
+	def readCanvas(self, node):
+		return ReadObject(self.fileName, node.getPath())
+
+	def readHistogram(self, node, name):
+		try:
+			for primitive in node.getObject().member("fPrimitives"):
+				if primitive.classname.startswith(("TH1","TH2")) and primitive.member("fName") == name:
+					return UprootHistogram(primitive)
+			return None
+		except Exception as err:
+			# Classes uproot cannot stream yet
+			logger.warning("uproot failed on {0} ({1}), reading it with PyROOT".format(node.getPath(), err))
+			canvas = self.readCanvas(node)
+			hist = canvas.GetPrimitive(name) if canvas else None
+			return ReadHistogram(hist) if hist else None
+		finally:
+			node.release()
+
+	def close(self):
+		for node in self.nodes:
+			node.release()
+		self.nodes = []
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+def HistogramFile(fileName, classNames = None, namePattern = None):
+	# ROOTFile for listing keys and reading histograms, PyROOT is only used without uproot
+	if uproot is not None:
+		return UprootFile(fileName, classNames, namePattern)
+	return ROOTFile(fileName, classNames, namePattern)
+
+def GetDirectory(inputFile, classNames = None, namePattern = None):
+	# The file stays open as long as the nodes are used, see ROOTFile to close it
+	try:
+		return ROOTFile(inputFile, classNames, namePattern).open()
+	except IOError as err:
+		print(err)
+		return []
+
+def ReadObject(inputFile, path):
+	# A single object, e.g. a canvas picked in the result tree, the file is closed right away
+	rootFile = ROOTFile(inputFile)
+	try:
+		rootFile.open()
+		obj = rootFile.file.Get(path)
+		return takeOwnership(obj) if obj else None
+	except IOError as err:
+		print(err)
+		return None
+	finally:
+		rootFile.close()
 
 def DirectoryVLR(node,depth):
 	nodeName = "-"*depth + node.getKeyName()
 	print(nodeName+";"+node.getClassName())
 	if node.getClassName() == "TCanvas":
-		obj = node.getObject()
+		obj = node.getCanvas()
 		obj.SetBatch(ROOT.kTRUE)
 		obj.Draw()
 		obj.SaveAs(node.getKeyName()+".jpg")
@@ -85,6 +281,8 @@ def TCanvas2JPG(outputDir, canvas, name = None):
 		outputFile = outputDir+"/display{}.jpg".format(seconds)
 	else:
 		outputFile = outputDir+"/{}.jpg".format(name)
+	loadROOT()
+	startTime = time.time()
 	try:
 		canvas.SetBatch(ROOT.kTRUE)
 		canvas.Draw()
@@ -93,6 +291,29 @@ def TCanvas2JPG(outputDir, canvas, name = None):
 		logger.info(outputFile + " is saved")
 	except:
 		logger.warning("Failed to save "+ outputFile)
+	addRenderTime(time.time() - startTime)
+	return outputFile
+
+def TCanvas2PNG(outputDir, canvas, name = None, size = None):
+	# size (width, height) in pixels bounds the image, the canvas keeps its aspect ratio
+	if not name:
+		seconds = time.time()
+		outputFile = outputDir+"/display{}.png".format(seconds)
+	else:
+		outputFile = outputDir+"/{}.png".format(name)
+	loadROOT()
+	startTime = time.time()
+	try:
+		canvas.SetBatch(ROOT.kTRUE)
+		if size is not None:
+			scale = min(float(size[0])/canvas.GetWw(), float(size[1])/canvas.GetWh())
+			canvas.SetCanvasSize(int(canvas.GetWw()*scale), int(canvas.GetWh()*scale))
+		canvas.Draw()
+		canvas.Print(outputFile)
+		logger.info(outputFile + " is saved")
+	except:
+		logger.warning("Failed to save "+ outputFile)
+	addRenderTime(time.time() - startTime)
 	return outputFile
 
 def TCanvas2SVG(outputDir, canvas, name = None):
@@ -101,6 +322,8 @@ def TCanvas2SVG(outputDir, canvas, name = None):
 		outputFile = outputDir+"/display{}.svg".format(seconds)
 	else:
 		outputFile = outputDir+"/{}.svg".format(name)
+	loadROOT()
+	startTime = time.time()
 	try:
 		canvas.SetBatch(ROOT.kTRUE)
 		canvas.Draw()
@@ -109,9 +332,79 @@ def TCanvas2SVG(outputDir, canvas, name = None):
 		logger.info(outputFile + " is saved")
 	except:
 		logger.warning("Failed to save "+ outputFile)
+	addRenderTime(time.time() - startTime)
 	return outputFile
 
+# Storage type of the bin contents, for reading them in one go
+HistDataType = {
+	"TH1F"  :  numpy.float32,
+	"TH1D"  :  numpy.float64,
+	"TH1I"  :  numpy.int32,
+	"TH1S"  :  numpy.int16,
+	"TH1C"  :  numpy.int8,
+	"TH2F"  :  numpy.float32,
+	"TH2D"  :  numpy.float64,
+	"TH2I"  :  numpy.int32,
+	"TH2S"  :  numpy.int16,
+	"TH2C"  :  numpy.int8,
+}
+
+def HistToArray(hist):
+	'''
+	Bin contents of a TH1 or TH2 as a float64 array, under- and overflow bins
+	included, so that array[x] == hist.GetBinContent(x) and
+	array[y][x] == hist.GetBinContent(x,y)
+	'''
+	nX = hist.GetNbinsX()+2
+	shape = (hist.GetNbinsY()+2, nX) if hist.GetDimension() == 2 else (nX,)
+	nBins = int(numpy.prod(shape))
+	dataType = HistDataType.get(hist.ClassName())
+	if dataType is not None:
+		try:
+			buffer = hist.GetArray()
+			buffer.reshape((nBins,))
+			return numpy.frombuffer(buffer, dtype=dataType, count=nBins).astype(numpy.float64).reshape(shape)
+		except (AttributeError, TypeError, ValueError) as err:
+			logger.debug("No buffer access to {0}: {1}".format(hist.GetName(), err))
+	# Other classes and PyROOT versions without buffer access
+	if len(shape) == 2:
+		return numpy.array([[hist.GetBinContent(x,y) for x in range(nX)] for y in range(shape[0])], dtype=numpy.float64)
+	return numpy.array([hist.GetBinContent(x) for x in range(nX)], dtype=numpy.float64)
+
+class HistogramData():
+	'''
+	What grading needs of a histogram, as arrays: the bin contents (see
+	HistToArray) and the sums [sumw, sumw2, sumwx, sumwx2] behind GetMean
+	and GetStdDev.
+	'''
+	def __init__(self, contents, stats):
+		self.contents = contents
+		self.stats = stats
+
+def ReadHistogram(hist):
+	# TH1::kNstat entries at most
+	stats = numpy.zeros(13)
+	hist.GetStats(stats)
+	return HistogramData(HistToArray(hist), stats[:4].copy())
+
+def UprootHistogram(hist):
+	# What ReadHistogram gives for a TH1 or TH2 read by uproot
+	contents = numpy.asarray(hist.values(flow=True), dtype=numpy.float64)
+	errors = numpy.asarray(hist.errors(flow=True), dtype=numpy.float64)
+	if contents.ndim == 2:
+		# uproot indexes [xbin][ybin]
+		contents, errors = contents.T, errors.T
+	stats = numpy.array([hist.member(name) for name in ("fTsumw","fTsumw2","fTsumwx","fTsumwx2")], dtype=numpy.float64)
+	if stats[0] == 0 and hist.member("fEntries") > 0:
+		# Filled with SetBinContent, TH1::GetStats sums up the bins instead
+		inner = (slice(1,-1),)*contents.ndim
+		weights = contents[inner]
+		centers = numpy.asarray(hist.axis(0).centers(flow=False), dtype=numpy.float64)
+		stats = numpy.array([weights.sum(), (errors[inner]**2).sum(), (weights*centers).sum(), (weights*centers**2).sum()])
+	return HistogramData(numpy.ascontiguousarray(contents), stats)
+
 def GetBinary(fileName):
+	loadROOT()
 	binaryData = ROOT.TFile(fileName)
 	return binaryData	
 
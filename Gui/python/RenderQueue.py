@@ -0,0 +1,160 @@
+'''
+  RenderQueue.py
+  brief                 Prioritised rendering of result plots in worker processes
+  version               0.1
+'''
+import heapq
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from Gui.GUIutils.settings import *
+from Gui.python.ROOTInterface import ReadObject
+from Gui.python.PlotCache import plotCache
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Lower renders first
+RenderOnScreen = 0
+RenderUpcoming = 1
+RenderBackground = 2
+
+class RenderJob():
+	# Everything a render process needs, the canvas is read again from the file.
+	# outputFile is the file of the plot in the PlotCache, size that of a PNG.
+	def __init__(self, sourceFile, canvasPath, outputFile, size = None):
+		self.sourceFile = sourceFile
+		self.canvasPath = canvasPath
+		self.outputFile = outputFile
+		self.size = size
+
+def renderJob(job):
+	# Runs in the render processes
+	canvas = ReadObject(job.sourceFile, job.canvasPath)
+	if canvas is None:
+		raise IOError("{0} not found in {1}".format(job.canvasPath, job.sourceFile))
+	if plotCache.store(canvas, job.outputFile, job.size) is None:
+		raise IOError("Unable to store {}".format(job.outputFile))
+	return job.outputFile
+
+class RenderQueue():
+	'''
+	Plots are added by grading with the output file they will be written to.
+	Plots on screen go first, then those about to be shown, then the rest.
+	Without background rendering (expert mode, batch runs) a plot is only
+	rendered once somebody asks for it.
+	'''
+	def __init__(self, nWorkers = RenderWorkers):
+		self.nWorkers = max(1, nWorkers)
+		self.background = True
+		self.executor = None
+		self.condition = threading.Condition()
+		self.sequence = itertools.count()
+		# outputFile : [job, serial, state, priority], state is queued, rendering or
+		# failed. Plots are dropped once they are in the cache.
+		self.entries = {}
+		self.pending = []
+		self.inFlight = 0
+
+	def setBackgroundRendering(self, enabled):
+		with self.condition:
+			self.background = enabled
+		if enabled:
+			for outputFile in list(self.entries.keys()):
+				self.prioritize(outputFile, RenderBackground)
+
+	def add(self, job):
+		cached = plotCache.lookup(job.outputFile)
+		with self.condition:
+			entry = self.entries.get(job.outputFile)
+			if cached:
+				self.entries.pop(job.outputFile, None)
+				return
+			# Same name, same canvas of the same file: a render under way is kept
+			if entry is not None and entry[2] != "failed":
+				return
+			self.entries[job.outputFile] = [job, next(self.sequence), "queued", None]
+		if self.background:
+			self.prioritize(job.outputFile, RenderBackground)
+
+	def prioritize(self, outputFile, priority):
+		with self.condition:
+			entry = self.entries.get(outputFile)
+			if entry is None or entry[2] != "queued":
+				return
+			if entry[3] is not None and entry[3] <= priority:
+				return
+			entry[3] = priority
+			# Entries pushed earlier with a lower priority are skipped when popped
+			heapq.heappush(self.pending, (priority, next(self.sequence), outputFile, entry[1]))
+		self.dispatch()
+
+	def isReady(self, outputFile):
+		# Rendered plots and those not rendered through the queue (IV curves, ...)
+		with self.condition:
+			return outputFile not in self.entries
+
+	def isFailed(self, outputFile):
+		with self.condition:
+			entry = self.entries.get(outputFile)
+			return entry is not None and entry[2] == "failed"
+
+	def request(self, outputFile, timeout = None):
+		# Renders outputFile first and waits for it, True once it can be shown
+		self.prioritize(outputFile, RenderOnScreen)
+		with self.condition:
+			self.condition.wait_for(lambda: self.isReady(outputFile) or self.isFailed(outputFile), timeout)
+			return self.isReady(outputFile)
+
+	def livePlots(self):
+		# Plots still to be rendered
+		with self.condition:
+			return [outputFile for outputFile, entry in self.entries.items() if entry[2] != "failed"]
+
+	def dispatch(self):
+		with self.condition:
+			while self.inFlight < self.nWorkers and self.pending != []:
+				priority, order, outputFile, serial = heapq.heappop(self.pending)
+				entry = self.entries.get(outputFile)
+				if entry is None or entry[1] != serial or entry[2] != "queued" or entry[3] != priority:
+					continue
+				entry[2] = "rendering"
+				self.inFlight += 1
+				try:
+					if self.executor is None:
+						self.executor = ProcessPoolExecutor(max_workers=self.nWorkers, mp_context=multiprocessing.get_context("spawn"))
+					future = self.executor.submit(renderJob, entry[0])
+				except Exception as err:
+					self.finish(outputFile, serial, err)
+					continue
+				future.add_done_callback(lambda future, outputFile = outputFile, serial = serial: self.on_done(future, outputFile, serial))
+
+	def on_done(self, future, outputFile, serial):
+		error = future.exception()
+		if error is None:
+			plotCache.added(outputFile)
+		with self.condition:
+			self.finish(outputFile, serial, error)
+		self.dispatch()
+
+	def finish(self, outputFile, serial, error):
+		# Called with the condition held
+		self.inFlight -= 1
+		if error is not None:
+			logger.error("Rendering {0} failed: {1}".format(outputFile, error))
+			if self.executor is not None and getattr(self.executor, "_broken", False):
+				self.executor.shutdown(wait=False)
+				self.executor = None
+		entry = self.entries.get(outputFile)
+		if entry is not None and entry[1] == serial:
+			if error is None:
+				self.entries.pop(outputFile)
+			else:
+				entry[2] = "failed"
+		self.condition.notify_all()
+
+renderQueue = RenderQueue()
+plotCache.pin(renderQueue.livePlots)
@@ -16,6 +16,9 @@ from functools import partial
 from Gui.GUIutils.settings import *
 from Gui.GUIutils.guiUtils import *
 from Gui.python.ROOTInterface import *
+from Gui.python.RenderQueue import *
+from Gui.python.PlotCache import plotCache, plotFormat
+from Gui.QtGUIutils.QtPlotView import QtPlotView
 from Gui.QtGUIutils.QtTCanvasWidget import *
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -109,7 +112,7 @@ class ResultTreeWidget(QWidget):
 			self.TestLabel = QLabel("Test")
 			self.ControlButtom = QPushButton("Pause")
 			self.ControlButtom.clicked.connect(self.controlDisplay)
-			self.SVGWidget =  QtSvg.QSvgWidget()
+			self.SVGWidget = QtPlotView()
 			minHeight = 400
 			ratio = 1.5
 			self.SVGWidget.setMinimumHeight(minHeight)
@@ -152,31 +155,52 @@ class ResultTreeWidget(QWidget):
 	def onItemClicked(self, item, col):
 		self.OutputTree.resizeColumnToContents(0)
 		if item.text(0).endswith(";TCanvas"):
-			canvas = item.data(0,Qt.UserRole)
-			self.displayResult(canvas)
+			# Read when picked, the tree only holds file name and path
+			sourceFile, path = item.data(0,Qt.UserRole)
+			format = plotFormat(path)[0]
+			levels = [0] if format == "svg" else range(RasterZoomLevels+1)
+			plotFiles = []
+			canvas = None
+			for level in levels:
+				size = plotFormat(path, level)[1]
+				plotFile = plotCache.plotFile(sourceFile, path, format, size)
+				if plotFile is None:
+					return
+				# Drawn once, opened again from the cache
+				if not plotCache.lookup(plotFile):
+					if canvas is None:
+						canvas = ReadObject(sourceFile, path)
+					if canvas is None or plotCache.store(canvas, plotFile, size) is None:
+						return
+					plotCache.added(plotFile)
+				plotFiles.append(plotFile)
+			self.displayResult(plotFiles)
 
-	def DirectoryVAL(self, QTreeNode, node):
+	def DirectoryVAL(self, QTreeNode, node, sourceFile):
 		if node.getDaugthers() != []:
 			for Node in node.getDaugthers():
 				CurrentNode = QTreeWidgetItem()
 				if Node.getClassName() ==  "TCanvas":
 					CurrentNode.setText(0,Node.getKeyName()+";TCanvas")
-					CurrentNode.setData(0,Qt.UserRole,Node.getObject())
+					CurrentNode.setData(0,Qt.UserRole,(sourceFile,Node.getPath()))
 				else:
 					CurrentNode.setText(0,Node.getKeyName())
 				QTreeNode.addChild(CurrentNode)
-				self.DirectoryVAL(CurrentNode,Node)
+				self.DirectoryVAL(CurrentNode,Node,sourceFile)
 		else:
 			return 
 
 	def getResult(self, QTreeNode, sourceFile):
-		Nodes = GetDirectory(sourceFile)
-		CurrentNode = QTreeWidgetItem()
-		for Node in Nodes:
-			CurrentNode = QTreeWidgetItem()
-			CurrentNode.setText(0,Node.getKeyName())
-			QTreeNode.addChild(CurrentNode)
-			self.DirectoryVAL(CurrentNode, Node)
+		try:
+			# Keys only, PyROOT is loaded once a plot is opened
+			with HistogramFile(sourceFile) as Nodes:
+				for Node in Nodes:
+					CurrentNode = QTreeWidgetItem()
+					CurrentNode.setText(0,Node.getKeyName())
+					QTreeNode.addChild(CurrentNode)
+					self.DirectoryVAL(CurrentNode, Node, sourceFile)
+		except IOError as err:
+			logger.warning(str(err))
 
 	def updateDisplayList(self, step ,resultDict):
 		toBeDisplayed = len(self.displayList)
@@ -184,6 +208,7 @@ class ResultTreeWidget(QWidget):
 			for plot in resultDict[module]:
 				if (step,plot) not in self.displayList:
 					self.displayList.append((step,plot))
+					renderQueue.prioritize(plot, RenderUpcoming)
 
 		if self.allDisplayed:
 			self.displayIndex = toBeDisplayed
@@ -200,6 +225,21 @@ class ResultTreeWidget(QWidget):
 				self.allDisplayed = True
 			self.displayIndex = self.displayIndex % len(self.displayList)
 			step, displayPlot = self.displayList[self.displayIndex]
+			if renderQueue.isFailed(displayPlot):
+				# Nothing to show, on to the next plot
+				self.displayIndex += 1
+				self.timer.start(200)
+				return
+			if not renderQueue.isReady(displayPlot):
+				# Rendered next, try again shortly instead of showing a missing file
+				renderQueue.prioritize(displayPlot, RenderOnScreen)
+				self.timer.start(200)
+				return
+			if not os.path.isfile(displayPlot):
+				# Evicted from the plot cache since, dropped from the slideshow
+				self.displayList.pop(self.displayIndex)
+				self.timer.start(200)
+				return
 			self.TestLabel.setText("Step{}".format(step))
 			self.SVGWidget.load(displayPlot)
 			self.displayIndex += 1
@@ -228,27 +268,21 @@ class ResultTreeWidget(QWidget):
 			self.TreeRoot.addChild(CurrentNode)
 			self.getResult(CurrentNode, File)
 			
-	def displayResult(self, canvas):
-		tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-		if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-			try:
-				os.mkdir(tmpDir)
-				logger.info("Creating "+tmpDir)
-			except:
-				logger.warning("Failed to create "+tmpDir)
-		svgFile = TCanvas2SVG(tmpDir, canvas)
-		self.displayingImage = svgFile
+	def displayResult(self, plotFiles):
+		# One file, or the levels of a zoom pyramid
+		plotFile = plotFiles[0]
+		self.displayingImage = plotFile
 
 		try:
 			#self.DisplayView = QPixmap(jpgFile).scaled(QSize(self.DisplayW,self.DisplayH), Qt.KeepAspectRatio, Qt.SmoothTransformation)
 			#self.DisplayLabel.setPixmap(self.DisplayView)
 			#self.update
 			self.Plot.append("index")
-			self.Plot[self.count] = QtTCanvasWidget(self.master,svgFile)
+			self.Plot[self.count] = QtTCanvasWidget(self.master,plotFiles)
 			self.count = self.count+1
-			logger.info("Displaying " + svgFile)
+			logger.info("Displaying " + plotFile)
 		except:
-			logger.error("Failed to display " + svgFile)
+			logger.error("Failed to display " + plotFile)
 		pass
 	
 
@@ -0,0 +1,150 @@
+'''
+  ResultUploader.py
+  brief                 Upload of test results to the database
+  version               0.1
+'''
+import os
+import sys
+import time
+import hashlib
+import subprocess
+from datetime import datetime
+
+from Gui.GUIutils.DBConnection import *
+from Gui.GUIutils.guiUtils import formatter
+from Gui.python.StepProfile import ProfileFileName
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def uploadTestToDB(dbconnection, localDir, username):
+	# Used by the GUI, the post-processing thread and the batch runner, no GUI calls in here
+	getFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "*.root"  '.format(localDir), shell=True, stdout=subprocess.PIPE)
+	fileList = getFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
+	moduleList = [module for module in localDir.split('_') if "Module" in module]
+
+	if fileList  == [""]:
+		logger.warning("No ROOT file found in the local folder, skipping...")
+		return
+
+	# Databases set up before the timing profile have no column for it
+	storeTiming = "timing_profile" in describeTable(dbconnection, "module_tests")
+
+	## Submit all files
+	for submitFile in fileList:
+		data_id = hashlib.md5('{}'.format(submitFile).encode()).hexdigest()
+		if not checkRemoteFile(dbconnection, data_id):
+			uploadFile(dbconnection, submitFile, data_id)
+
+		## Submit records for all modules
+		for module in moduleList:
+			#print ("Module is {0}".format(module))
+			module_id = module.strip('Module')
+			#print ("Module_ID is {0}".format(module_id))
+			getConfigInFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "CMSIT_RD53_{1}_*_IN.txt"  '.format(localDir,module_id), shell=True, stdout=subprocess.PIPE) #changed module_id to module
+			configInFileList = getConfigInFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
+			getConfigOutFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "CMSIT_RD53_{1}_*_OUT.txt"  '.format(localDir,module_id), shell=True, stdout=subprocess.PIPE) #changed module_id to module
+			configOutFileList = getConfigOutFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
+			getXMLFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "*.xml"  '.format(localDir), shell=True, stdout=subprocess.PIPE)
+			XMLFileList = getXMLFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
+			configcolumns = []
+			configdata = []
+			for configInFile in configInFileList:
+				if configInFile != [""]:
+					configcolumns.append("Chip{}InConfig".format(configInFile.split('_')[-2]))
+					configInBuffer = open(configInFile,'rb')
+					configInBin = configInBuffer.read()
+					configdata.append(configInBin)
+			for configOutFile in configOutFileList:
+				if configOutFile != [""]:
+					configcolumns.append("Chip{}OutConfig".format(configOutFile.split('_')[-2]))
+					configOutBuffer = open(configOutFile,'rb')
+					configOutBin = configOutBuffer.read()
+					configdata.append(configOutBin)
+			
+			xmlcolumns = []
+			xmldata = []
+			if len(XMLFileList) > 1:
+				print ("Warning!  There are multiple xml files here!")
+			for XMLFile in XMLFileList:
+				if XMLFile != [""]:
+					xmlcolumns.append("xml_file")
+					xmlBuffer = open(XMLFile, 'rb')
+					xmlBin = xmlBuffer.read()
+					xmldata.append(xmlBin)
+
+			#Columns = ["part_id","date","testname","description","grade","data_id","username", "config_file", "xml_file"]
+			#Columns = ["part_id","test_id","test_name","date","test_grade","user","Chip0InConfig","Chip0OutConfig","Chip1InConfig","Chip1OutConfig","Chip2InConfig","Chip2OutConfig","Chip3InConfig","Chip3OutConfig","plot1","plot2"]
+			Columns = ["part_id","test_id","test_name","date","test_grade","user","plot1","plot2","root_file"]
+			SubmitArgs = []
+			Value = []
+			record = formatter(localDir,Columns, part_id=module)
+			#record = formatter(localDir,Columns, part_id=str(module_id))
+			#for column in ['part_id']:
+			for column in Columns:
+				if column == "part_id":
+					SubmitArgs.append(column) 
+					Value.append(module) 
+				if column == "date":
+					SubmitArgs.append(column)
+					if str(sys.version).split(" ")[0].startswith(("3.7","3.8","3.9")):
+						TimeStamp = datetime.fromisoformat(localDir.split('_')[-2])
+					elif str(sys.version).split(" ")[0].startswith(("3.6")):
+						TimeStamp = datetime.strptime(localDir.split('_')[-2].split('.')[0], '%Y-%m-%dT%H:%M:%S')
+					#print ("timestamp is {0}".format(TimeStamp))
+					Value.append(TimeStamp)
+					#Value.append(record[Columns.index(column)])
+				if column == "test_name":
+					SubmitArgs.append(column)
+					Value.append(record[Columns.index(column)])
+				if column == "description":
+					SubmitArgs.append(column)
+					Value.append("No Comment")
+				if column == "test_grade":
+					SubmitArgs.append(column)
+					Value.append(-1)
+				if column == "test_id":
+					SubmitArgs.append(column)
+					Value.append(data_id)
+				if column == "user":
+					SubmitArgs.append(column)
+					Value.append(username)
+				if column == "root_file":
+					SubmitArgs.append(column)
+					Value.append(submitFile.split("/")[-1])
+
+			# Timing record of the step, as written by StepProfile
+			timingcolumns = []
+			timingdata = []
+			timingFile = os.path.join(localDir, ProfileFileName)
+			if storeTiming and os.path.isfile(timingFile):
+				timingcolumns.append("timing_profile")
+				with open(timingFile, 'r') as timingBuffer:
+					timingdata.append(timingBuffer.read())
+
+			SubmitArgs = SubmitArgs + configcolumns + xmlcolumns + timingcolumns
+			Value = Value + configdata + xmldata + timingdata
+		
+			try:
+				insertGenericTable(dbconnection, "module_tests", SubmitArgs, Value)
+			except:
+				print("Failed to insert")
+
+def timedUpload(profile, upload, output_dir):
+	startTime = time.time()
+	try:
+		upload(output_dir)
+	finally:
+		if profile is not None:
+			profile.add("db_upload", time.time() - startTime)
+			profile.save()
+
+def checkRemoteFile(dbconnection, file_id):
+	remoteRecords = retrieveWithConstraint(dbconnection,"result_files",file_id = file_id, columns = ["file_id"])
+	return remoteRecords != []
+
+def uploadFile(dbconnection, fileName, file_id):
+	fileBuffer = open(fileName, 'rb')
+	data = fileBuffer.read()
+	insertGenericTable(dbconnection, "result_files", ["file_id","file_content"],[file_id,data])
@@ -0,0 +1,80 @@
+'''
+  RunEventLog.py
+  brief                 Machine readable record of what happened during a test step
+  version               0.1
+
+  One JSON object per line in events.jsonl, next to output.txt:
+    {"time": 1700000000.123, "elapsed": 12.345, "event": "phase", "phase": "perform"}
+  Events: start, phase, progress, register, message (DAQ warnings and
+  errors), interlock (global stop, step timeout), abort, finish.
+'''
+import os
+import json
+import time
+
+from Gui.GUIutils.LogWriter import LogWriter
+from Gui.python.OutputParser import *
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Stored next to output.txt in the output directory of the step
+EventLogFileName = "events.jsonl"
+
+# DAQ lines of these severities are kept as message events
+RecordedSeverities = ["warning", "error", "fatal"]
+
+class RunEventLog():
+	def __init__(self, output_dir, testName, firmwareName):
+		self.fileName = os.path.join(output_dir, EventLogFileName)
+		self.startTime = time.time()
+		self.lastProgress = None
+		self.writer = LogWriter(self.fileName, compression = None)
+		self.record("start", test = testName, board = firmwareName, calibration = Test.get(testName, ""))
+
+	def record(self, event, **fields):
+		now = time.time()
+		entry = {"time": round(now,3), "elapsed": round(now - self.startTime,3), "event": event}
+		entry.update(fields)
+		self.writer.write(json.dumps(entry) + "\n")
+
+	def recordOutputEvent(self, event):
+		# An OutputEvent of the tokenizer, plain info lines are not recorded
+		if event.kind == PhaseEvent:
+			self.record("phase", phase = event.phase)
+		elif event.kind == ProgressEvent:
+			if event.progress != self.lastProgress:
+				self.lastProgress = event.progress
+				self.record("progress", value = event.progress)
+				if event.progress == 100:
+					self.record("phase", phase = "summary")
+		elif event.kind == RegisterEvent:
+			self.record("register", chip = event.chipKey, register = event.register, value = event.value)
+		elif '|' in event.line and event.getSeverity() in RecordedSeverities:
+			self.record("message", severity = event.getSeverity(), text = ANSISequence.sub('', event.line).strip())
+
+	def close(self, **fields):
+		self.record("finish", **fields)
+		self.writer.close()
+
+def loadEvents(output_dir, event = None):
+	'''
+	Events of a step as dicts, only those of one kind if given, e.g.
+	[e["value"] for e in loadEvents(d, "register") if e["chip"] == "0/2"]
+	'''
+	fileName = os.path.join(output_dir, EventLogFileName)
+	events = []
+	try:
+		with open(fileName, 'r') as eventFile:
+			for line in eventFile:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					# Last line of a step that crashed while writing
+					continue
+				if event is None or entry.get("event") == event:
+					events.append(entry)
+	except OSError as err:
+		logger.warning("Unable to read {0}: {1}".format(fileName, err))
+	return events
@@ -0,0 +1,119 @@
+'''
+  RunJournal.py
+  brief                 Durable record of the progress of a composite test
+  version               0.1
+'''
+import os
+import json
+from datetime import datetime
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JournalFileName = "RunJournal.json"
+
+class RunJournal():
+	'''
+	Written at every step boundary of a composite test, so that a crashed
+	sequence can pick up again after the last step whose *_OUT.txt configs
+	made it to disk. One journal per FC7 board, kept in the board area.
+	'''
+	def __init__(self, boardDir, testName, modules):
+		self.journalFile = os.path.join(boardDir, JournalFileName)
+		self.testName = testName
+		self.modules = sorted(modules)
+		self.record = None
+
+	def load(self):
+		try:
+			if os.path.isfile(self.journalFile):
+				with open(self.journalFile, 'r') as journalFile:
+					return json.load(journalFile)
+		except (OSError, ValueError) as err:
+			logger.warning("Ignoring unreadable run journal {0}: {1}".format(self.journalFile, err))
+		return None
+
+	def write(self):
+		tmpFile = self.journalFile + ".tmp"
+		try:
+			with open(tmpFile, 'w') as journalFile:
+				json.dump(self.record, journalFile, indent=2)
+				journalFile.flush()
+				os.fsync(journalFile.fileno())
+			os.replace(tmpFile, self.journalFile)
+		except OSError as err:
+			logger.error("Failed to write run journal {0}: {1}".format(self.journalFile, err))
+
+	def begin(self):
+		self.record = {
+			"test"              :  self.testName,
+			"modules"           :  self.modules,
+			"started"           :  datetime.now().isoformat(),
+			"finished"          :  False,
+			"steps"             :  [],
+		}
+		self.write()
+
+	def recordStep(self, index, stepName, output_dir, updatedXMLValues):
+		if self.record is None:
+			self.begin()
+		self.record["steps"].append({
+			"index"             :  index,
+			"name"              :  stepName,
+			"output_dir"        :  output_dir,
+			"finished"          :  datetime.now().isoformat(),
+			# Register values carried over into the steps after this one
+			"updatedXMLValues"  :  { key : dict(value) for key, value in updatedXMLValues.items() },
+		})
+		self.write()
+
+	def finish(self):
+		if self.record is None:
+			return
+		self.record["finished"] = True
+		self.write()
+
+	def getResumePoint(self, chipKeys):
+		'''
+		Returns (next step index, input directory, updatedXMLValues) of an
+		unfinished journal for the same test and modules, or None
+		'''
+		record = self.load()
+		if record is None or record.get("finished", True):
+			return None
+		if record.get("test") != self.testName or record.get("modules") != self.modules:
+			return None
+
+		# Drop trailing steps whose chip configs did not fully make it to disk,
+		# steps without Ph2_ACF output (IVCurve, SLDOScan) have no output_dir
+		steps = record.get("steps", [])
+		while steps != []:
+			output_dir = steps[-1]["output_dir"]
+			if output_dir == "" or self.hasConfigs(output_dir, chipKeys):
+				break
+			logger.warning("Incomplete chip configs in {}, not resuming after it".format(output_dir))
+			steps = steps[:-1]
+		if steps == []:
+			return None
+
+		input_dir = ""
+		for step in reversed(steps):
+			if step["output_dir"] != "":
+				input_dir = step["output_dir"]
+				break
+		return steps[-1]["index"] + 1, input_dir, steps[-1]["updatedXMLValues"]
+
+	def hasConfigs(self, output_dir, chipKeys):
+		for key in chipKeys:
+			if not os.path.isfile(os.path.join(output_dir, "CMSIT_RD53_{}_OUT.txt".format(key))):
+				return False
+		return True
+
+	def getSummary(self):
+		record = self.load()
+		if record is None:
+			return ""
+		steps = record.get("steps", [])
+		lastTime = steps[-1]["finished"] if steps != [] else record.get("started","")
+		return "{0} steps of {1} started at {2}, last step finished at {3}".format(len(steps), record.get("test"), record.get("started",""), lastTime)
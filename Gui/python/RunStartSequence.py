@@ -0,0 +1,141 @@
+'''
+  RunStartSequence.py
+  brief                 Asynchronous chain of external commands run before data taking
+  version               0.1
+'''
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default time (in seconds) a single phase may take before it is killed
+DefaultPhaseTimeout = 120
+
+class RunPhase():
+	def __init__(self, name, program, args, timeout = DefaultPhaseTimeout, onFinished = None):
+		self.name = name
+		self.program = program
+		self.args = args
+		self.timeout = timeout
+		# Called as onFinished(phase, exitCode), returning False stops the sequence
+		self.onFinished = onFinished
+		self.output = ""
+		self.startTime = None
+		self.elapsed = None
+
+class RunStartSequence(QObject):
+	'''
+	Runs a list of phases one after the other on a single QProcess, driven by
+	its signals only, so the Qt event loop keeps running in between. Every
+	phase is timed, guarded by a timeout and can be cancelled.
+	'''
+	phaseStarted = pyqtSignal(object)
+	phaseFinished = pyqtSignal(object, object)
+	outputString = pyqtSignal(object)
+	finished = pyqtSignal(object)
+	failed = pyqtSignal(object, object)
+
+	def __init__(self, parent, workingDir):
+		super(RunStartSequence,self).__init__(parent)
+		self.phases = []
+		self.timings = {}
+		self.currentPhase = None
+		self.cancelled = False
+		self.done = False
+
+		self.process = QProcess(self)
+		self.process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
+		self.process.setWorkingDirectory(workingDir)
+		self.process.readyReadStandardOutput.connect(self.on_readyReadStandardOutput)
+		self.process.finished.connect(self.on_phaseFinished)
+		self.process.errorOccurred.connect(self.on_error)
+
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.on_timeout)
+
+	def addPhase(self, name, program, args, timeout = DefaultPhaseTimeout, onFinished = None):
+		self.phases.append(RunPhase(name, program, args, timeout, onFinished))
+
+	def insertPhase(self, name, program, args, timeout = DefaultPhaseTimeout, onFinished = None):
+		# Runs right after the current phase
+		self.phases.insert(0, RunPhase(name, program, args, timeout, onFinished))
+
+	def hasPhase(self, name):
+		return name in [phase.name for phase in self.phases]
+
+	def isRunning(self):
+		return self.currentPhase is not None and not self.done
+
+	def start(self):
+		self.nextPhase()
+
+	def nextPhase(self):
+		if self.cancelled:
+			return
+		if self.phases == []:
+			self.currentPhase = None
+			self.done = True
+			self.finished.emit(self.timings)
+			return
+		phase = self.phases.pop(0)
+		self.currentPhase = phase
+		phase.startTime = time.time()
+		logger.info("Starting phase '{0}': {1} {2}".format(phase.name, phase.program, " ".join(phase.args)))
+		self.phaseStarted.emit(phase.name)
+		self.timer.start(int(phase.timeout*1000))
+		self.process.start(phase.program, phase.args)
+
+	def on_readyReadStandardOutput(self):
+		text = self.process.readAllStandardOutput().data().decode(errors="replace")
+		if self.currentPhase is not None:
+			self.currentPhase.output += text
+		self.outputString.emit(text)
+
+	def on_phaseFinished(self, exitCode, exitStatus):
+		self.timer.stop()
+		phase = self.currentPhase
+		if self.cancelled or phase is None:
+			return
+		phase.elapsed = time.time() - phase.startTime
+		self.timings[phase.name] = phase.elapsed
+		logger.info("Phase '{0}' finished in {1:.1f} s with exit code {2}".format(phase.name, phase.elapsed, exitCode))
+		self.phaseFinished.emit(phase.name, phase.elapsed)
+
+		if exitStatus != QProcess.NormalExit:
+			self.fail(phase.name, "{} crashed".format(phase.program))
+			return
+		if phase.onFinished is not None and phase.onFinished(phase, exitCode) == False:
+			self.fail(phase.name, "{0} returned {1}".format(phase.program, exitCode))
+			return
+		# Start the next command once this one is fully torn down
+		QTimer.singleShot(0, self.nextPhase)
+
+	def on_error(self, error):
+		if error == QProcess.FailedToStart and not self.cancelled:
+			self.timer.stop()
+			self.fail(self.currentPhase.name, "{} could not be started".format(self.currentPhase.program))
+
+	def on_timeout(self):
+		if self.currentPhase is None:
+			return
+		self.fail(self.currentPhase.name, "timed out after {} s".format(self.currentPhase.timeout))
+
+	def cancel(self):
+		if self.done or self.cancelled:
+			return
+		self.cancelled = True
+		self.timer.stop()
+		if self.process.state() != QProcess.NotRunning:
+			self.process.kill()
+		logger.info("Run start-up cancelled")
+
+	def fail(self, name, reason):
+		self.cancel()
+		self.done = True
+		logger.error("Phase '{0}' failed: {1}".format(name, reason))
+		self.failed.emit(name, reason)
@@ -347,6 +347,7 @@ class SimplifiedMainWidget(QWidget):
 
 		self.runFlag = True
 		self.RunTest = QtRunWindow(self.master, self.info, self.firmwareDescription)
+		self.master.TestScheduler.addSession(self.FwModule.getBoardName(), self.RunTest)
 		self.LVpowersupply.setPoweringMode(defaultPowerMode)
 		self.LVpowersupply.setCompCurrent(compcurrent = 1.05) # Fixed for different chip
 		self.LVpowersupply.TurnOn()
@@ -0,0 +1,79 @@
+'''
+  StepProfile.py
+  brief                 Wall-clock timing record of a single test step
+  version               0.1
+'''
+import os
+import json
+import time
+from datetime import datetime
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Phases of a step in the order they happen
+ProfilePhases = ["firmware", "staging", "hardware_init", "data_taking", "summary", "copy", "grading", "rendering", "db_upload"]
+
+# Stored next to output.txt in the output directory of the step
+ProfileFileName = "StepTiming.json"
+
+class StepProfile():
+	def __init__(self, testName, firmwareName):
+		self.testName = testName
+		self.firmwareName = firmwareName
+		self.output_dir = ""
+		self.started = datetime.now().isoformat()
+		self.phases = {}
+		self.details = {}
+		self.running = {}
+
+	def setOutputDir(self, output_dir):
+		self.output_dir = output_dir
+
+	def add(self, phase, seconds):
+		self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+	def start(self, phase):
+		if phase not in self.running.keys():
+			self.running[phase] = time.time()
+
+	def stop(self, phase):
+		# Phases that never started (e.g. the run crashed early) are ignored
+		if phase in self.running.keys():
+			self.add(phase, time.time() - self.running.pop(phase))
+
+	def isRunning(self, phase):
+		return phase in self.running.keys()
+
+	def setDetail(self, key, value):
+		self.details[key] = value
+
+	def toDict(self):
+		record = {
+			"test"     :  self.testName,
+			"board"    :  self.firmwareName,
+			"started"  :  self.started,
+			"phases"   :  { phase : round(self.phases[phase],3) for phase in ProfilePhases if phase in self.phases.keys() },
+			"total"    :  round(sum(self.phases.values()),3),
+		}
+		record.update(self.details)
+		return record
+
+	def toJSON(self):
+		return json.dumps(self.toDict())
+
+	def getFile(self):
+		return os.path.join(self.output_dir, ProfileFileName)
+
+	def save(self):
+		if self.output_dir == "":
+			return
+		try:
+			with open(self.getFile(), 'w') as profileFile:
+				json.dump(self.toDict(), profileFile, indent=2)
+		except OSError as err:
+			logger.warning("Failed to save timing profile {0}: {1}".format(self.getFile(), err))
+
+	def summary(self):
+		return ", ".join(["{0} {1:.1f} s".format(phase, self.phases[phase]) for phase in ProfilePhases if phase in self.phases.keys()])
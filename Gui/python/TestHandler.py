@@ -14,11 +14,13 @@ import subprocess
 import threading
 import time
 from datetime import datetime
+from collections import defaultdict
 import random
 from subprocess import Popen, PIPE
 
 from Gui.GUIutils.DBConnection import *
 from Gui.GUIutils.guiUtils import *
+from Gui.GUIutils.LogWriter import LogWriter
 #from Gui.QtGUIutils.QtStartWindow import *
 from Gui.QtGUIutils.QtCustomizeWindow import *
 from Gui.QtGUIutils.QtTableWidget import *
@@ -27,9 +29,17 @@ from Gui.QtGUIutils.QtLoginDialog import *
 from Gui.python.ResultTreeWidget import *
 from Gui.python.TestValidator import *
 from Gui.python.QResultDialog import *
-from Gui.python.ANSIColoringParser import *
 from Gui.python.IVCurveHandler import *
 from Gui.python.SLDOScanHandler import *
+from Gui.python.RunStartSequence import *
+from Gui.python.PostProcessingWorker import *
+from Gui.python.StepProfile import *
+from Gui.python.RunJournal import *
+from Gui.python.OutputParser import *
+from Gui.python.ResultUploader import *
+from Gui.python.RunEventLog import *
+from Gui.python.RenderQueue import *
+from Gui.QtGUIutils.QtRenderThrottle import *
 from Gui.QtGUIutils.QtMatplotlibUtils import *
 
 import logging
@@ -42,6 +52,7 @@ class TestHandler(QObject):
 	finishSingal = pyqtSignal(object)
 	proceedSignal = pyqtSignal(object)
 	outputString = pyqtSignal(object)
+	outputLine = pyqtSignal(object)
 	stepFinished = pyqtSignal(object)
 	historyRefresh = pyqtSignal(object)
 	updateResult = pyqtSignal(object)
@@ -56,21 +67,33 @@ class TestHandler(QObject):
 		#self.LVpowersupply.InitialDevice()
 		#self.LVpowersupply.setCompCurrent(compcurrent = 1.05) # Fixed for different chip
 		#self.LVpowersupply.TurnOn()
-		self.FWisPresent = False
-		self.FWisLoaded = False
 		self.master.globalStop.connect(self.urgentStop)
 		self.runwindow = runwindow
 		self.firmware = firmware
 		self.info = info
 		self.connection = self.master.connection
 		self.firmwareName = self.firmware.getBoardName()
+		# Carried-over register values are kept per board, so that several boards
+		# can be tested at the same time. CMSITminiDAQ runs inside the output
+		# directory of each step (workingDir), boardDir only carries RunNumber.txt.
+		self.boardDir = GetBoardWorkingDir(self.firmwareName)
+		self.workingDir = self.boardDir
+		self.updatedXMLValues = defaultdict(dict)
 		self.ModuleMap = dict()
 		self.ModuleType = self.firmware.getModuleByIndex(0).getModuleType()
 		self.Ph2_ACF_ver = os.environ.get('Ph2_ACF_VERSION')
 		print('Using version {0} of Ph2_ACF'.format(self.Ph2_ACF_ver))
 		self.firmwareImage = firmware_image[self.ModuleType][self.Ph2_ACF_ver]
 		print('Firmware version is {0}'.format(self.firmwareImage))
+		# Which image each board stores and runs is remembered across handlers and restarts
+		self.firmwareImagePath = "{0}/FirmwareImages/{1}".format(os.environ.get("GUI_dir"),self.firmwareImage)
+		self.firmwareChecksum = imageChecksum(self.firmwareImagePath)
+		self.FirmwareState = FirmwareStateCache(self.firmwareName, self.boardDir)
+		self.FWisPresent = self.FirmwareState.isStored(self.firmwareImage, self.firmwareChecksum)
+		self.FWisLoaded = self.FirmwareState.isLoaded(self.firmwareImage, self.firmwareChecksum)
 		self.RunNumber = "-1"
+		# Seconds spent staging files for the current step
+		self.stagingTime = 0.0
 		self.IVCurveHandler = None
 		self.SLDOScanHandler = None
 
@@ -87,6 +110,8 @@ class TestHandler(QObject):
 
 		#self.autoSave = False
 		self.autoSave = True
+		# Result dialogs and questions, switched off for unattended runs (Gui/benchmark)
+		self.interactive = True
 		self.backSignal = False
 		self.halt = False
 		self.finishSingal = False
@@ -100,22 +125,42 @@ class TestHandler(QObject):
 		self.grades = []
 		self.modulestatus = []
 
+		# Result plots are only shown outside expert mode, render them on request otherwise
+		renderQueue.setBackgroundRendering(not self.master.expertMode)
+		# Progress bars and run time labels are redrawn a few times per second only
+		self.widgetThrottle = QtWidgetThrottle()
+
 		self.run_process = QProcess(self)
 		self.run_process.readyReadStandardOutput.connect(self.on_readyReadStandardOutput)
 		self.run_process.finished.connect(self.on_finish)
 		self.readingOutput = False
+		# Complete lines out of the chunks read from run_process
+		self.outputAssembler = LineAssembler()
+		self.outputTokenizer = None
+		self.eventLog = None
 		self.ProgressingMode = "None"
 		self.ProgressValue = 0
 		self.runtimeList = []
-		self.info_process = QProcess(self)
-		self.info_process.readyReadStandardOutput.connect(self.on_readyReadStandardOutput_info)
-
-		##---Adding firmware setting-----
-		self.fw_process = QProcess(self)
-		self.fw_process.readyReadStandardOutput.connect(self.on_readyReadStandardOutput)
+		# Firmware checks and loads before each run, see runSingleTest
+		self.startSequence = None
+		self.startTimings = {}
+		# Timing record of the current step, see StepProfile
+		self.profile = None
+		# Progress of composite tests on disk, to resume after a crash
+		self.journal = None
+
+		# Grading and DB upload of composite steps run behind the next step
+		self.pipelined = PipelinedPostProcessing
+		self.postProcessor = PostProcessingWorker(self.openUploadConnection)
+		# Plots of the current step, opened by the result dialogs
+		self.figurelist = {}
+		plotCache.pin(self.currentPlots)
+		self.postProcessor.jobGraded.connect(self.on_stepGraded)
+		self.postProcessor.jobFinished.connect(self.on_stepUploaded)
 
 		self.haltSignal.connect(self.runwindow.finish)
 		self.outputString.connect(self.runwindow.updateConsoleInfo)
+		self.outputLine.connect(self.runwindow.updateConsoleLine)
 		self.stepFinished.connect(self.runwindow.finish)
 		self.historyRefresh.connect(self.runwindow.refreshHistory)
 		self.updateResult.connect(self.runwindow.updateResult)
@@ -139,17 +184,6 @@ class TestHandler(QObject):
 			self.ModuleMap[fwPath] = moduleName
 
 	def configTest(self):
-		# Gets the run number by reading from the RunNumber.txt file.
-		try:
-			RunNumberFileName = os.environ.get('Ph2_ACF_AREA')+"/test/RunNumber.txt"
-			if os.path.isfile(RunNumberFileName):
-				runNumberFile = open(RunNumberFileName,"r")
-				runNumberText = runNumberFile.readlines()
-				self.RunNumber = runNumberText[0].split('\n')[0]
-				logger.info("RunNumber: {}".format(self.RunNumber))
-		except:
-			logger.warning("Failed to retrieve RunNumber")
-		
 		# If currentTest is not set check if it's a compositeTest and if so set testname accordingly, otherwise set it based off the test set in info[1]
 		if self.currentTest == "" and isCompositeTest(self.info[1]):
 			testName = CompositeList[self.info[1]][0]
@@ -165,25 +199,31 @@ class TestHandler(QObject):
 		# output_dir gets set to $DATA_dir/Test_{testname}/Test_Module{ModuleID}_{Test}_{TimeStamp}
 		self.output_dir, self.input_dir = ConfigureTest(testName, "_Module".join(ModuleIDs), self.output_dir, self.input_dir, self.connection)
 
+		# The output directory is the sandbox CMSITminiDAQ runs in
+		self.workingDir = self.output_dir
+		# Every file the step needs is collected first and staged in one batch below
+		stager = FileStager("configuration of {}".format(testName))
+		SetupRunSandbox(self.workingDir, self.boardDir, Stager = stager)
+
 		# The default place to get the config file is in /settings/RD53Files/CMSIT_RD53.txt
 		# FIXME Fix rd53_file[key] so that it reads the correct txt file depending on what module is connected. -> Done!
 		for key in self.rd53_file.keys():
 			if self.rd53_file[key] == None:
 				self.rd53_file[key] = os.environ.get('Ph2_ACF_AREA')+"/settings/RD53Files/CMSIT_{0}.txt".format(BoardtypeMap[os.environ.get('Ph2_ACF_VERSION')])
 		if self.input_dir == "":
-			# Copies file given in rd53[key] to test directory in Ph2_ACF test area as CMSIT_RD53.txt and the output dir.
-			SetupRD53ConfigfromFile(self.rd53_file,self.output_dir)
+			# Copies file given in rd53[key] to the output dir as CMSIT_RD53_{key}_IN.txt and as the live CMSIT_RD53_{key}.txt
+			SetupRD53ConfigfromFile(self.rd53_file,self.output_dir,Stager = stager)
 		else:
-			SetupRD53Config(self.input_dir,self.output_dir, self.rd53_file)
+			SetupRD53Config(self.input_dir,self.output_dir,self.rd53_file,Stager = stager)
 
 		if self.input_dir == "":
 			# If no config file(xml file) is given create the XML file and place it into a .tmp directory
 			# Create the directory to store the xml file
 			if self.config_file == "":
-				tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp"
+				tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp/" + self.firmwareName
 				if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
 					try:
-						os.mkdir(tmpDir)
+						os.makedirs(tmpDir)
 						logger.info("Creating "+tmpDir)
 					except:
 						logger.warning("Failed to create "+tmpDir)
@@ -191,27 +231,27 @@ class TestHandler(QObject):
 				config_file = GenerateXMLConfig(self.firmware,self.currentTest,tmpDir)
 				#config_file = os.environ.get('GUI_dir')+ConfigFiles.get(testName, "None")
 				if config_file:
-					SetupXMLConfigfromFile(config_file,self.output_dir,self.firmwareName,self.rd53_file)
+					SetupXMLConfigfromFile(config_file,self.output_dir,self.firmwareName,self.rd53_file,self.updatedXMLValues,Stager = stager)
 				else:
 					logger.warning("No Valid XML configuration file")
 				#QMessageBox.information(None,"Noitce", "Using default XML configuration",QMessageBox.Ok)
 			else:
-				SetupXMLConfigfromFile(self.config_file,self.output_dir,self.firmwareName,self.rd53_file)
+				SetupXMLConfigfromFile(self.config_file,self.output_dir,self.firmwareName,self.rd53_file,self.updatedXMLValues,Stager = stager)
 		else:
 			if self.config_file != "":
-				SetupXMLConfigfromFile(self.config_file,self.output_dir,self.firmwareName,self.rd53_file)
+				SetupXMLConfigfromFile(self.config_file,self.output_dir,self.firmwareName,self.rd53_file,self.updatedXMLValues,Stager = stager)
 			else:
-				tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp"
+				tmpDir = os.environ.get('GUI_dir') + "/Gui/.tmp/" + self.firmwareName
 				if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
 					try:
-						os.mkdir(tmpDir)
+						os.makedirs(tmpDir)
 						logger.info("Creating "+tmpDir)
 					except:
 						logger.warning("Failed to create "+tmpDir)
 				config_file = GenerateXMLConfig(self.firmware,self.currentTest,tmpDir)
 				#config_file = os.environ.get('GUI_dir')+ConfigFiles.get(testName, "None")
 				if config_file:
-					SetupXMLConfigfromFile(config_file,self.output_dir,self.firmwareName,self.rd53_file)
+					SetupXMLConfigfromFile(config_file,self.output_dir,self.firmwareName,self.rd53_file,self.updatedXMLValues,Stager = stager)
 				else:
 					logger.warning("No Valid XML configuration file")
 
@@ -220,16 +260,35 @@ class TestHandler(QObject):
 				#SetupXMLConfigfromFile(config_file,self.output_dir,self.firmwareName,self.rd53_file)
 				#SetupXMLConfig(self.input_dir,self.output_dir)
 
+		if not stager.stage():
+			for entry in stager.getFailed():
+				self.outputString.emit("<font color=\"red\">Failed to stage {0}: {1}</font>".format(entry.target, entry.error))
+		self.stagingTime = stager.getElapsed()
+		self.profile.add("staging", stager.getElapsed())
+
+		# Gets the run number by reading from the RunNumber.txt file.
+		try:
+			RunNumberFileName = self.workingDir+"/RunNumber.txt"
+			if os.path.isfile(RunNumberFileName):
+				runNumberFile = open(RunNumberFileName,"r")
+				runNumberText = runNumberFile.readlines()
+				self.RunNumber = runNumberText[0].split('\n')[0]
+				logger.info("RunNumber: {}".format(self.RunNumber))
+		except:
+			logger.warning("Failed to retrieve RunNumber")
+
 		self.initializeRD53Dict()
 		self.config_file = ""
 		return
 
 	def saveConfigs(self):
+		# The live chip configs updated by Ph2_ACF already sit in the output directory
+		stager = FileStager("chip configs of {}".format(self.currentTest))
 		for key in self.rd53_file.keys():
-			try:
-				os.system("cp {0}/test/CMSIT_RD53_{1}.txt {2}/CMSIT_RD53_{1}_OUT.txt".format(os.environ.get("Ph2_ACF_AREA"),key,self.output_dir))
-			except:
-				print("Failed to copy {0}/test/CMSIT_RD53_{1}.txt {2}/CMSIT_RD53_{1}_OUT.txt".format(os.environ.get("Ph2_ACF_AREA"),key,self.output_dir))
+			stager.add("{0}/CMSIT_RD53_{1}.txt".format(self.workingDir,key),"{0}/CMSIT_RD53_{1}_OUT.txt".format(self.output_dir,key),"move")
+		stager.stage()
+		self.stagingTime += stager.getElapsed()
+		self.profile.add("copy", stager.getElapsed())
 
 	def resetConfigTest(self):
 		self.input_dir = ""
@@ -255,6 +314,8 @@ class TestHandler(QObject):
 		#self.HistoryLayout.addWidget(self.StatusCanvas)
 
 		if isCompositeTest(testName):
+			if self.testIndexTracker == 0 and not self.halt:
+				self.startJournal(testName)
 			self.runCompositeTest(testName)
 		elif isSingleTest(testName):
 			self.runSingleTest(testName)
@@ -262,6 +323,36 @@ class TestHandler(QObject):
 			QMessageBox.information(None, "Warning", "Not a valid test", QMessageBox.Ok)
 			return
 
+	def startJournal(self, testName):
+		modules = [module.getModuleName() for module in self.firmware.getAllModules().values()]
+		self.journal = RunJournal(self.boardDir, testName, modules)
+		resumePoint = self.journal.getResumePoint(self.rd53_file.keys())
+		if resumePoint is not None and resumePoint[0] < len(CompositeList[testName]):
+			nextIndex, input_dir, values = resumePoint
+			reply = QMessageBox.Yes
+			if self.interactive:
+				reply = QMessageBox.question(None, "Resume test", "Found an unfinished run: {0}.\nResume from {1}?".format(self.journal.getSummary(), CompositeList[testName][nextIndex]),
+						QMessageBox.No | QMessageBox.Yes, QMessageBox.Yes)
+			if reply == QMessageBox.Yes:
+				self.journal.record = self.journal.load()
+				self.testIndexTracker = nextIndex
+				self.input_dir = input_dir
+				self.updatedXMLValues = defaultdict(dict, { key : dict(value) for key, value in values.items() })
+				for index in range(nextIndex):
+					self.runwindow.ResultWidget.ProgressBar[index].setValue(100)
+				logger.info("Resuming {0} at {1} with configs from {2}".format(testName, CompositeList[testName][nextIndex], input_dir))
+				return
+		self.journal.begin()
+
+	def recordStep(self, output_dir):
+		# Called once the step's OUT configs are on disk and testIndexTracker points past it
+		if self.journal is None or not isCompositeTest(self.info[1]):
+			return
+		stepName = CompositeList[self.info[1]][self.testIndexTracker-1]
+		self.journal.recordStep(self.testIndexTracker-1, stepName, output_dir, self.updatedXMLValues)
+		if self.testIndexTracker == len(CompositeList[self.info[1]]):
+			self.journal.finish()
+
 	def runCompositeTest(self,testName):
 		if self.halt:
 			#self.LVpowersupply.TurnOff()
@@ -294,63 +385,117 @@ class TestHandler(QObject):
 
 		self.starttime = None
 		self.ProgressingMode = "None"
+		self.outputAssembler = LineAssembler()
 		self.currentTest = testName
+		self.outputTokenizer = OutputTokenizer(testName, quietDataTaking = not ConsoleShowDataTaking)
+		self.profile = StepProfile(testName, self.firmwareName)
 		self.configTest()
+		self.profile.setOutputDir(self.output_dir)
 		self.outputFile = self.output_dir + "/output.txt"
 		self.errorFile = self.output_dir + "/error.txt"
-		if os.path.exists(self.outputFile):
-			self.outputfile = open(self.outputFile,"a")
-		else:
-			self.outputfile = open(self.outputFile,"w")
-		#self.ContinueButton.setDisabled(True)
-		#self.run_process.setProgram()
-		self.info_process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
-		self.info_process.setWorkingDirectory(os.environ.get("Ph2_ACF_AREA")+"/test/")
-		self.info_process.start("echo",["Running COMMAND: CMSITminiDAQ  -f  CMSIT.xml  -c  {}".format(Test[self.currentTest])])
-		self.info_process.waitForFinished()
+		# Written from a background thread, the GUI never waits for DATA_dir
+		self.outputfile = LogWriter(self.outputFile)
+		self.eventLog = RunEventLog(self.output_dir, testName, self.firmwareName)
+		self.printInfo("Running COMMAND: CMSITminiDAQ  -f  CMSIT.xml  -c  {}".format(Test[self.currentTest]))
 
 		self.run_process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
-		self.run_process.setWorkingDirectory(os.environ.get("Ph2_ACF_AREA")+"/test/")
+		self.run_process.setWorkingDirectory(self.workingDir)
 		#self.run_process.setStandardOutputFile(self.outputFile)
 		#self.run_process.setStandardErrorFile(self.errorFile)
 
-
-		self.fw_process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
-		self.fw_process.setWorkingDirectory(os.environ.get("Ph2_ACF_AREA")+"/test/")
+		# Firmware checks and loads run as a chain of QProcess phases, the GUI
+		# keeps running while the board is prepared
 		print("made it to the firmware check")
+		# Another session may have reloaded or lost the board since the last step
+		self.FWisPresent = self.FirmwareState.isStored(self.firmwareImage, self.firmwareChecksum)
+		self.FWisLoaded = self.FirmwareState.isLoaded(self.firmwareImage, self.firmwareChecksum)
+		if self.startSequence is not None:
+			self.startSequence.deleteLater()
+		self.startSequence = RunStartSequence(self, self.workingDir)
+		self.startSequence.outputString.connect(self.on_startSequenceOutput)
+		self.startSequence.phaseStarted.connect(self.on_startPhase)
+		self.startSequence.failed.connect(self.on_startSequenceFailed)
+		self.startSequence.finished.connect(self.startDataTaking)
 		if not self.FWisPresent:
 			print("checking if firmware is on the SD card")
-			fwlist = subprocess.run(["fpgaconfig","-c",os.environ.get('Ph2_ACF_AREA')+'/test/CMSIT.xml',"-l"],stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-			print("firmwarelist is {0}".format(fwlist.stdout.decode('UTF-8')))
-			print("firmwareImage is {0}".format(self.firmwareImage))
-			if self.firmwareImage in fwlist.stdout.decode('UTF-8'):
-				self.FWisPresent = True
-				print("firmware saved")
-			else:
-				try:
-					self.fw_process.start("fpgaconfig",["-c","CMSIT.xml","-f","{}".format(os.environ.get("GUI_dir")+'/FirmwareImages/' + self.firmwareImage),"-i","{}".format(self.firmwareImage)])
-					print()
-					self.fw_process.waitForFinished()
-					self.FWisPresent = True
-				except:
-					print("unable to save {0} to FC7 SD card".format(os.environ.get("GUI_dir")+'/FirmwareImages/' + self.firmwareImage))
-
+			self.startSequence.addPhase("firmware check", "fpgaconfig", ["-c","CMSIT.xml","-l"], timeout = 30, onFinished = self.on_firmwareListed)
 		if not self.FWisLoaded:
-			self.fw_process.start("fpgaconfig",["-c","CMSIT.xml","-i", "{}".format(self.firmwareImage)])
-			self.fw_process.waitForFinished()
-			self.fw_process.start("CMSITminiDAQ",["-f","CMSIT.xml","-r"])
-			self.fw_process.waitForFinished()
-			self.FWisLoaded = True
-			print('Firmware image is now loaded')
-		
+			self.addFirmwareLoadPhases()
+		else:
+			print('Firmware image {0} already loaded on {1}, skipping reload'.format(self.firmwareImage,self.firmwareName))
+		self.startSequence.start()
+
+	def addFirmwareLoadPhases(self):
+		if self.startSequence.hasPhase("firmware load"):
+			return
+		self.startSequence.addPhase("firmware load", "fpgaconfig", ["-c","CMSIT.xml","-i", "{}".format(self.firmwareImage)], onFinished = self.on_firmwareLoading)
+		self.startSequence.addPhase("board reset", "CMSITminiDAQ", ["-f","CMSIT.xml","-r"], onFinished = self.on_firmwareLoaded)
+
+	def on_firmwareListed(self, phase, exitCode):
+		print("firmwarelist is {0}".format(phase.output))
+		print("firmwareImage is {0}".format(self.firmwareImage))
+		if self.firmwareImage in phase.output:
+			self.FWisPresent = True
+			self.FirmwareState.setStored(self.firmwareImage, self.firmwareChecksum)
+			print("firmware saved")
+		else:
+			self.startSequence.insertPhase("firmware upload", "fpgaconfig", ["-c","CMSIT.xml","-f","{}".format(self.firmwareImagePath),"-i","{}".format(self.firmwareImage)], timeout = 600, onFinished = self.on_firmwareUploaded)
+
+	def on_firmwareUploaded(self, phase, exitCode):
+		if exitCode != 0:
+			print("unable to save {0} to FC7 SD card".format(self.firmwareImagePath))
+			return False
+		self.FWisPresent = True
+		self.FirmwareState.setStored(self.firmwareImage, self.firmwareChecksum)
+		# The image under this name has changed, whatever runs on the board is stale
+		self.FirmwareState.invalidateLoaded()
+		self.FWisLoaded = False
+		self.addFirmwareLoadPhases()
+
+	def on_firmwareLoading(self, phase, exitCode):
+		if exitCode != 0:
+			print("unable to load {0} on {1}".format(self.firmwareImage, self.firmwareName))
+			return False
+
+	def on_firmwareLoaded(self, phase, exitCode):
+		if exitCode != 0:
+			print("unable to reset {0} after loading {1}".format(self.firmwareName, self.firmwareImage))
+			return False
+		self.FWisLoaded = True
+		self.FirmwareState.setLoaded(self.firmwareImage, self.firmwareChecksum)
+		print('Firmware image is now loaded')
+
+	def on_startPhase(self, name):
+		self.printInfo("{0}: {1}...".format(self.firmwareName, name))
+
+	def on_startSequenceOutput(self, text):
+		self.outputfile.write(text)
+		for textStr in text.split('\n'):
+			self.outputLine.emit(textStr)
+
+	def on_startSequenceFailed(self, name, reason):
+		self.outputString.emit("<font color=\"red\">Failed to prepare {0} ({1}): {2}</font>".format(self.firmwareName, name, reason))
+		self.FirmwareState.invalidateLoaded()
+		self.closeRunLogs(failed = reason)
+		self.halt = True
+		self.haltSignal.emit(self.halt)
+
+	def startDataTaking(self, timings):
+		logger.info("Run start-up on {0}: ".format(self.firmwareName) + ", ".join(["{0} {1:.1f} s".format(name, elapsed) for name, elapsed in timings.items()]))
+		self.startTimings = timings
+		self.profile.add("firmware", sum(timings.values()))
+		self.profile.setDetail("firmware_commands", { name : round(elapsed,3) for name, elapsed in timings.items() })
+
 		#self.run_process.start("python", ["signal_generator.py"])
 		#self.run_process.start("tail" , ["-n","6000", "/Users/czkaiweb/Research/Ph2_ACF_GUI/Gui/forKai.txt"])
 		#self.run_process.start("./SignalGenerator")
 
-		if Test[self.currentTest] in ["pixelalive","noise","latency","injdelay","clockdelay","threqu","thrmin","scurve","gainopt","thradj","physics","gain"]:
+		if Test[self.currentTest] in RunnableTests:
+			# Start-up of CMSITminiDAQ counts as hardware initialisation
+			self.profile.start("hardware_init")
 			self.run_process.start("CMSITminiDAQ", ["-f","CMSIT.xml", "-c", "{}".format(Test[self.currentTest])])
 		else:
-			self.info_process.start("echo",["test {} not runnable, quitting...".format(Test[self.currentTest])])
+			self.printInfo("test {} not runnable, quitting...".format(Test[self.currentTest]))
 	
 		#Question = QMessageBox()
 		#Question.setIcon(QMessageBox.Question)
@@ -374,8 +519,16 @@ class TestHandler(QObject):
 		reply = QMessageBox.question(None, "Abort", "Are you sure to abort?", QMessageBox.No | QMessageBox.Yes, QMessageBox.No)
 
 		if reply == QMessageBox.Yes:
+			if self.eventLog is not None:
+				self.eventLog.record("abort")
 			self.halt = True
+			if self.isStarting():
+				# No run process yet, so on_finish will not report the halt
+				self.startSequence.cancel()
+				self.closeRunLogs(halted = True)
+				self.haltSignal.emit(self.halt)
 			self.run_process.kill()
+			self.FirmwareState.invalidateLoaded()
 			#self.haltSignal.emit(self.halt)
 			self.starttime = None
 			if self.IVCurveHandler:
@@ -386,8 +539,18 @@ class TestHandler(QObject):
 			return
 
 	
+	def isStarting(self):
+		return self.startSequence is not None and self.startSequence.isRunning()
+
 	def urgentStop(self):
+		if self.eventLog is not None and not self.halt:
+			self.eventLog.record("interlock", reason = "global stop")
+		if self.isStarting():
+			self.startSequence.cancel()
+			self.closeRunLogs(halted = True)
 		self.run_process.kill()
+		# A killed run can leave the board in any state, reload before the next one
+		self.FirmwareState.invalidateLoaded()
 		self.halt = True
 		self.haltSignal.emit(self.halt)
 		self.starttime = None
@@ -397,7 +560,7 @@ class TestHandler(QObject):
 		try:
 			grade = {}
 			passmodule = {}
-			grade, passmodule, self.figurelist = ResultGrader(self.output_dir, self.currentTest, self.RunNumber, self.ModuleMap)
+			grade, passmodule, self.figurelist = timedResultGrader(self.profile, self.output_dir, self.currentTest, self.RunNumber, self.ModuleMap)
 			self.updateValidation.emit(grade, passmodule)
 
 			status = True
@@ -418,133 +581,40 @@ class TestHandler(QObject):
 			QMessageBox.critical(self,"Error","Process not finished",QMessageBox.Ok)
 			return
 
-		try:
-			if self.RunNumber == "-1":
-				os.system("cp {0}/test/Results/Run000000*.root {1}/".format(os.environ.get("Ph2_ACF_AREA"),self.output_dir))
-				#os.system("cp {0}/test/Results/Run000000*.txt {1}/".format(os.environ.get("Ph2_ACF_AREA"),self.output_dir))
-				#os.system("cp {0}/test/Results/Run000000*.xml {1}/".format(os.environ.get("Ph2_ACF_AREA"),self.output_dir))
-			else:
-				os.system("cp {0}/test/Results/Run{1}*.root {2}/".format(os.environ.get("Ph2_ACF_AREA"),self.RunNumber,self.output_dir))
-				#os.system("cp {0}/test/Results/Run{1}*.txt {2}/".format(os.environ.get("Ph2_ACF_AREA"),self.RunNumber,self.output_dir))
-				#os.system("cp {0}/test/Results/Run{1}*.xml {2}/".format(os.environ.get("Ph2_ACF_AREA"),self.RunNumber,self.output_dir))
-		except:
-			print("Failed to copy file to output directory")
+		# Results/ lives inside the run sandbox, ROOT files only need to be moved one level up
+		stager = FileStager("results of {}".format(self.currentTest))
+		ReleaseRunSandbox(self.workingDir, self.boardDir, Stager = stager)
+		stager.stage()
+		resultFiles = [target for target in stager.getTargets() if target.endswith(".root")]
+		self.stagingTime += stager.getElapsed()
+		self.profile.add("copy", stager.getElapsed())
+		logger.info("Staging time for {0}: {1:.3f} s".format(self.currentTest, self.stagingTime))
+		if resultFiles == []:
+			print("No ROOT file found in {0}/Results".format(self.workingDir))
+		elif self.RunNumber == "-1":
+			# No RunNumber.txt was seeded, take the run number Ph2_ACF actually used
+			self.RunNumber = os.path.basename(resultFiles[0]).split("_")[0].lstrip("Run")
 
 	def saveTestToDB(self):
 		if isActive(self.connection) and self.autoSave:
 			try:
-				localDir = self.output_dir
-				getFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "*.root"  '.format(localDir), shell=True, stdout=subprocess.PIPE)
-				fileList = getFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
-				moduleList = [module for module in localDir.split('_') if "Module" in module]
-
-				if fileList  == [""]:
-					logger.warning("No ROOT file found in the local folder, skipping...")
-					return
-
-				## Submit all files
-				for submitFile in fileList:
-					data_id = hashlib.md5('{}'.format(submitFile).encode()).hexdigest()
-					if not self.checkRemoteFile(data_id):
-						self.uploadFile(submitFile, data_id)
-
-					## Submit records for all modules
-					for module in moduleList:
-						#print ("Module is {0}".format(module))
-						module_id = module.strip('Module')
-						#print ("Module_ID is {0}".format(module_id))
-						getConfigInFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "CMSIT_RD53_{1}_*_IN.txt"  '.format(localDir,module_id), shell=True, stdout=subprocess.PIPE) #changed module_id to module
-						configInFileList = getConfigInFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
-						getConfigOutFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "CMSIT_RD53_{1}_*_OUT.txt"  '.format(localDir,module_id), shell=True, stdout=subprocess.PIPE) #changed module_id to module
-						configOutFileList = getConfigOutFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
-						getXMLFiles = subprocess.run('find {0} -mindepth 1  -maxdepth 1 -type f -name "*.xml"  '.format(localDir), shell=True, stdout=subprocess.PIPE)
-						XMLFileList = getXMLFiles.stdout.decode('utf-8').rstrip('\n').split('\n')
-						configcolumns = []
-						configdata = []
-						for configInFile in configInFileList:
-							if configInFile != [""]:
-								configcolumns.append("Chip{}InConfig".format(configInFile.split('_')[-2]))
-								configInBuffer = open(configInFile,'rb')
-								configInBin = configInBuffer.read()
-								configdata.append(configInBin)
-						for configOutFile in configOutFileList:
-							if configOutFile != [""]:
-								configcolumns.append("Chip{}OutConfig".format(configOutFile.split('_')[-2]))
-								configOutBuffer = open(configOutFile,'rb')
-								configOutBin = configOutBuffer.read()
-								configdata.append(configOutBin)
-						
-						xmlcolumns = []
-						xmldata = []
-						if len(XMLFileList) > 1:
-							print ("Warning!  There are multiple xml files here!")
-						for XMLFile in XMLFileList:
-							if XMLFile != [""]:
-								xmlcolumns.append("xml_file")
-								xmlBuffer = open(XMLFile, 'rb')
-								xmlBin = xmlBuffer.read()
-								xmldata.append(xmlBin)
-
-						#Columns = ["part_id","date","testname","description","grade","data_id","username", "config_file", "xml_file"]
-						#Columns = ["part_id","test_id","test_name","date","test_grade","user","Chip0InConfig","Chip0OutConfig","Chip1InConfig","Chip1OutConfig","Chip2InConfig","Chip2OutConfig","Chip3InConfig","Chip3OutConfig","plot1","plot2"]
-						Columns = ["part_id","test_id","test_name","date","test_grade","user","plot1","plot2","root_file"]
-						SubmitArgs = []
-						Value = []
-						record = formatter(localDir,Columns, part_id=module)
-						#record = formatter(localDir,Columns, part_id=str(module_id))
-						#for column in ['part_id']:
-						for column in Columns:
-							if column == "part_id":
-								SubmitArgs.append(column) 
-								Value.append(module) 
-							if column == "date":
-								SubmitArgs.append(column)
-								if str(sys.version).split(" ")[0].startswith(("3.7","3.8","3.9")):
-									TimeStamp = datetime.fromisoformat(localDir.split('_')[-2])
-								elif str(sys.version).split(" ")[0].startswith(("3.6")):
-									TimeStamp = datetime.strptime(localDir.split('_')[-2].split('.')[0], '%Y-%m-%dT%H:%M:%S')
-								#print ("timestamp is {0}".format(TimeStamp))
-								Value.append(TimeStamp)
-								#Value.append(record[Columns.index(column)])
-							if column == "test_name":
-								SubmitArgs.append(column)
-								Value.append(record[Columns.index(column)])
-							if column == "description":
-								SubmitArgs.append(column)
-								Value.append("No Comment")
-							if column == "test_grade":
-								SubmitArgs.append(column)
-								Value.append(-1)
-							if column == "test_id":
-								SubmitArgs.append(column)
-								Value.append(data_id)
-							if column == "user":
-								SubmitArgs.append(column)
-								Value.append(self.master.TryUsername)
-							if column == "root_file":
-								SubmitArgs.append(column)
-								Value.append(submitFile.split("/")[-1])
-
-						SubmitArgs = SubmitArgs + configcolumns + xmlcolumns
-						Value = Value + configdata + xmldata
-			
-						try:
-							insertGenericTable(self.connection, "module_tests", SubmitArgs, Value)
-						except:
-							print("Failed to insert")
+				timedUpload(self.profile, self.uploadTestToDB, self.output_dir)
 			except Exception as err:
 				QMessageBox.information(self,"Error","Unable to save to DB", QMessageBox.Ok)
 				print("Error: {}".format(repr(err)))
 				return
 
-	def checkRemoteFile(self, file_id):
-		remoteRecords = retrieveWithConstraint(self.connection,"result_files",file_id = file_id, columns = ["file_id"])
-		return remoteRecords != []
+	def uploadTestToDB(self, localDir, connection = None):
+		# No GUI calls in here, the post-processing thread passes its own connection
+		uploadTestToDB(connection if connection is not None else self.connection, localDir, self.master.TryUsername)
+
+	def currentPlots(self):
+		return [plot for plots in self.figurelist.values() for plot in plots]
+
+	def openUploadConnection(self):
+		# Called on the post-processing thread
+		return openConnection(self.master.TryUsername, self.master.TryPassword, self.master.TryHostAddress, self.master.TryDatabase)
 
-	def uploadFile(self, fileName, file_id):
-		fileBuffer = open(fileName, 'rb')
-		data = fileBuffer.read()
-		insertGenericTable(self.connection, "result_files", ["file_id","file_content"],[file_id,data])
 	#######################################################################
 	##  For real-time terminal display
 	#######################################################################
@@ -552,127 +622,94 @@ class TestHandler(QObject):
 	@QtCore.pyqtSlot()
 	def on_readyReadStandardOutput(self):
 		if self.readingOutput == True:
-			print("Thread competition detected")
+			# Re-entered from the loop below, which reads this data before it returns
 			return
 		self.readingOutput = True
-		
-		alltext = self.run_process.readAllStandardOutput().data().decode()
-		self.outputfile.write(alltext)
-		#outputfile.close()
-		textline = alltext.split('\n')
-		#fileLines = open(self.outputFile,"r")
-		#textline = fileLines.readlines()
-
-		for textStr in textline:
-			try: 
-				if self.starttime != None:
-					self.currentTime = time.time()
-					runningTime = self.currentTime - self.starttime
-					self.runwindow.ResultWidget.runtime[self.testIndexTracker].setText('{0} s'.format(round(runningTime,1)))
-				else:
-					self.starttime = time.time()
-					self.currentTime = self.starttime
-			
-			except Exception as err:
-				logger.info("Error occures while parsing running time, {0}".format(err))
+		try:
+			while self.run_process.bytesAvailable() > 0:
+				alltext = self.outputAssembler.decode(self.run_process.readAllStandardOutput().data())
+				self.outputfile.write(alltext)
+				self.updateRunningTime()
+				for event in self.outputTokenizer.tokenizeLines(self.outputAssembler.feed(alltext)):
+					self.processOutputEvent(event)
+		finally:
+			self.readingOutput = False
+
+	def flushOutput(self):
+		# Whatever is left once CMSITminiDAQ has exited
+		self.on_readyReadStandardOutput()
+		for event in self.outputTokenizer.tokenizeLines(self.outputAssembler.flush()):
+			self.processOutputEvent(event)
+
+	def updateRunningTime(self):
+		try:
+			if self.starttime != None:
+				self.currentTime = time.time()
+				runningTime = self.currentTime - self.starttime
+				self.widgetThrottle.set(self.runwindow.ResultWidget.runtime[self.testIndexTracker], "setText", '{0} s'.format(round(runningTime,1)))
+			else:
+				self.starttime = time.time()
+				self.currentTime = self.starttime
+		except Exception as err:
+			logger.info("Error occures while parsing running time, {0}".format(err))
+
+	def processOutputEvent(self, event):
+		self.eventLog.recordOutputEvent(event)
+		# Plain lines of the data taking phase only get here with ConsoleShowDataTaking, see OutputTokenizer
+		if self.ProgressingMode == "Perform":
+			if event.kind == ProgressEvent:
+				self.ProgressValue = event.progress
+				if self.ProgressValue == 100:
+					self.ProgressingMode = "Summary"
+					self.profile.stop("data_taking")
+					self.profile.start("summary")
+				try:
+					self.widgetThrottle.set(self.runwindow.ResultWidget.ProgressBar[self.testIndexTracker], "setValue", self.ProgressValue)
+				except Exception as err:
+					logger.info("Error occures while updating the progress, {0}".format(err))
+			if not self.outputTokenizer.quietDataTaking:
+				self.outputLine.emit(event.line)
+			return
 
-			if self.ProgressingMode == "Perform":			
-				if ">>>> Progress :" in textStr:
-					try:
-						index = textStr.split().index("Progress")+2
-						self.ProgressValue = float(textStr.split()[index].rstrip("%"))
-						if self.ProgressValue == 100:
-							self.ProgressingMode = "Summary"
-						self.runwindow.ResultWidget.ProgressBar[self.testIndexTracker].setValue(self.ProgressValue)										
-					except:
-						pass
-					
-				continue
-			#	if ("Global threshold for" in textStr):
-
-			elif (self.ProgressingMode == "Summary"):
-				toUpdate, UpdatedFEKey, valueIndex = self.updateNeeded(textStr)
-				if toUpdate:
-					try:
-						#print("made it to Summary")
-						UpdatedValuetext = textStr.split()[valueIndex]
-						#print(re.sub(r'\033\[(\d|;)+?m','',globalThresholdtext))
-						UpdatedValue = int(re.sub(r'\033\[(\d|;)+?m','',UpdatedValuetext))
-						print("New {0} value is {1}".format(UpdatedFEKey,UpdatedValue))
-						#print(textStr.split())
-						#globalThreshold = int(textStr.split()[-1])
-						chipIdentifier = textStr.split('=')[-1].split('is')[0]
-						chipIdentifier = re.sub(r'\033\[(\d|;)+?m','',chipIdentifier).split(']')[0]
-						HybridIDKey = chipIdentifier.split("/")[2]
-						ChipIDKey = chipIdentifier.split("/")[3]
-						print("Hybrid id {0}".format(HybridIDKey))
-						print("chipID {0}".format(ChipIDKey))
-						updatedXMLValueKey = "{}/{}".format(HybridIDKey,ChipIDKey)
-						updatedXMLValues[updatedXMLValueKey][UpdatedFEKey] = UpdatedValue
-						
-					except Exception as err:
-						logger.error("Failed to update ")
-										
-			elif "@@@ Initializing the Hardware @@@" in textStr:
-				self.ProgressingMode = "Configure"
-			elif "@@@ Performing" in textStr:
-				self.ProgressingMode = "Perform"
-				self.outputString.emit('<b><span style="color:#ff0000;"> Performing the {} test </span></b>'.format(self.currentTest))
-
-			text = textStr.encode('ascii')
-			numUpAnchor, text = parseANSI(text)
-			#if numUpAnchor > 0:
-			#	textCursor = self.ConsoleView.textCursor()
-			#	textCursor.beginEditBlock()
-			#	textCursor.movePosition(QTextCursor.End, QTextCursor.MoveAnchor)
-			#	textCursor.movePosition(QTextCursor.StartOfLine, QTextCursor.KeepAnchor)
-			#	for numUp in range(numUpAnchor):
-			#		textCursor.movePosition(QTextCursor.Up, QTextCursor.KeepAnchor)
-			#	textCursor.removeSelectedText()
-			#	textCursor.deletePreviousChar()
-			#	textCursor.endEditBlock()
-			#	self.ConsoleView.setTextCursor(textCursor)
-			self.outputString.emit(text.decode("utf-8"))
-			#textCursor = self.runwindow.ConsoleView.textCursor()
-			#self.runwindow.ConsoleView.setTextCursor(textCursor)
-			#self.runwindow.ConsoleView.appendHtml(text.decode("utf-8"))
-		self.readingOutput = False
+		elif self.ProgressingMode == "Summary":
+			if event.kind == RegisterEvent:
+				print("New {0} value is {1} for chip {2}".format(event.register,event.value,event.chipKey))
+				self.updatedXMLValues[event.chipKey][event.register] = event.value
+
+		elif event.kind == PhaseEvent and event.phase == "configure":
+			self.ProgressingMode = "Configure"
+			self.profile.start("hardware_init")
+		elif event.kind == PhaseEvent and event.phase == "perform":
+			self.ProgressingMode = "Perform"
+			self.profile.stop("hardware_init")
+			self.profile.start("data_taking")
+			self.outputString.emit('<b><span style="color:#ff0000;"> Performing the {} test </span></b>'.format(self.currentTest))
+
+		self.outputLine.emit(event.line)
 
-	def updateNeeded(self,textStr):
-		currentTest = Test[self.currentTest]
-		if  currentTest in ["thradj","thrmin"] and "Global threshold for" in textStr:
-			return True,"Vthreshold_LIN",-1
-		elif currentTest in ["gainopt"] and "Krummenacher Current" in textStr:
-			return True,"KRUM_CURR_LIN",-1
-		elif currentTest in ["injdelay"]:
-			if "New latency dac" in textStr:
-				return True,"LATENCY_CONFIG",-2
-			elif "New injection delay" in textStr:
-				return True,"INJECTION_SELECT",-2
-			else:
-				return (False, None, 0)
-		else:
-			return (False, None, 0)
 	# Reads data that is normally printed to the terminal and saves it to the output file	
 	@QtCore.pyqtSlot()
-	def on_readyReadStandardOutput_info(self):
-		if os.path.exists(self.outputFile):
-			outputfile = open(self.outputFile,"a")
-		else:
-			outputfile = open(self.outputFile,"w")
-		
-		alltext = self.info_process.readAllStandardOutput().data().decode()
-		outputfile.write(alltext)
-		outputfile.close()
-		textline = alltext.split('\n')
-
-		for textStr in textline:
-			self.outputString.emit(textStr)
-			#self.ConsoleView.appendHtml(textStr)
+	def printInfo(self, text):
+		self.outputfile.write(text+'\n')
+		self.outputString.emit(text)
 		
+	def closeRunLogs(self, **fields):
+		# output.txt and events.jsonl, fields go into the finish event
+		self.outputfile.close()
+		if self.eventLog is not None:
+			self.eventLog.close(**fields)
+			self.eventLog = None
+
 	@QtCore.pyqtSlot()
 	def on_finish(self):
-		self.outputfile.close()
+		self.flushOutput()
+		self.widgetThrottle.flush()
+		self.closeRunLogs(exitCode = self.run_process.exitCode(), crashed = self.run_process.exitStatus() != QProcess.NormalExit, halted = self.halt)
+		for phase in ["hardware_init", "data_taking", "summary"]:
+			self.profile.stop(phase)
+
+		if self.run_process.exitStatus() != QProcess.NormalExit or self.run_process.exitCode() != 0:
+			self.FirmwareState.invalidateLoaded()
 
 		# While the process is killed:
 		if self.halt == True:
@@ -699,6 +736,18 @@ class TestHandler(QObject):
 
 		# Save the output ROOT file to output_dir
 		self.saveTest()
+		self.profile.save()
+		self.recordStep(self.output_dir)
+		logger.info("Timing of {0} on {1}: {2}".format(self.currentTest, self.firmwareName, self.profile.summary()))
+
+		if self.pipelined and isCompositeTest(self.info[1]):
+			# The OUT configs and updatedXMLValues are all the next step needs,
+			# grade and upload this one while the next one takes data
+			step = "{}:{}".format(self.testIndexTracker,self.currentTest)
+			upload = self.uploadTestToDB if self.autoSave and isActive(self.connection) else None
+			self.postProcessor.submit(PostProcessingJob(step, self.currentTest, self.output_dir, self.RunNumber, self.ModuleMap, upload, self.profile))
+			self.runTest()
+			return
 
 		# validate the results
 		status = self.validateTest()
@@ -708,9 +757,10 @@ class TestHandler(QObject):
 		print(self.figurelist)
 
 		notAccept = False
-		if status == False:
+		if status == False and self.interactive:
 			for key in self.figurelist.keys():
 				for plot in self.figurelist[key]:
+					renderQueue.request(plot, RenderWaitTimeout)
 					dialog = QResultDialog(self,plot)
 					result = dialog.exec_()
 					if result:
@@ -732,12 +782,48 @@ class TestHandler(QObject):
 			self.saveTestToDB()
 		#self.update()
 
-		if status == False and isCompositeTest(self.info[1]) and self.testIndexTracker < len(CompositeList[self.info[1]]):
+		if status == False and self.interactive and isCompositeTest(self.info[1]) and self.testIndexTracker < len(CompositeList[self.info[1]]):
 			self.forceContinue()
 
 		if isCompositeTest(self.info[1]):
 			self.runTest()
 
+	def on_stepGraded(self, job):
+		if job.gradeError != "":
+			self.outputString.emit("<font color=\"red\">Grading of {0} failed: {1}</font>".format(job.step, job.gradeError))
+			return
+		self.figurelist = job.figurelist
+		self.updateValidation.emit(job.grade, job.passmodule)
+		status = job.isPassed()
+
+		notAccept = False
+		if status == False and self.interactive:
+			for key in job.figurelist.keys():
+				for plot in job.figurelist[key]:
+					renderQueue.request(plot, RenderWaitTimeout)
+					dialog = QResultDialog(self,plot)
+					result = dialog.exec_()
+					if result:
+						continue
+					else:
+						notAccept = True
+		if notAccept:
+			self.abortTest()
+
+		self.historyRefresh.emit(self.modulestatus)
+		if self.master.expertMode:
+			self.updateResult.emit(job.output_dir)
+		else:
+			self.updateResult.emit((job.step,job.figurelist))
+
+		# Later steps are already running, only ask while there are some left
+		if status == False and self.interactive and not self.halt and self.testIndexTracker != 0:
+			self.forceContinue()
+
+	def on_stepUploaded(self, job):
+		if job.uploadError != "":
+			QMessageBox.information(None,"Error","Unable to save {} to DB".format(job.step), QMessageBox.Ok)
+
 	def updateMeasurement(self, measureType, measure):
 		print(measure)
 		if measureType == "IVCurve":
@@ -790,6 +876,7 @@ class TestHandler(QObject):
 
 	def IVCurveFinished(self):
 		self.testIndexTracker += 1
+		self.recordStep("")
 		if isCompositeTest(self.info[1]):
 			self.runTest()
 
@@ -799,6 +886,7 @@ class TestHandler(QObject):
 		self.LVpowersupply.setCompCurrent(compcurrent = 1.05) # Fixed for different chip
 		self.LVpowersupply.TurnOn()
 		self.testIndexTracker += 1
+		self.recordStep("")
 		if isCompositeTest(self.info[1]):
 			self.runTest()
 
@@ -812,6 +900,9 @@ class TestHandler(QObject):
 		if reply == QMessageBox.Yes:
 			return
 		else:
+			if self.isStarting():
+				self.startSequence.cancel()
+				self.closeRunLogs(halted = True)
 			self.run_process.kill()
 			self.halt = True
 			self.haltSignal.emit(self.halt)
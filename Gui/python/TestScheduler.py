@@ -0,0 +1,59 @@
+'''
+  TestScheduler.py
+  brief                 Scheduler for concurrent test sessions on several FC7 boards
+  version               0.1
+'''
+from PyQt5 import QtCore
+from PyQt5.QtCore import *
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TestScheduler(QObject):
+	sessionsChanged = pyqtSignal(object)
+
+	def __init__(self, master):
+		super(TestScheduler,self).__init__()
+		self.master = master
+		# One run window (and therefore one TestHandler/QProcess) per FC7 board
+		self.sessions = {}
+
+	def addSession(self, firmwareName, runwindow):
+		if self.isBusy(firmwareName):
+			logger.warning("{} already has an active session, replacing it".format(firmwareName))
+		self.sessions[firmwareName] = runwindow
+		self.master.ProcessingTest = True
+		self.sessionsChanged.emit(list(self.sessions.keys()))
+
+	def removeSession(self, firmwareName):
+		if firmwareName in self.sessions.keys():
+			self.sessions.pop(firmwareName)
+		self.master.ProcessingTest = self.hasSessions()
+		self.sessionsChanged.emit(list(self.sessions.keys()))
+
+	def getSession(self, firmwareName):
+		return self.sessions.get(firmwareName, None)
+
+	def isBusy(self, firmwareName):
+		return firmwareName in self.sessions.keys()
+
+	def hasSessions(self):
+		return len(self.sessions) > 0
+
+	def isRunning(self, firmwareName):
+		runwindow = self.getSession(firmwareName)
+		if runwindow is None:
+			return False
+		testHandler = runwindow.testHandler
+		return testHandler.isStarting() or testHandler.run_process.state() != QProcess.NotRunning
+
+	def runAll(self):
+		# Every session drives its own QProcess, so starting them back to back
+		# runs CMSITminiDAQ on all boards at the same time.
+		for firmwareName, runwindow in list(self.sessions.items()):
+			if self.isRunning(firmwareName):
+				continue
+			logger.info("Starting test session on {}".format(firmwareName))
+			runwindow.resetConfigTest()
+			runwindow.initialTest()
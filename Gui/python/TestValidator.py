@@ -1,52 +1,35 @@
-import ROOT
-ROOT.gROOT.SetBatch(ROOT.kTRUE)
-
 import os
 import re
+import time
+import numpy
+import threading
 from collections import defaultdict
 from  Gui.GUIutils.settings import *
 from  Gui.python.ROOTInterface import *
+from  Gui.python.GradingPool import gradingPool
+from  Gui.python.RenderQueue import RenderJob, renderQueue
+from  Gui.python.PlotCache import plotCache, plotFormat
 
 def ResultGrader(inputDir, testName, runNumber, ModuleMap = {}):
 	Grade = {}
 	PassModule = {}
+	figureList = {}
 	ExpectedModuleList = [ module.lstrip("Module") for module in inputDir.split('_') if "Module" in module]
-	if testName in ["PixelAlive","NoiseScan","SCurveScan","GainScan","InjectionDelay","GainOptimization","ThresholdAdjustment","ThresholdEqualization"]:
-		try:
-			CanvasList = {}
-			FileName = "{0}/Run{1}_{2}.root".format(inputDir,runNumber,TestName2File[testName])
-			if os.path.isfile(FileName):
-				Nodes = GetDirectory(FileName)
-				for Node in Nodes:
-					CanvasList = GetCanvasVAL(Node, CanvasList,ModuleMap)
-				Grade, PassModule, figureList = eval("Grade{}(CanvasList)".format(testName))
-				if set(Grade.keys()) != set(ExpectedModuleList):
-					logger.warning("Retrived modules from ROOT file doesn't match with folder name")
-			else:
-				for module in ExpectedModuleList:
-					Grade[module] = {0 : -1.0}
-					PassModule[module] = {0: False}
-					figureList = {}
-		except Exception as err:
+	try:
+		FileName = "{0}/Run{1}_{2}.root".format(inputDir,runNumber,TestName2File[testName])
+		if os.path.isfile(FileName):
+			Grade, PassModule, figureList = GradeFile(FileName, testName, ModuleMap)
+			if set(Grade.keys()) != set(ExpectedModuleList):
+				logger.warning("Retrived modules from ROOT file doesn't match with folder name")
+		else:
+			for module in ExpectedModuleList:
+				Grade[module] = {0 : -1.0}
+				PassModule[module] = {0: False}
+				figureList = {}
+	except Exception as err:
+		if testName in GradingSpecs:
 			print("Failed to get the score: {}".format(repr(err)))
-			
-	else:
-		try:
-			CanvasList = {}
-			FileName = "{0}/Run{1}_{2}.root".format(inputDir,runNumber,TestName2File[testName])
-			if os.path.isfile(FileName):
-				Nodes = GetDirectory(FileName)
-				for Node in Nodes:
-					CanvasList = GetCanvasVAL(Node, CanvasList, ModuleMap)
-				Grade, PassModule, figureList = FakeGrade(CanvasList)
-				if set(Grade.keys()) != set(ExpectedModuleList):
-					logger.warning("Retrived modules from ROOT file doesn't match with folder name")
-			else:
-				for module in ExpectedModuleList:
-					Grade[module] = {0 : -1.0}
-					PassModule[module] = {0: False}
-					figureList = {}
-		except Exception as err:
+		else:
 			print("Failed to get the fake score: {}".format(repr(err)))
 
 	for key in Grade.keys():
@@ -63,7 +46,89 @@ def ResultGrader(inputDir, testName, runNumber, ModuleMap = {}):
 	print(PassModule)
 	return Grade, PassModule, figureList
 
+def timedResultGrader(profile, inputDir, testName, runNumber, ModuleMap):
+	# Grading draws its plots as it goes, book the drawing as rendering
+	resetRenderTime()
+	startTime = time.time()
+	try:
+		return ResultGrader(inputDir, testName, runNumber, ModuleMap)
+	finally:
+		if profile is not None:
+			rendering = getRenderTime()
+			profile.add("rendering", rendering)
+			profile.add("grading", time.time() - startTime - rendering)
+			profile.save()
+
+def GradeFile(FileName, testName, ModuleMap):
+	'''
+	Grades every module of ModuleMap, one per grading process. A single
+	module goes to the pool as well, this runs on the threads of several
+	boards and ROOT is not read from them. Results are merged into the
+	dicts Grade<Test> returns.
+	'''
+	modules = defaultdict(dict)
+	for ModulePath, ModuleName in ModuleMap.items():
+		modules[ModuleName][ModulePath] = ModuleName
+	results = None
+	# Hashed once here rather than in every grading process
+	sourceDigest = plotCache.sourceDigest(FileName)
+	if ParallelGrading:
+		results = gradingPool.map(GradeModules, [(FileName, testName, moduleMap, sourceDigest) for moduleMap in modules.values()])
+		if results is not None:
+			for result in results:
+				# Drawn in the worker, booked here
+				addRenderTime(result[3])
+	if results is None:
+		results = [GradeModules(FileName, testName, ModuleMap, sourceDigest)]
+
+	Grade, PassModule, figureList = {}, {}, defaultdict(lambda:[])
+	for grade, passModule, figures, renderTime, renderJobs in results:
+		Grade.update(grade)
+		PassModule.update(passModule)
+		for key, files in figures.items():
+			figureList[key] += files
+		for job in renderJobs:
+			renderQueue.add(job)
+	return Grade, PassModule, figureList
+
+def GradeModules(FileName, testName, ModuleMap, sourceDigest = None):
+	# Runs in the grading processes, returns only what can be pickled
+	renderStart = getRenderTime()
+	CanvasList = {}
+	RenderRequests.sourceFile = FileName
+	RenderRequests.digest = sourceDigest
+	RenderRequests.jobs = []
+	try:
+		# Only canvases of the modules in ModuleMap are listed, only the graded histograms read
+		with HistogramFile(FileName, classNames = ["TCanvas"]) as Nodes:
+			for Node in Nodes:
+				CanvasList = GetCanvasVAL(Node, CanvasList, ModuleMap)
+			grade, passModule, figureList = GradingSpecs.get(testName, FakeSpec).grade(CanvasList)
+		return grade, passModule, dict(figureList), getRenderTime() - renderStart, RenderRequests.jobs
+	finally:
+		RenderRequests.jobs = None
+
+# Plots asked for while grading, per thread since grading runs on several
+RenderRequests = threading.local()
+
+def ScheduleCanvas(tmpDir, CanvasNode, name):
+	'''
+	Returns the file the canvas is rendered to. While grading, the plot
+	comes from the PlotCache and the render is left to the RenderQueue,
+	elsewhere it happens right away.
+	'''
+	jobs = getattr(RenderRequests, "jobs", None)
+	format, size = plotFormat(CanvasNode.getKeyName())
+	outputFile = plotCache.plotFile(RenderRequests.sourceFile, CanvasNode.getPath(), format, size, RenderRequests.digest) if jobs is not None else None
+	if outputFile is None:
+		if format == "png":
+			return TCanvas2PNG(tmpDir, CanvasNode.getCanvas(), name, size)
+		return TCanvas2SVG(tmpDir, CanvasNode.getCanvas(), name)
+	jobs.append(RenderJob(RenderRequests.sourceFile, CanvasNode.getPath(), outputFile, size))
+	return outputFile
+
 def GetCanvasVAL(node,canvasList,ModuleMap):
+	# canvasList[ModuleName][CanvasName] is the Node of the canvas, nothing is read yet
 	if node.getDaugthers() != []:
 			for Node in node.getDaugthers():
 				if Node.getClassName() ==  "TCanvas":
@@ -78,540 +143,183 @@ def GetCanvasVAL(node,canvasList,ModuleMap):
 						ModuleName = ModuleMap[ModulePath]
 					else:
 						continue
-					#Module_ID_Sec = CanvasName.split("_")[2] ##To be CHECKED!!!!!
-					#if ("H" in Module_ID_Sec):
-					#	Module_ID = Module_ID_Sec.lstrip("H(").rstrip(")")
-					#elif ("M" in Module_ID_Sec):
-					#	Module_ID = Module_ID_Sec.lstrip("M(").rstrip(")")
-					#elif ("O" in Module_ID_Sec):
-					#	Module_ID = Module_ID_Sec.lstrip("O(").rstrip(")")
-					#else:
-					#	Module_ID = -1
-					#Chip_ID = CanvasName.split("_")[5].lstrip("O(").rstrip(")")
 					if ModuleName not in canvasList.keys():
 						canvasList[ModuleName] = {}
-						canvasList[ModuleName][CanvasName] = Node.getObject()
-					else:
-						canvasList[ModuleName][CanvasName] = Node.getObject()
+					canvasList[ModuleName][CanvasName] = Node
 				canvasList = GetCanvasVAL(Node, canvasList,ModuleMap)
 			return canvasList
 	else:
 		return canvasList
 
-def GradePixelAlive(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-
-			PlotName = CanvasName.split("_")[4]
-			if PlotName in ["Occ1D","PixelAlive","ToT1D","ToT2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-		
-			if "Occ1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				AvgOccu = CanvasHist.GetMean()
-				factorPerModule[key][Chip_ID]["AvgOccu"] = AvgOccu
-			if "PixelAlive" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist2D = CanvasObj.GetPrimitive(CanvasName)
-				RowRange = [0,191]
-				nRowRange = RowRange[1]-RowRange[0]+1
-				ColRange = [128,263]
-				nColRange = ColRange[1]-ColRange[0]+1
-				Hist2D_Scanned = ROOT.TH2F("Hist2D_Scanned","Hist2D_Scanned", \
-					nColRange, -0.5, nColRange-0.5,	\
-					nRowRange, -0.5, nRowRange-0.5)
-				Hist2D_Ref = ROOT.TH2F("Hist2D_Ref","Hist2D_Ref", \
-					nColRange, -0.5, nColRange-0.5,	\
-					nRowRange, -0.5, nRowRange-0.5)
-
-				Eff_threshold = 0.90
-				for row in range(RowRange[0]+1,RowRange[1]+1):
-					for col in range(ColRange[0]+1,ColRange[1]+1):
-						Hist2D_Scanned.SetBinContent(col-ColRange[0],row-RowRange[0],  0.0 if CanvasHist2D.GetBinContent(col,row) > Eff_threshold else 1.0)
-
-				for row in range(RowRange[0]+1,RowRange[1]+1):
-					for col in range(ColRange[0]+1,ColRange[1]+1):	
-						Hist2D_Ref.SetBinContent(col-ColRange[0],row-RowRange[0],	\
-						1.0 if max( \
-							Hist2D_Scanned.GetBinContent((col+1)%nColRange,row), \
-							Hist2D_Scanned.GetBinContent((col-1)%nColRange,row), \
-							Hist2D_Scanned.GetBinContent(col,(row+1)%nRowRange), \
-							Hist2D_Scanned.GetBinContent(col,(row-1)%nRowRange)) \
-							> Eff_threshold else 0.0)
-
-				#nLowEffBins = Hist2D_Scanned.Integral()
-				nLowEffBinsNonIso = Hist2D_Ref.Integral()
-				factorPerModule[key][Chip_ID]["numLowEffNonIsoBin"] = nLowEffBinsNonIso
-
-	nLowEffBinsThreshold = 200
-	ChipThreshold = 0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			factorLowEff = (1-factorPerModule[Module_ID][Chip_ID]["numLowEffNonIsoBin"]/nLowEffBinsThreshold)
-			score =  factorPerModule[Module_ID][Chip_ID]["AvgOccu"] * 0 if factorLowEff < 0.0 else factorLowEff
-			GradePerChip[Chip_ID] = score
-			passChip[Chip_ID] = score > ChipThreshold 
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeNoiseScan(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-
-			PlotName = CanvasName.split("_")[4]
-			if PlotName in ["Occ1D","PixelAlive","ToT1D","ToT2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Occ1D" in CanvasName:
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				AvgOccu = CanvasHist.GetMean()
-				factorPerModule[key][Chip_ID]["AvgOccu"] = AvgOccu
-
-	ChipThreshold = 0.99
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  1 - factorPerModule[Module_ID][Chip_ID]["AvgOccu"] 
-			GradePerChip[Chip_ID] = score 
-			passChip[Chip_ID] = score > ChipThreshold 
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-	
-def GradeSCurveScan(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			PlotName = CanvasName.split("_")[4]
-
-			if PlotName in ["SCurves","Threshold1D","Noise1D","Threshold2D","Noise2D","ToT2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Threshold1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				StdDev1D = CanvasHist.GetStdDev()
-				factorPerModule[key][Chip_ID]["StdDev1D"] = StdDev1D
-
-	StdThreshold = 15.0
-	ChipThreshold = -0.1
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  1 - factorPerModule[Module_ID][Chip_ID]["StdDev1D"]/StdThreshold
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeGainScan(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			
-			if PlotName in ["Gain","Intercept1D","Slope1D","InterceptLowQ1D","SlopeLowQ1D","Chi2DoF1D","Intercept2D","Slope2D","InterceptLowQ2D","SlopeLowQ2D","Chi2DoF2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Threshold1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				StdDev1D = CanvasHist.GetStdDev()
-				factorPerModule[key][Chip_ID]["StdDev1D"] = StdDev1D
-
-			## To Be Corrected
-			if True:
-				factorPerModule[key][Chip_ID]["fakeScore"] = 1.0
-
-	ChipThreshold = -0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["fakeScore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeInjectionDelay(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			PlotName = CanvasName.split("_")[4]
-
-			outputFileName = "{}_{}".format(key,CanvasName)
-			CanvasObj = CanvasPerModule[CanvasName]
-			outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-			figureList[key].append(outputFile)
-			
-			factorPerModule[key][Chip_ID]["injectionscore"] = 1.0
-
-	ChipThreshold = -0.1
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["injectionscore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeGainOptimization(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			
-			PlotName = CanvasName.split("_")[4]
-			if PlotName in ["Gain","Intercept1D","Slope1D","InterceptLowQ1D","SlopeLowQ1D","Chi2DoF1D","Intercept2D","Slope2D","InterceptLowQ2D","SlopeLowQ2D","Chi2DoF2D","KrumCurr"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Threshold1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				StdDev1D = CanvasHist.GetStdDev()
-				factorPerModule[key][Chip_ID]["StdDev1D"] = StdDev1D
-
-			if True:
-				factorPerModule[key][Chip_ID]["fakeScore"] = 1.0
-
-	ChipThreshold = -0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["fakeScore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeThresholdAdjustment(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			
-			PlotName = CanvasName.split("_")[4]
-			if PlotName in ["Threshold","Occ1D","PixelAlive","ToT1D","ToT2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Threshold1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				StdDev1D = CanvasHist.GetStdDev()
-				factorPerModule[key][Chip_ID]["StdDev1D"] = StdDev1D
-
-			if True:
-				factorPerModule[key][Chip_ID]["fakeScore"] = 1.0
-
-	ChipThreshold = -0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["fakeScore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def GradeThresholdEqualization(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-			
-			PlotName = CanvasName.split("_")[4]
-			if PlotName in ["ThrEqualization","TDAC","Occ1D","PixelAlive","ToT1D","ToT2D"]:
-				outputFileName = "{}_{}".format(key,CanvasName)
-				CanvasObj = CanvasPerModule[CanvasName]
-				outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-				figureList[key].append(outputFile)
-			
-			if "Threshold1D" in CanvasName:
-				CanvasObj = CanvasPerModule[CanvasName]
-				CanvasHist = CanvasObj.GetPrimitive(CanvasName)
-				StdDev1D = CanvasHist.GetStdDev()
-				factorPerModule[key][Chip_ID]["StdDev1D"] = StdDev1D
-
-			if True:
-				factorPerModule[key][Chip_ID]["fakeScore"] = 1.0
-
-	ChipThreshold = -0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["fakeScore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
-
-def FakeGrade(canvasList):
-	grade = {}
-	passModule = {}
-	factorPerModule = {}
-	figureList = defaultdict(lambda:[])
-	# Saving histogram for future check
-	tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
-	if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
-		try:
-			os.mkdir(tmpDir)
-			logger.info("Creating "+tmpDir)
-		except:
-			logger.warning("Failed to create "+tmpDir)
-	if len(canvasList.keys())==0:
-		return grade
-	for key in canvasList.keys():
-		CanvasPerModule = canvasList[key]
-		factorPerModule[key] = {}
-		for CanvasName in CanvasPerModule.keys():
-			Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
-			if Chip_ID not in factorPerModule[key].keys():
-				factorPerModule[key][Chip_ID] = {}
-
-			outputFileName = "{}_{}".format(key,CanvasName)
-			CanvasObj = CanvasPerModule[CanvasName]
-			outputFile = TCanvas2SVG(tmpDir,CanvasObj,outputFileName)
-			figureList[key].append(outputFile)
-
-			if True:
-				factorPerModule[key][Chip_ID]["fakeScore"] = 1.0
-
-	ChipThreshold = 0.5
-
-	for Module_ID in factorPerModule.keys():
-		GradePerChip = {}
-		passChip = {}
-		for Chip_ID in factorPerModule[Module_ID].keys():
-			score =  factorPerModule[Module_ID][Chip_ID]["fakeScore"]
-			GradePerChip[Chip_ID] = score if score > 0.0 else 0.0
-			passChip[Chip_ID] = score > ChipThreshold
-		if GradePerChip != {}:
-			grade[Module_ID] = GradePerChip
-			passModule[Module_ID] = passChip
-		else:
-			grade[Module_ID] = {0 : -1}
-			passModule[Module_ID] = {0 : False}
-	return grade, passModule, figureList
+def CountLowEffNonIsolatedMaps(maps, RowRange = [0,191], ColRange = [128,263], Eff_threshold = 0.90):
+	'''
+	Pixels of the linear front end with a low efficiency neighbour, for a
+	stack of maps [chip][ybin][xbin] as HistToArray gives them. Counted
+	exactly as the former loops over Hist2D_Scanned/Hist2D_Ref did (kept in
+	Gui/benchmark/benchPixelAlive.py): neighbours wrap with the window size
+	and bins outside a histogram read its under/overflow bin.
+	'''
+	nRowRange = RowRange[1]-RowRange[0]+1
+	nColRange = ColRange[1]-ColRange[0]+1
+	rows = numpy.arange(RowRange[0]+1,RowRange[1]+1)[:,numpy.newaxis]
+	cols = numpy.arange(ColRange[0]+1,ColRange[1]+1)[numpy.newaxis,:]
+
+	# Hist2D_Scanned with its under/overflow bins: 1.0 for low efficiency pixels
+	scanned = numpy.zeros(maps.shape[:-2] + (nRowRange+2, nColRange+2))
+	sourceBins = maps[..., numpy.clip(rows,0,maps.shape[-2]-1), numpy.clip(cols,0,maps.shape[-1]-1)]
+	scanned[..., rows-RowRange[0], cols-ColRange[0]] = numpy.where(sourceBins > Eff_threshold, 0.0, 1.0)
+
+	def scannedBins(rowBins, colBins):
+		return scanned[..., numpy.clip(rowBins,0,nRowRange+1), numpy.clip(colBins,0,nColRange+1)]
+
+	neighbours = numpy.maximum.reduce([
+		scannedBins(rows, (cols+1)%nColRange),
+		scannedBins(rows, (cols-1)%nColRange),
+		scannedBins((rows+1)%nRowRange, cols),
+		scannedBins((rows-1)%nRowRange, cols)])
+	# Hist2D_Ref.Integral()
+	return numpy.count_nonzero(neighbours > Eff_threshold, axis=(-2,-1)).astype(numpy.float64)
+
+def CountLowEffNonIsolated(CanvasHist2D, RowRange = [0,191], ColRange = [128,263], Eff_threshold = 0.90):
+	# The same for a single TH2
+	return float(CountLowEffNonIsolatedMaps(HistToArray(CanvasHist2D), RowRange, ColRange, Eff_threshold))
+
+# Statistics of a criterion, computed for all chips at once from the stacked
+# bin contents [chip][...] and sums [chip][sumw, sumw2, sumwx, sumwx2]
+
+def HistMean(contents, stats):
+	# TH1::GetMean
+	sumw = stats[:,0]
+	return numpy.divide(stats[:,2], sumw, out=numpy.zeros_like(sumw), where=sumw != 0)
+
+def HistStdDev(contents, stats):
+	# TH1::GetStdDev
+	sumw = stats[:,0]
+	meanx2 = numpy.divide(stats[:,3], sumw, out=numpy.zeros_like(sumw), where=sumw != 0)
+	return numpy.sqrt(numpy.abs(meanx2 - HistMean(contents, stats)**2))
+
+def DeadPixelCount(contents, stats, **options):
+	return CountLowEffNonIsolatedMaps(contents, **options)
+
+def FractionOutOfRange(contents, stats, low = -numpy.inf, high = numpy.inf):
+	# Bins outside [low, high], under- and overflow bins left out
+	inner = contents[(Ellipsis,) + (slice(1,-1),)*(contents.ndim-1)]
+	outside = (inner < low) | (inner > high)
+	return outside.reshape(len(inner), -1).mean(axis=1)
+
+Statistics = {
+	"mean"        :  HistMean,
+	"stddev"      :  HistStdDev,
+	"deadpixels"  :  DeadPixelCount,
+	"outofrange"  :  FractionOutOfRange,
+}
+
+class GradingCriterion():
+	'''
+	Score of a chip from one of its histograms, 1 - statistic/reference.
+	histogram is the plot name in the canvas name, e.g. "Threshold1D",
+	options are passed on to the statistic.
+	'''
+	def __init__(self, histogram, statistic, reference, **options):
+		self.histogram = histogram
+		self.statistic = Statistics[statistic]
+		self.reference = reference
+		self.options = options
+
+	def scores(self, histograms):
+		# HistogramData of the chips, those with the same binning evaluated together
+		scores = numpy.empty(len(histograms))
+		groups = defaultdict(lambda:[])
+		for index, hist in enumerate(histograms):
+			groups[hist.contents.shape].append(index)
+		for indices in groups.values():
+			contents = numpy.stack([histograms[index].contents for index in indices])
+			stats = numpy.stack([histograms[index].stats for index in indices])
+			scores[indices] = 1 - self.statistic(contents, stats, **self.options)/self.reference
+		return scores
+
+class GradingSpec():
+	'''
+	How a test is graded. A chip scores the lowest of its criteria, 1.0
+	without any, and passes with a score above threshold. Grades below 0
+	are reported as 0. figures are the plot names rendered for review,
+	every canvas if None.
+	'''
+	def __init__(self, threshold, criteria = [], figures = None):
+		self.threshold = threshold
+		self.criteria = criteria
+		self.figures = figures
+
+	def grade(self, canvasList):
+		grade = {}
+		passModule = {}
+		figureList = defaultdict(lambda:[])
+		# Saving histogram for future check
+		tmpDir = os.environ.get('GUI_dir')+"/Gui/.tmp"
+		if not os.path.isdir(tmpDir)  and os.environ.get('GUI_dir'):
+			try:
+				os.mkdir(tmpDir)
+				logger.info("Creating "+tmpDir)
+			except:
+				logger.warning("Failed to create "+tmpDir)
+
+		# Every histogram a criterion needs is read once, as arrays
+		needed = set([criterion.histogram for criterion in self.criteria])
+		chips = []
+		histograms = defaultdict(dict)
+		for key in canvasList.keys():
+			for CanvasName, CanvasNode in canvasList[key].items():
+				Chip_ID = CanvasName.split("_")[5].lstrip("Chip(").rstrip(")")
+				if (key, Chip_ID) not in chips:
+					chips.append((key, Chip_ID))
+				PlotName = CanvasName.split("_")[4]
+				if self.figures is None or PlotName in self.figures:
+					outputFileName = "{}_{}".format(key,CanvasName)
+					figureList[key].append(ScheduleCanvas(tmpDir,CanvasNode,outputFileName))
+				if PlotName in needed:
+					CanvasHist = CanvasNode.getHistogram(CanvasName)
+					if CanvasHist is not None:
+						histograms[PlotName][(key, Chip_ID)] = CanvasHist
+
+		scores = numpy.ones(len(chips))
+		for criterion in self.criteria:
+			found = [index for index, chip in enumerate(chips) if chip in histograms[criterion.histogram]]
+			missing = numpy.ones(len(chips), dtype=bool)
+			missing[found] = False
+			if missing.any():
+				logger.warning("No {0} histogram for chips {1}".format(criterion.histogram, [chips[index] for index in numpy.flatnonzero(missing)]))
+			criterionScores = numpy.full(len(chips), numpy.nan)
+			if found != []:
+				criterionScores[found] = criterion.scores([histograms[criterion.histogram][chips[index]] for index in found])
+			# Chips without the histogram stay NaN
+			scores = numpy.minimum(scores, criterionScores)
+
+		for (Module_ID, Chip_ID), score in zip(chips, scores):
+			if numpy.isnan(score):
+				# A histogram to grade the chip is missing
+				grade.setdefault(Module_ID, {})[Chip_ID] = -1.0
+				passModule.setdefault(Module_ID, {})[Chip_ID] = False
+			else:
+				grade.setdefault(Module_ID, {})[Chip_ID] = float(score) if score > 0.0 else 0.0
+				passModule.setdefault(Module_ID, {})[Chip_ID] = bool(score > self.threshold)
+		return grade, passModule, figureList
+
+# Plots shown for review
+OccupancyFigures = ["Occ1D","PixelAlive","ToT1D","ToT2D"]
+GainFigures = ["Gain","Intercept1D","Slope1D","InterceptLowQ1D","SlopeLowQ1D","Chi2DoF1D","Intercept2D","Slope2D","InterceptLowQ2D","SlopeLowQ2D","Chi2DoF2D"]
+
+# Tests not listed here (Physics, ClockDelay, BitErrorRate, ...) are graded with FakeSpec
+GradingSpecs = {
+	"PixelAlive"             :  GradingSpec(0.5, [GradingCriterion("PixelAlive", "deadpixels", 200)], OccupancyFigures),
+	"NoiseScan"              :  GradingSpec(0.99, [GradingCriterion("Occ1D", "mean", 1.0)], OccupancyFigures),
+	"SCurveScan"             :  GradingSpec(-0.1, [GradingCriterion("Threshold1D", "stddev", 15.0)], ["SCurves","Threshold1D","Noise1D","Threshold2D","Noise2D","ToT2D"]),
+	"GainScan"               :  GradingSpec(-0.5, figures = GainFigures),
+	"InjectionDelay"         :  GradingSpec(-0.1),
+	"GainOptimization"       :  GradingSpec(-0.5, figures = GainFigures + ["KrumCurr"]),
+	"ThresholdAdjustment"    :  GradingSpec(-0.5, figures = ["Threshold","Occ1D","PixelAlive","ToT1D","ToT2D"]),
+	"ThresholdEqualization"  :  GradingSpec(-0.5, figures = ["ThrEqualization","TDAC","Occ1D","PixelAlive","ToT1D","ToT2D"]),
+}
+FakeSpec = GradingSpec(0.5)
 
 if __name__ == "__main__":
 	ResultGrader("/Users/czkaiweb/Research/data","PixelAlive","000047")
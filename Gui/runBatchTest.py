@@ -0,0 +1,117 @@
+'''
+  runBatchTest.py
+  brief                 Command line interface for unattended module testing
+  version               0.1
+
+  Example:
+    python -m Gui.runBatchTest -t AllScan \
+        -m "fc7.board.1,RH0001,TFPX Quad,0,0" -m "fc7.board.2,RH0002,TFPX Quad,0,0"
+
+  Every FC7 board runs its modules in its own thread, boards are tested at
+  the same time.
+'''
+import os
+import sys
+import json
+import getpass
+import argparse
+import threading
+
+from Gui.GUIutils.settings import *
+from Gui.GUIutils.DBConnection import *
+from Gui.python.Firmware import QtBeBoard, QtModule
+from Gui.python.BatchTestEngine import BatchTestEngine
+from Gui.python.RenderQueue import renderQueue
+
+import logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def parseModules(moduleArgs):
+	# "board,serial,type,fmc,id" -> {board : QtBeBoard}
+	boards = {}
+	for moduleArg in moduleArgs:
+		fields = [field.strip() for field in moduleArg.split(",")]
+		if len(fields) < 3:
+			raise ValueError("Expected board,serial,type[,fmc[,id]] but got '{}'".format(moduleArg))
+		boardName, serial, moduleType = fields[0], fields[1], fields[2]
+		fmcId = fields[3] if len(fields) > 3 else "0"
+		moduleId = fields[4] if len(fields) > 4 else "0"
+		if boardName not in FirmwareList.keys():
+			raise ValueError("Unknown FC7 board {0}, known boards: {1}".format(boardName, ", ".join(FirmwareList.keys())))
+		if moduleType not in ModuleType.values():
+			raise ValueError("Unknown module type {0}, known types: {1}".format(moduleType, ", ".join(ModuleType.values())))
+		if boardName not in boards.keys():
+			board = QtBeBoard()
+			board.setBoardName(boardName)
+			board.setIPAddress(FirmwareList[boardName])
+			board.setFPGAConfig(FPGAConfigList.get(boardName, ""))
+			boards[boardName] = board
+		module = QtModule()
+		module.setModuleName(serial)
+		module.setModuleID(moduleId)
+		module.setFMCID(fmcId)
+		module.setModuleType(moduleType)
+		boards[boardName].addModule(len(boards[boardName].getAllModules()), module)
+	return boards
+
+def connectDB(args, password):
+	# One connection per board thread, connections must not be shared between threads
+	if not args.db_user:
+		return None
+	try:
+		return mysql.connector.connect(user=args.db_user, password=password, host=args.db_host, database=args.db_name)
+	except mysql.connector.Error as err:
+		logger.error("Unable to connect to {0}: {1}, results will not be uploaded".format(args.db_host, err))
+		return None
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Run Ph2_ACF tests without the GUI")
+	parser.add_argument("-t", "--test", required=True, help="Single test or composite sequence [{}]".format(" ".join(SingleTest + CompositeTest)))
+	parser.add_argument("-m", "--module", action="append", required=True, help="board,serial,type[,fmc[,id]], repeat for every module")
+	parser.add_argument("--no-resume", action="store_true", help="Ignore unfinished run journals and start from the first step")
+	parser.add_argument("--step-timeout", type=float, default=None, help="Kill a step after this many seconds")
+	parser.add_argument("--db-host", default="127.0.0.1", help="Database host. Default: 127.0.0.1")
+	parser.add_argument("--db-name", default="SampleDB", help="Database name. Default: SampleDB")
+	parser.add_argument("--db-user", default="", help="Database user, no upload without it. The password is read from PH2_ACF_GUI_DB_PASSWORD or prompted")
+	parser.add_argument("--summary", default="", help="Write the per-step results as JSON to this file")
+	args = parser.parse_args()
+
+	if args.test not in SingleTest + CompositeTest:
+		parser.error("unknown test {}".format(args.test))
+	try:
+		boards = parseModules(args.module)
+	except ValueError as err:
+		parser.error(str(err))
+	password = None
+	if args.db_user:
+		password = os.environ.get("PH2_ACF_GUI_DB_PASSWORD")
+		if password is None:
+			password = getpass.getpass("Password for {0}@{1}: ".format(args.db_user, args.db_host))
+
+	# Nobody looks at the plots of a batch run, they are not rendered
+	renderQueue.setBackgroundRendering(False)
+	engines = {}
+	threads = []
+	for boardName, board in boards.items():
+		engine = BatchTestEngine(board, args.test, connection = connectDB(args, password), username = args.db_user, resume = not args.no_resume, stepTimeout = args.step_timeout)
+		engines[boardName] = engine
+		thread = threading.Thread(target=engine.run, name=boardName)
+		thread.start()
+		threads.append(thread)
+	for thread in threads:
+		thread.join()
+
+	allPassed = True
+	summary = {}
+	for boardName, engine in engines.items():
+		summary[boardName] = engine.results
+		if not engine.completed:
+			allPassed = False
+		for result in engine.results:
+			print("{0:<16} {1:<24} {2:<8} {3:>10.1f} s  {4}".format(boardName, result["test"], "passed" if result["passed"] else "FAILED", result["timing"]["total"], result["output_dir"]))
+			allPassed = allPassed and result["passed"]
+	if args.summary:
+		with open(args.summary, 'w') as summaryFile:
+			json.dump(summary, summaryFile, indent=2)
+	sys.exit(0 if allPassed else 1)